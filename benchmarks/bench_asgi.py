@@ -0,0 +1,99 @@
+"""
+Measures the throughput of the ASGI map API under concurrent clients.
+
+The app is called in-process through the ASGI interface, so the numbers cover the app (routing, handlers,
+middleware, serialization and the thread pool hops of database reads) and not the HTTP server. For each path,
+`--concurrency` clients send requests back to back for `--duration` seconds; `/api/alerts` reads `--alerts`
+notifications from the in-memory stand-in.
+
+Usage:
+    python -m benchmarks.bench_asgi [--concurrency 50] [--duration 2] [--alerts 5000]
+"""
+import argparse
+import asyncio
+import time
+from typing import Any
+
+from benchmarks import bench_parsing
+from benchmarks.run_suite import BenchmarkEnvironment, percentiles
+
+PATHS = ("/api/detected_points", "/map", "/metrics", "/api/alerts?limit=100", "/api/alerts?format=ndjson")
+
+
+async def asgi_get(app, target: str) -> tuple[int, int]:
+    """Sends a GET request for `target` to `app`; returns the response status and body size."""
+    path, _, query = target.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+             "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80)}
+    response_done = asyncio.Event()
+    request_sent = False
+    status, size = 0, 0
+
+    async def receive() -> dict:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Streaming responses listen for a disconnect until they are done
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return status, size
+
+
+async def load_path(app, target: str, concurrency: int, duration_sec: float) -> dict[str, Any]:
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration_sec
+
+    async def client() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await asgi_get(app, target)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"{target} returned {status}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"requests_per_sec": len(latencies) / elapsed,
+            "latency_ms": {key: value * 1000 for key, value in percentiles(latencies).items()}}
+
+
+def run(concurrency: int = 50, duration_sec: float = 2.0, alerts_count: int = 5000) -> dict[str, Any]:
+    from red_alerts_listener.backend.asgi import app
+
+    env = BenchmarkEnvironment()
+    try:
+        raw_handler, _, _ = env.build_handlers()
+        for alert in bench_parsing.build_sample_alerts(alerts_count):
+            raw_handler.adapter.insert_one(raw_handler.collection, alert)
+        app.state.raw_alerts_handler = raw_handler
+        return {target: asyncio.run(load_path(app, target, concurrency, duration_sec)) for target in PATHS}
+    finally:
+        app.state.raw_alerts_handler = None
+        env.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients per path")
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds of load per path")
+    parser.add_argument("--alerts", type=int, default=5000, help="Stored notifications read by /api/alerts")
+    args = parser.parse_args()
+
+    for path_name, result in run(args.concurrency, args.duration, args.alerts).items():
+        latency = result["latency_ms"]
+        print(f"{path_name}: {result['requests_per_sec']:.0f} requests/s, "
+              f"p50={latency['p50']:.1f}ms p99={latency['p99']:.1f}ms")
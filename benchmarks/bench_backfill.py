@@ -0,0 +1,55 @@
+"""
+Runs the history backfill against the local stand-ins and reports its throughput.
+
+The older half of the history is stored before the run, so the backfill fills the gap up to now.
+
+Usage:
+    python -m benchmarks.bench_backfill [--alerts 5000] [--page-size 50] [--workers 4] [--rate 50]
+"""
+import argparse
+import time
+
+from benchmarks import bench_parsing
+from benchmarks.run_suite import BenchmarkEnvironment
+from benchmarks.standins import FakeTzevaadomServer
+from red_alerts_listener.backend.backfill import HistoryBackfiller
+
+
+def run(alerts_count: int = 5000, page_size: int = 50, max_workers: int = 4,
+        requests_per_sec: float = 50.0) -> dict[str, float]:
+    env = BenchmarkEnvironment()
+    history = list(reversed(bench_parsing.build_sample_alerts(alerts_count)))  # newest first
+    try:
+        raw_handler, parsed_handler, locations_handler = env.build_handlers()
+        env.seed_locations(locations_handler, [history])
+        for alert in history[len(history) // 2:]:
+            raw_handler.adapter.insert_one(raw_handler.collection, dict(alert))
+
+        with FakeTzevaadomServer([[]], history=history, history_page_size=page_size) as server:
+            backfiller = HistoryBackfiller(raw_handler, parsed_handler, locations_handler, url=server.history_url,
+                                           max_workers=max_workers, requests_per_sec=requests_per_sec,
+                                           max_pages=alerts_count // page_size + max_workers)
+            start = time.perf_counter()
+            result = backfiller.backfill_gap()
+            elapsed = time.perf_counter() - start
+            pages = len(server.history_pages_served)
+
+        expected = alerts_count // 2
+        if len(result.raw_ids) != expected:
+            raise RuntimeError(f"Expected {expected} new raw alerts, backfill inserted {len(result.raw_ids)}")
+        return {"alerts_fetched": result.fetched, "raw_added": len(result.raw_ids), "pages": pages,
+                "seconds": elapsed, "alerts_per_sec": result.fetched / elapsed}
+    finally:
+        env.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=50.0, help="Requests per second allowed to the endpoint")
+    args = parser.parse_args()
+
+    for name, value in run(args.alerts, args.page_size, args.workers, args.rate).items():
+        print(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
@@ -0,0 +1,186 @@
+"""
+Measures how well the offline gazetteer resolves alert cities, and how cheaply.
+
+Every locality of the gazetteer file is looked up in spelling variants typical of alert city names:
+
+* exact: the name as is,
+* area: the name with an area suffix, e.g. "אשקלון - דרום",
+* defective: the name without its first inner vav or yod,
+* punctuation: hyphens and spaces swapped,
+* typo: one letter doubled.
+
+For each variant kind it reports the share resolved, the share resolved to the right locality, and the lookup time.
+
+Names missing from the file must miss rather than resolve to a similar locality, so a sample of the localities is
+also looked up by name in a gazetteer built without them. A match to another area of the same city (e.g. "הרצליה"
+to "הרצליה - פיתוח") is counted apart; a match to any other locality is a false positive.
+
+With `--stored`, it also reports the coverage of the cities of the notifications stored in the configured MongoDB
+(archived ones included): the share of distinct cities, and of city occurrences, resolved without the online
+geocoder, by lookup step, and the most frequent misses.
+
+Usage:
+    python -m benchmarks.bench_gazetteer [--path red_alerts_listener/backend/data/gazetteer.csv] [--threshold 0.7]
+                                         [--margin 0.1] [--unknown-cases 200] [--stored] [--db-name NAME]
+"""
+import argparse
+import csv
+import os
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from DEFINITIONS import ROOT_DIR
+from red_alerts_listener.backend.gazetteer import ALIAS_SEPARATOR, Gazetteer, normalize, strip_area
+
+
+def _defective(name: str) -> Optional[str]:
+    for i in range(1, len(name) - 1):
+        if name[i] in "וי":
+            return name[:i] + name[i + 1:]
+    return None
+
+
+def _punctuation(name: str) -> Optional[str]:
+    if "-" in name:
+        return name.replace("-", " ")
+    if " " in name:
+        return name.replace(" ", "-", 1)
+    return None
+
+
+def _typo(name: str) -> Optional[str]:
+    middle = len(name) // 2
+    return name[:middle] + name[middle] + name[middle:] if len(name) > 3 else None
+
+
+VARIANTS: dict[str, Callable[[str], Optional[str]]] = {
+    "exact": lambda name: name,
+    "area": lambda name: f"{name} - צפון",
+    "defective": _defective,
+    "punctuation": _punctuation,
+    "typo": _typo,
+}
+
+
+def _city(name: str) -> str:
+    return normalize(strip_area(name))
+
+
+def load_localities(path: str) -> list[tuple[str, float, float, list[str]]]:
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        return [(row["name"], float(row["lat"]), float(row["lon"]),
+                 [alias for alias in (row.get("aliases") or "").split(ALIAS_SEPARATOR) if alias])
+                for row in csv.DictReader(file)]
+
+
+def false_positives(localities: list[tuple[str, float, float, list[str]]], threshold: float, margin: float,
+                    cases: int = 200) -> dict[str, Any]:
+    """Looks an evenly spread sample of the localities up in a gazetteer without them."""
+    step = max(1, len(localities) // cases)
+    same_city, matched = 0, []
+    for i in range(0, len(localities), step):
+        name = localities[i][0]
+        match = Gazetteer(localities[:i] + localities[i + 1:], threshold, margin).lookup(name)
+        if match is not None and _city(match.name) == _city(name):
+            same_city += 1
+        elif match is not None:
+            matched.append((name, match.name))
+    sampled = len(range(0, len(localities), step))
+    return {"cases": sampled, "same_city": same_city / sampled, "false_positives": len(matched) / sampled,
+            "examples": matched[:5]}
+
+
+def stored_cities(db_name: Optional[str] = None) -> Counter:
+    """Counts the cities of the stored notifications."""
+    from red_alerts_listener.backend.database_collection_handlers import RawAlertsLocationHandler
+
+    handler = RawAlertsLocationHandler(db_name=db_name)
+    try:
+        return Counter(city for notification in handler.iter_notifications()
+                       for city in notification.get("cities") or ())
+    finally:
+        handler.adapter.close_connection()
+
+
+def coverage(gazetteer: Gazetteer, cities: Counter, misses: int = 10) -> dict[str, Any]:
+    """The share of `cities` (city -> occurrences) the gazetteer resolves, by lookup step."""
+    methods: Counter = Counter()
+    missed: Counter = Counter()
+    for city, occurrences in cities.items():
+        match = gazetteer.lookup(city)
+        if match is None:
+            missed[city] = occurrences
+        else:
+            methods[match.method] += 1
+    total = sum(cities.values()) or 1
+    return {"cities": len(cities), "resolved": sum(methods.values()) / (len(cities) or 1),
+            "occurrences_resolved": 1 - sum(missed.values()) / total,
+            "methods": {method: count / len(cities) for method, count in methods.most_common()},
+            "misses": missed.most_common(misses)}
+
+
+def run(path: str, threshold: float, margin: float, unknown_cases: int = 200,
+        cities: Optional[Counter] = None) -> dict[str, Any]:
+    localities = load_localities(path)
+    names = [name for name, *_ in localities]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    gazetteer = Gazetteer.from_csv(path, threshold, margin)
+    load_ms = (time.perf_counter() - start) * 1000
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    results: dict[str, Any] = {"localities": len(gazetteer), "load_ms": load_ms, "index_bytes": index_bytes}
+    for kind, make_variant in VARIANTS.items():
+        variants = [(name, make_variant(name)) for name in names]
+        cases = [(name, variant) for name, variant in variants if variant and (variant != name or kind == "exact")]
+        resolved = correct = 0
+        start = time.perf_counter()
+        for name, variant in cases:
+            match = gazetteer.lookup(variant)
+            resolved += match is not None
+            correct += match is not None and match.name == name
+        elapsed = time.perf_counter() - start
+        results[kind] = {"cases": len(cases), "resolved": resolved / len(cases), "correct": correct / len(cases),
+                         "lookup_us": elapsed / len(cases) * 1e6}
+    results["unknown"] = false_positives(localities, threshold, margin, unknown_cases)
+    if cities is not None:
+        results["stored"] = coverage(gazetteer, cities)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=os.path.join(ROOT_DIR, "red_alerts_listener/backend/data/gazetteer.csv"))
+    parser.add_argument("--threshold", type=float, default=0.7, help="Minimum similarity of fuzzy matches")
+    parser.add_argument("--margin", type=float, default=0.1,
+                        help="Minimum similarity lead of a fuzzy match over the next locality")
+    parser.add_argument("--unknown-cases", type=int, default=200,
+                        help="Localities looked up in a gazetteer without them")
+    parser.add_argument("--stored", action="store_true",
+                        help="Also report the coverage of the cities of the stored notifications")
+    parser.add_argument("--db-name", default=None, help="Database of the stored notifications (default: config.yaml)")
+    args = parser.parse_args()
+
+    report = run(args.path, args.threshold, args.margin, args.unknown_cases,
+                 stored_cities(args.db_name) if args.stored else None)
+    print(f"{report['localities']} localities loaded in {report['load_ms']:.1f}ms, "
+          f"index {report['index_bytes'] / 1024:.0f}KB")
+    for variant_kind in VARIANTS:
+        result = report[variant_kind]
+        print(f"{variant_kind}: {result['cases']} cases, resolved {result['resolved']:.1%}, "
+              f"correct {result['correct']:.1%}, {result['lookup_us']:.1f}us per lookup")
+    unknown = report["unknown"]
+    print(f"unknown: {unknown['cases']} cases, same city {unknown['same_city']:.1%}, "
+          f"false positives {unknown['false_positives']:.1%}"
+          + "".join(f", {name} -> {match}" for name, match in unknown["examples"]))
+    if "stored" in report:
+        stored = report["stored"]
+        print(f"stored: {stored['cities']} cities, resolved {stored['resolved']:.1%} "
+              f"({stored['occurrences_resolved']:.1%} of occurrences); "
+              + ", ".join(f"{method} {share:.1%}" for method, share in stored["methods"].items()))
+        if stored["misses"]:
+            print("missed: " + ", ".join(f"{city} ({count})" for city, count in stored["misses"]))
@@ -0,0 +1,72 @@
+"""
+Measures the parse-to-document cost per alert for the pydantic path and the fast path.
+
+Usage:
+    python -m benchmarks.bench_parsing [--alerts 2000] [--repeat 5]
+"""
+import argparse
+import time
+import uuid
+
+from red_alerts_listener.backend.fast_parser import parse_notification_fast
+from red_alerts_listener.backend.object_builders import ParsedNotificationBuilder
+from red_alerts_listener.backend.schemas import RedAlertNotification
+
+SAMPLE_CITIES = ["כרמיאל", "שדרות", "אשקלון - דרום", "נתיבות", "קריית שמונה", "מטולה"]
+
+
+def build_sample_alerts(count: int) -> list[dict]:
+    return [
+        {
+            "notificationId": str(uuid.uuid4()),
+            "time": 1700000000 + i,
+            "threat": i % 2 * 5,
+            "isDrill": False,
+            "cities": SAMPLE_CITIES[:1 + i % len(SAMPLE_CITIES)],
+        }
+        for i in range(count)
+    ]
+
+
+def pydantic_path(alert: dict) -> tuple[dict, dict]:
+    notification = RedAlertNotification.parse_obj(alert)
+    saved = ParsedNotificationBuilder.build_from_raw_notification(notification)
+    return notification.dict(), saved.dict()
+
+
+def fast_path(alert: dict) -> tuple[dict, dict]:
+    notification = parse_notification_fast(alert)
+    return notification.dict(), ParsedNotificationBuilder.build_document_from_raw(notification)
+
+
+def time_per_alert(func, alerts: list[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for alert in alerts:
+            func(alert)
+        best = min(best, time.perf_counter() - start)
+    return best / len(alerts)
+
+
+def run(alerts_count: int = 2000, repeat: int = 5) -> dict[str, float]:
+    alerts = build_sample_alerts(alerts_count)
+    # Warm up caches (machine info, timezone) so both paths are measured in steady state
+    pydantic_path(alerts[0])
+    fast_path(alerts[0])
+    results = {
+        "pydantic_us_per_alert": time_per_alert(pydantic_path, alerts, repeat) * 1e6,
+        "fast_us_per_alert": time_per_alert(fast_path, alerts, repeat) * 1e6,
+    }
+    results["speedup"] = results["pydantic_us_per_alert"] / results["fast_us_per_alert"]
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, value in run(args.alerts, args.repeat).items():
+        print(f"{name}: {value:.2f}")
@@ -0,0 +1,78 @@
+"""
+Compares alert detection latency of the polling strategies against a stand-in API with tail latency.
+
+* fixed_sleep: sleep a fixed interval after every request (the previous behaviour).
+* deadline: polls issued on a fixed clock.
+* deadline_hedged: polls issued on a fixed clock, with a hedged duplicate for slow requests.
+
+Detection latency is the time between an alert being published by the stand-in and the first poll returning it.
+
+Usage:
+    python -m benchmarks.bench_polling [--payloads 100] [--rate 5] [--interval 0.25] [--slow-ratio 0.1] [--slow-delay 1]
+"""
+import argparse
+import time
+from typing import Any
+
+from benchmarks import bench_parsing
+from benchmarks.run_suite import BenchmarkEnvironment, percentiles
+from benchmarks.standins import FakeTzevaadomServer
+from red_alerts_listener.backend.listening_handlers import RedAlertNotificationsListener
+
+STRATEGIES = ("fixed_sleep", "deadline", "deadline_hedged")
+
+
+def run_strategy(strategy: str, payloads: list[list[dict]], rate: float, interval_in_sec: float,
+                 slow_ratio: float, slow_delay_sec: float) -> dict[str, Any]:
+    env = BenchmarkEnvironment()
+    try:
+        handlers = env.build_handlers()
+        detected_at: dict[str, float] = {}
+        with FakeTzevaadomServer(payloads, rate=rate, slow_request_ratio=slow_ratio,
+                                 slow_request_delay_sec=slow_delay_sec) as server:
+            listener = RedAlertNotificationsListener(*handlers, interval_in_sec=interval_in_sec, url=server.url,
+                                                     hedge=strategy == "deadline_hedged")
+            deadline = time.perf_counter() + server.duration
+            while time.perf_counter() < deadline:
+                alerts = listener._get_red_alert_notifications() or []
+                now = time.perf_counter()
+                for alert in alerts:
+                    detected_at.setdefault(alert["notificationId"], now)
+                time.sleep(interval_in_sec if strategy == "fixed_sleep" else listener._seconds_until_next_poll())
+            latencies = [detected_at[key] - server.publish_times[key] for key in detected_at]
+            request_times = sorted(server.request_times)
+            requests_served = server.requests_served
+        periods = [later - earlier for earlier, later in zip(request_times, request_times[1:])]
+        return {
+            "alerts_detected": len(detected_at),
+            "requests": requests_served,
+            "mean_poll_period_ms": sum(periods) / len(periods) * 1000 if periods else None,
+            "detection_latency_ms": {key: value * 1000 if value is not None else None
+                                     for key, value in percentiles(latencies).items()},
+        }
+    finally:
+        env.cleanup()
+
+
+def run(payloads_count: int = 100, rate: float = 5.0, interval_in_sec: float = 0.25, slow_ratio: float = 0.1,
+        slow_delay_sec: float = 1.0) -> dict[str, dict[str, Any]]:
+    alerts = bench_parsing.build_sample_alerts(payloads_count)
+    payloads = [[alert] for alert in alerts]
+    return {strategy: run_strategy(strategy, payloads, rate, interval_in_sec, slow_ratio, slow_delay_sec)
+            for strategy in STRATEGIES}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=5.0, help="Payloads published per second")
+    parser.add_argument("--interval", type=float, default=0.25, help="Poll interval in seconds")
+    parser.add_argument("--slow-ratio", type=float, default=0.1, help="Share of requests the stand-in delays")
+    parser.add_argument("--slow-delay", type=float, default=1.0, help="Delay of slow requests in seconds")
+    args = parser.parse_args()
+
+    for strategy, result in run(args.payloads, args.rate, args.interval, args.slow_ratio, args.slow_delay).items():
+        latency = ", ".join(f"{key}={value:.0f}ms" for key, value in result["detection_latency_ms"].items()
+                            if value is not None)
+        print(f"{strategy}: {result['alerts_detected']} alerts, {result['requests']} requests, "
+              f"mean period {result['mean_poll_period_ms']:.0f}ms, detection latency {latency}")
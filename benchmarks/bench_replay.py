@@ -0,0 +1,71 @@
+"""
+Measures ingestion throughput and ingest latency while replaying a barrage through the listener pipeline.
+
+`--alerts` synthetic notifications are spread over `--span` recorded seconds and replayed (see
+`red_alerts_listener.backend.replay`) at each of `--speeds` through a PipelineSupervisor and its worker processes.
+At 1000x, a recorded hour of alerts arrives in under four seconds.
+
+The workers are separate processes, which cannot share the in-process stand-in, so the replay writes to the
+MongoDB of config.yaml, into a throwaway database that is dropped afterwards. Every city of the barrage gets a
+location up front, so geocoding never reaches the network.
+
+Usage:
+    python -m benchmarks.bench_replay [--alerts 5000] [--span 3600] [--speeds 100 1000] [--interval 0.1]
+                                      [--persist-workers 2]
+"""
+import argparse
+import uuid
+from typing import Any, Optional
+
+from benchmarks import bench_parsing
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.mongo_adapter import MongoDBAdapter
+from red_alerts_listener.backend.replay import replay
+
+
+def build_recording(alerts_count: int, span_sec: int, start: int = 1700000000) -> list[dict]:
+    alerts = bench_parsing.build_sample_alerts(alerts_count)
+    for i, alert in enumerate(alerts):
+        alert["time"] = start + i * span_sec // alerts_count
+    return alerts
+
+
+def run(alerts_count: int = 5000, span_sec: int = 3600, speeds: tuple[float, ...] = (100, 1000),
+        interval_in_sec: float = 0.1, persist_workers: Optional[int] = None) -> dict[float, dict[str, Any]]:
+    recording = build_recording(alerts_count, span_sec)
+    cities = {city for alert in recording for city in alert["cities"]}
+    uri = MongoDBAdapter.build_connection_uri(host=config.mongodb.host, port=config.mongodb.port)
+    results = {}
+    for speed in speeds:
+        db_name = f"bench_replay_{uuid.uuid4().hex[:12]}"
+        adapter = MongoDBAdapter(uri, db_name)
+        try:
+            adapter.insert_many(config.mongodb.locations_collection,
+                                [{"location": city, "lon": 35.0, "lat": 32.0} for city in cities])
+            result = replay(recording, db_name, speed=speed, interval_in_sec=interval_in_sec,
+                            persist_workers=persist_workers)
+            results[speed] = {"stored": result.stored, "polls": result.polls,
+                              "alerts_per_sec": result.alerts_per_sec,
+                              "ingest_latency_sec": result.ingest_latency_sec}
+        finally:
+            adapter.client.drop_database(db_name)
+            adapter.close_connection()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=5000)
+    parser.add_argument("--span", type=int, default=3600, help="Recorded seconds the alerts are spread over")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[100, 1000])
+    parser.add_argument("--interval", type=float, default=0.1, help="Poll interval in seconds")
+    parser.add_argument("--persist-workers", type=int, default=None,
+                        help="Persist worker processes (default: pipeline.persist_workers)")
+    args = parser.parse_args()
+
+    for replay_speed, result in run(args.alerts, args.span, tuple(args.speeds), args.interval,
+                                    args.persist_workers).items():
+        latency = ", ".join(f"{name}={value:.2f}s" for name, value in result["ingest_latency_sec"].items()
+                            if value is not None)
+        print(f"{replay_speed:g}x: {result['stored']}/{args.alerts} stored, {result['alerts_per_sec']:.0f} alerts/s "
+              f"over {result['polls']} polls, ingest latency {latency or 'n/a'}")
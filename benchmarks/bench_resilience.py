@@ -0,0 +1,78 @@
+"""
+Measures how much a failing dependency stretches end-to-end ingest latency, with and without circuit breaking.
+
+Alerts arrive every `--interval-ms` and are ingested one after the other, each calling a simulated geocoder that is down: every call fails after
+`--failure-ms`. Two policies are compared, on the same (scaled down) backoff:
+
+* retry: retries with backoff only, the previous behaviour of the geocoder,
+* breaker: the same retries within a retry budget, behind a circuit breaker that opens after a few failures.
+
+For each it reports the per-alert latency percentiles and how many calls reached the geocoder.
+
+Usage:
+    python -m benchmarks.bench_resilience [--alerts 300] [--interval-ms 10] [--failure-ms 20]
+                                          [--base-delay-ms 10]
+"""
+import argparse
+import time
+from typing import Any
+
+from red_alerts_listener.backend.config_reader import DependencyPolicy
+from red_alerts_listener.backend.polling import percentile
+from red_alerts_listener.backend.resilience import CircuitOpenError, Dependency
+
+
+class DownDependency:
+    def __init__(self, failure_sec: float):
+        self.failure_sec = failure_sec
+        self.calls = 0
+
+    def __call__(self, city: str) -> dict:
+        self.calls += 1
+        time.sleep(self.failure_sec)
+        raise ConnectionError(f"geocoder is down, could not resolve {city}")
+
+
+def run_policy(policy: DependencyPolicy, alerts: int, interval_sec: float, failure_sec: float) -> dict[str, Any]:
+    geocoder = DownDependency(failure_sec)
+    dependency = Dependency("bench_geocoder", policy, transient_errors=(ConnectionError,))
+    latencies_ms = []
+    start = time.perf_counter()
+    for i in range(alerts):
+        # Latency counts from the alert's arrival, so time spent queued behind a slow alert is included
+        arrival = start + i * interval_sec
+        time.sleep(max(0.0, arrival - time.perf_counter()))
+        try:
+            dependency.call(geocoder, f"city-{i}")
+        except (ConnectionError, CircuitOpenError):
+            pass  # the alert is stored without coordinates either way
+        latencies_ms.append((time.perf_counter() - arrival) * 1000)
+    elapsed = time.perf_counter() - start
+    return {"latency_ms": {f"p{point}": percentile(latencies_ms, point) for point in (50, 90, 99)},
+            "alerts_per_sec": alerts / elapsed, "dependency_calls": geocoder.calls}
+
+
+def run(alerts: int, interval_ms: float, failure_ms: float, base_delay_ms: float) -> dict[str, Any]:
+    backoff = dict(max_attempts=5, base_delay_sec=base_delay_ms / 1000, max_delay_sec=base_delay_ms * 16 / 1000,
+                   deadline_sec=0)
+    policies = {
+        "retry": DependencyPolicy(**backoff, failure_threshold=alerts * 10, retry_budget_ratio=10,
+                                  retry_budget_min_per_sec=1e9),
+        "breaker": DependencyPolicy(**backoff, failure_threshold=5, reset_timeout_sec=base_delay_ms * 10 / 1000,
+                                    retry_budget_ratio=0.2, retry_budget_min_per_sec=1),
+    }
+    return {name: run_policy(policy, alerts, interval_ms / 1000, failure_ms / 1000) for name, policy in policies.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=300)
+    parser.add_argument("--interval-ms", type=float, default=10, help="Time between arriving alerts")
+    parser.add_argument("--failure-ms", type=float, default=20, help="How long each failing call takes")
+    parser.add_argument("--base-delay-ms", type=float, default=10, help="Backoff before the first retry")
+    args = parser.parse_args()
+
+    for policy_name, result in run(args.alerts, args.interval_ms, args.failure_ms, args.base_delay_ms).items():
+        latency = result["latency_ms"]
+        print(f"{policy_name}: p50={latency['p50']:.1f}ms p99={latency['p99']:.1f}ms, "
+              f"{result['alerts_per_sec']:.0f} alerts/s, {result['dependency_calls']} calls to the dependency")
@@ -0,0 +1,110 @@
+"""
+Compares the standard and the time-series storage of raw notifications.
+
+Both layouts are loaded with the same alerts (through RawAlertsLocationHandler) and measured for:
+
+* storage: data, on-disk and index size (`collStats`),
+* find_by_range: latency of `find_notification_by_datetime_range` over windows of the given length,
+* iter_notifications: latency of a time-ordered page of the same windows, as served by /api/alerts,
+
+and the standard collection is finally migrated to the time-series storage to time the migration.
+
+Storage sizes are only meaningful against a real server (MongoDB 6.0+): the in-memory stand-in does not compress.
+
+Usage:
+    python -m benchmarks.bench_storage [--alerts 50000] [--spacing 60] [--window 86400] [--queries 200]
+                                       [--mongo-host localhost] [--mongo-port 27017]
+"""
+import argparse
+import random
+import time
+from typing import Any, Optional
+
+from benchmarks import bench_parsing
+from benchmarks.run_suite import BenchmarkEnvironment, percentiles
+from red_alerts_listener.backend.database_collection_handlers import RawAlertsLocationHandler, \
+    STANDARD_STORAGE, TIME_SERIES_STORAGE
+from red_alerts_listener.backend.fast_parser import parse_notifications
+from red_alerts_listener.backend.storage_migration import RawNotificationsStorageMigration
+
+FIRST_TIME = 1700000000
+
+
+def build_alerts(count: int, spacing_sec: int) -> list[dict]:
+    alerts = bench_parsing.build_sample_alerts(count)
+    for i, alert in enumerate(alerts):
+        alert["time"] = FIRST_TIME + i * spacing_sec
+    return alerts
+
+
+def load(handler: RawAlertsLocationHandler, alerts: list[dict], batch_size: int = 1000) -> float:
+    start = time.perf_counter()
+    for first in range(0, len(alerts), batch_size):
+        handler.add_multiple_new_notifications(parse_notifications(alerts[first:first + batch_size]))
+    return time.perf_counter() - start
+
+
+def query_latencies_ms(handler: RawAlertsLocationHandler, window_starts: list[int],
+                       window_sec: int) -> dict[str, dict[str, Optional[float]]]:
+    by_range, pages = [], []
+    for window_start in window_starts:
+        start = time.perf_counter()
+        handler.find_notification_by_datetime_range(window_start, window_start + window_sec)
+        by_range.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        list(handler.iter_notifications(start=window_start, end=window_start + window_sec, limit=100))
+        pages.append((time.perf_counter() - start) * 1000)
+    return {"find_by_range_ms": percentiles(by_range), "iter_notifications_ms": percentiles(pages)}
+
+
+def run(alerts_count: int, spacing_sec: int, window_sec: int, queries: int,
+        mongo_host: Optional[str] = None, mongo_port: int = 27017) -> dict[str, Any]:
+    env = BenchmarkEnvironment(mongo_host, mongo_port)
+    alerts = build_alerts(alerts_count, spacing_sec)
+    last_start = max(FIRST_TIME, alerts[-1]["time"] - window_sec)
+    rng = random.Random(0)
+    window_starts = [rng.randrange(FIRST_TIME, last_start + 1) for _ in range(queries)]
+    results, handlers = {}, {}
+    try:
+        for storage in (STANDARD_STORAGE, TIME_SERIES_STORAGE):
+            handler = RawAlertsLocationHandler(adapter=env.adapter_class, host=env.host, port=env.port,
+                                               db_name=env.new_db_name(), collection="raw_notifications",
+                                               storage=storage)
+            handlers[storage] = handler
+            handler.ensure_query_indexes()
+            load_seconds = load(handler, alerts)
+            stats = handler.adapter.collection_stats(handler.collection)
+            results[storage] = {
+                "insert_alerts_per_sec": len(alerts) / load_seconds,
+                "data_bytes": stats.get("size"),
+                "storage_bytes": stats.get("storageSize"),
+                "index_bytes": stats.get("totalIndexSize"),
+                **query_latencies_ms(handler, window_starts, window_sec),
+            }
+        migration = RawNotificationsStorageMigration(handlers[STANDARD_STORAGE])
+        results["migration_alerts_per_sec"] = len(alerts) / migration.migrate(TIME_SERIES_STORAGE).seconds
+    finally:
+        env.cleanup()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=50000)
+    parser.add_argument("--spacing", type=int, default=60, help="Seconds between consecutive alerts")
+    parser.add_argument("--window", type=int, default=86400, help="Length of each queried range in seconds")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--mongo-host", help="Benchmark against a local mongod instead of the in-memory stand-in")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    args = parser.parse_args()
+
+    results = run(args.alerts, args.spacing, args.window, args.queries, args.mongo_host, args.mongo_port)
+    for storage_name in (STANDARD_STORAGE, TIME_SERIES_STORAGE):
+        result = results[storage_name]
+        by_range = result["find_by_range_ms"]
+        pages = result["iter_notifications_ms"]
+        print(f"{storage_name}: {result['insert_alerts_per_sec']:.0f} inserts/s, storage {result['storage_bytes']} "
+              f"bytes (data {result['data_bytes']}, indexes {result['index_bytes']}), find_by_range "
+              f"p50={by_range['p50']:.2f}ms p99={by_range['p99']:.2f}ms, page p50={pages['p50']:.2f}ms "
+              f"p99={pages['p99']:.2f}ms")
+    print(f"migration: {results['migration_alerts_per_sec']:.0f} alerts/s")
@@ -0,0 +1,147 @@
+"""
+Measures alert fan-out to webhook subscribers.
+
+Subscribers are spread over the gazetteer's localities: most subscribe to a few cities, the rest to a radius
+around a locality. Each subscriber has its own webhook path on one of `--sinks` local HTTP sinks.
+
+* matching: the cost per alert of SubscriptionIndex against scanning every subscription (which must agree),
+* delivery: alerts are published at `--rate` per second through AlertFanout, and the sinks report how many
+  arrived, in how many requests, and the latency from publishing to receipt.
+
+Usage:
+    python -m benchmarks.bench_subscriptions [--subscribers 5000] [--alerts 500] [--rate 100]
+                                             [--cities-per-alert 30] [--sinks 4] [--failure-ratio 0]
+"""
+import argparse
+import csv
+import os
+import random
+import time
+from contextlib import ExitStack
+from typing import Any
+
+from DEFINITIONS import ROOT_DIR
+from benchmarks.standins import InMemoryMongoDBAdapter, WebhookSink
+from red_alerts_listener.backend import gazetteer
+from red_alerts_listener.backend.fast_parser import FastRedAlertNotification
+from red_alerts_listener.backend.polling import percentile
+from red_alerts_listener.backend.subscriptions import AlertFanout, Subscription, SubscriptionRegistry, \
+    WebhookDispatcher, haversine_km
+
+AREAS = ("", "", " - צפון", " - דרום", " - מערב")
+
+
+def load_localities() -> list[tuple[str, float, float]]:
+    path = os.path.join(ROOT_DIR, "red_alerts_listener/backend/data/gazetteer.csv")
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        return [(row["name"], float(row["lat"]), float(row["lon"])) for row in csv.DictReader(file)]
+
+
+def build_subscriptions(count: int, sink_urls: list[str], localities: list[tuple[str, float, float]],
+                        rng: random.Random) -> list[Subscription]:
+    subscriptions = []
+    for i in range(count):
+        url = f"{sink_urls[i % len(sink_urls)]}/subscribers/{i}"
+        if rng.random() < 0.8:
+            cities = [name for name, _, _ in rng.sample(localities, rng.randint(1, 5))]
+            subscriptions.append(Subscription(url, cities))
+        else:
+            _, lat, lon = rng.choice(localities)
+            subscriptions.append(Subscription(url, lat=lat, lon=lon, radius_km=rng.uniform(5, 30)))
+    return subscriptions
+
+
+def build_alerts(count: int, cities_per_alert: int, localities: list[tuple[str, float, float]],
+                 rng: random.Random) -> list[FastRedAlertNotification]:
+    return [FastRedAlertNotification(f"bench-{i}", 1700000000 + i, 0, False,
+                                     [name + rng.choice(AREAS) for name, _, _ in
+                                      rng.sample(localities, rng.randint(1, cities_per_alert))])
+            for i in range(count)]
+
+
+def scan_match(subscriptions: list[Subscription], cities: list[str], coordinates) -> dict[int, list[str]]:
+    """The reference: every subscription checked against every city."""
+    matches: dict[int, list[str]] = {}
+    subscribed = [{gazetteer.normalize(city) for city in subscription.cities} for subscription in subscriptions]
+    for city in cities:
+        forms = {gazetteer.normalize(city), gazetteer.normalize(gazetteer.strip_area(city))}
+        point = coordinates(city)
+        for number, subscription in enumerate(subscriptions):
+            if forms & subscribed[number] or (subscription.is_geo and point and haversine_km(
+                    subscription.lat, subscription.lon, *point) <= subscription.radius_km):
+                matches.setdefault(number, []).append(city)
+    return matches
+
+
+def bench_matching(fanout: AlertFanout, alerts: list[FastRedAlertNotification], scan_alerts: int) -> dict[str, Any]:
+    index = fanout.index
+    start = time.perf_counter()
+    indexed = [index.match(alert.cities, fanout.city_coordinates) for alert in alerts]
+    index_us = (time.perf_counter() - start) / len(alerts) * 1e6
+    start = time.perf_counter()
+    scanned = [scan_match(index.subscriptions, alert.cities, fanout.city_coordinates) for alert in alerts[:scan_alerts]]
+    scan_us = (time.perf_counter() - start) / len(scanned) * 1e6
+    agree = all(indexed[i] == scanned[i] for i in range(len(scanned)))
+    return {"index_us": index_us, "scan_us": scan_us, "agree": agree,
+            "matches_per_alert": sum(len(matches) for matches in indexed) / len(alerts)}
+
+
+def run(subscribers: int, alerts_count: int, rate: float, cities_per_alert: int, sinks_count: int,
+        failure_ratio: float) -> dict[str, Any]:
+    rng = random.Random(0)
+    localities = load_localities()
+    InMemoryMongoDBAdapter.reset()
+    with ExitStack() as stack:
+        sinks = [stack.enter_context(WebhookSink(failure_ratio=failure_ratio, seed=i)) for i in range(sinks_count)]
+        registry = SubscriptionRegistry(adapter=InMemoryMongoDBAdapter, db_name="bench_subscriptions")
+        for subscription in build_subscriptions(subscribers, [sink.url for sink in sinks], localities, rng):
+            registry.add(subscription)
+        fanout = AlertFanout(registry, WebhookDispatcher(), refresh_interval_sec=3600).start()
+        try:
+            alerts = build_alerts(alerts_count, cities_per_alert, localities, rng)
+            results = {"matching": bench_matching(fanout, alerts, scan_alerts=min(20, alerts_count))}
+
+            published_at, queued = {}, 0
+            start = time.perf_counter()
+            for i, alert in enumerate(alerts):
+                time.sleep(max(0.0, start + i / rate - time.perf_counter()))
+                published_at[alert.notificationId] = time.perf_counter()
+                queued += fanout.publish(alert)
+            publish_sec = time.perf_counter() - start
+            fanout.dispatcher.flush(timeout=120)
+            total_sec = time.perf_counter() - start
+        finally:
+            fanout.stop(timeout=10)
+
+        received = [item for sink in sinks for item in sink.received]
+        latencies_ms = [(received_at - published_at[delivery["alert"]["notificationId"]]) * 1000
+                        for _, delivery, received_at in received]
+        results["delivery"] = {
+            "queued": queued,
+            "delivered": len(received),
+            "requests": sum(sink.requests_served for sink in sinks),
+            "publish_alerts_per_sec": alerts_count / publish_sec,
+            "deliveries_per_sec": len(received) / total_sec,
+            "latency_ms": {f"p{point}": percentile(latencies_ms, point) for point in (50, 90, 99)},
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--alerts", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=100, help="Alerts published per second")
+    parser.add_argument("--cities-per-alert", type=int, default=30, help="Maximum cities of an alert")
+    parser.add_argument("--sinks", type=int, default=4, help="Local webhook servers")
+    parser.add_argument("--failure-ratio", type=float, default=0.0, help="Share of webhook requests answered 503")
+    args = parser.parse_args()
+
+    report = run(args.subscribers, args.alerts, args.rate, args.cities_per_alert, args.sinks, args.failure_ratio)
+    matching, delivery = report["matching"], report["delivery"]
+    print(f"matching: index {matching['index_us']:.1f}us/alert, scan {matching['scan_us']:.1f}us/alert, "
+          f"{matching['matches_per_alert']:.1f} subscriptions per alert, results agree: {matching['agree']}")
+    latency = delivery["latency_ms"]
+    print(f"delivery: {delivery['delivered']}/{delivery['queued']} alerts in {delivery['requests']} requests, "
+          f"{delivery['deliveries_per_sec']:.0f} deliveries/s, published at {delivery['publish_alerts_per_sec']:.0f} "
+          f"alerts/s, latency p50={latency['p50']:.1f}ms p90={latency['p90']:.1f}ms p99={latency['p99']:.1f}ms")
@@ -0,0 +1,97 @@
+"""
+Checks that the entry-point modules import quickly and without side effects.
+
+Each module is imported in a fresh interpreter with `python -X importtime`. The check fails if:
+
+* the cumulative import time exceeds the budget,
+* a heavy dependency (HTTP clients, pymongo, pydantic, geopy, yaml) is imported eagerly,
+* importing reads config.yaml or sets up the logger (and so opens the log file).
+
+Usage:
+    python -m benchmarks.check_import_time [--budget-ms 200] [--repeat 3] [module ...]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Any
+
+from DEFINITIONS import ROOT_DIR
+
+DEFAULT_MODULES = (
+    "listen_to_alerts",
+    "red_alerts_listener.backend.listening_handlers",
+    "red_alerts_listener.backend.database_collection_handlers",
+    "red_alerts_listener.backend.supervisor",
+    "red_alerts_listener.backend.backfill",
+    "red_alerts_listener.backend.materializer",
+    "red_alerts_listener.backend.retention",
+    "red_alerts_listener.backend.storage_migration",
+    "red_alerts_listener.backend.gazetteer",
+    "red_alerts_listener.backend.resilience",
+    "red_alerts_listener.backend.subscriptions",
+    "red_alerts_listener.backend.replay",
+    "red_alerts_listener.backend.fast_parser",
+)
+HEAVY_MODULES = ("requests", "aiohttp", "asyncio", "pymongo", "pydantic", "geopy", "pytz", "yaml", "http.server")
+
+# Runs in the child interpreter after the import, reporting what got loaded or initialized on the way
+_PROBE = """
+import json, sys
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.logger import logger
+print(json.dumps({{
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+    "config_sections_loaded": sorted(key for key in vars(config) if key != "file_path"),
+    "logger_initialized": logger._logger is not None,
+}}))
+"""
+
+
+def measure_import(module: str) -> dict[str, Any]:
+    code = f"import {module}\n" + _PROBE.format(heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT_DIR,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and line.rsplit("|", 1)[-1].strip() == module:
+            cumulative_us = int(line.split("|")[1])
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["import_ms"] = cumulative_us / 1000 if cumulative_us is not None else 0.0
+    return report
+
+
+def check(modules: tuple[str, ...], budget_ms: float, repeat: int) -> bool:
+    ok = True
+    for module in modules:
+        # The fastest of several runs is the least disturbed by the machine's noise
+        reports = [measure_import(module) for _ in range(repeat)]
+        report = min(reports, key=lambda r: r["import_ms"])
+        problems = []
+        if report["import_ms"] > budget_ms:
+            problems.append(f"over the {budget_ms:.0f}ms budget")
+        if report["heavy_modules"]:
+            problems.append(f"imports {', '.join(report['heavy_modules'])}")
+        if report["config_sections_loaded"]:
+            problems.append(f"reads config sections {', '.join(report['config_sections_loaded'])}")
+        if report["logger_initialized"]:
+            problems.append("initializes the logger")
+        ok = ok and not problems
+        print(f"{'FAIL' if problems else 'ok':4} {module}: {report['import_ms']:.1f}ms"
+              + (f" ({'; '.join(problems)})" if problems else ""))
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    # About twice the typical import time (~90-110ms), so a loaded machine does not fail the check;
+    # eager heavy imports are caught separately
+    parser.add_argument("--budget-ms", type=float, default=200.0, help="Maximum cumulative import time per module")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sys.exit(0 if check(tuple(args.modules), args.budget_ms, args.repeat) else 1)
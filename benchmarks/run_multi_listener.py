@@ -0,0 +1,86 @@
+"""
+Runs several coordinated listener processes against one local mongod and a fake tzevaadom server.
+
+Reports how evenly the staggered instances sample the API and checks that racing inserts left
+no duplicate documents behind.
+
+Usage:
+    python -m benchmarks.run_multi_listener --mongo-host localhost [--nodes 3] [--interval 0.5] [--duration 10]
+"""
+import argparse
+import multiprocessing
+import statistics
+import time
+import uuid
+
+from benchmarks.run_suite import build_synthetic_payloads
+from benchmarks.standins import FakeTzevaadomServer
+from red_alerts_listener.backend import database_collection_handlers as db_handlers
+from red_alerts_listener.backend.coordination import ListenerCoordinator
+from red_alerts_listener.backend.listening_handlers import RedAlertNotificationsListener
+from red_alerts_listener.backend.mongo_adapter import MongoDBAdapter
+
+
+def run_listener(url: str, mongo_host: str, mongo_port: int, db_name: str, interval_in_sec: float) -> None:
+    kwargs = dict(host=mongo_host, port=mongo_port, db_name=db_name)
+    raw_handler = db_handlers.RawAlertsLocationHandler(collection="raw_notifications",
+                                                       set_new_index_key="notificationId", **kwargs)
+    parsed_handler = db_handlers.ParsedAlertsCollectionHandler(
+        collection="parsed_notifications", set_new_index_key="raw_notification.notificationId", **kwargs)
+    locations_handler = db_handlers.LocationsCollectionHandler(collection="locations",
+                                                               set_new_index_key="location", **kwargs)
+    coordinator = ListenerCoordinator(collection="listener_leases", heartbeat_interval_sec=0.5,
+                                      lease_ttl_sec=2, **kwargs).start()
+    listener = RedAlertNotificationsListener(raw_handler, parsed_handler, locations_handler,
+                                             interval_in_sec=interval_in_sec, url=url, coordinator=coordinator)
+    listener.poll_alerts()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-host", default="localhost")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--interval", type=float, default=0.5, help="Poll interval of each listener")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    db_name = f"bench_multi_{uuid.uuid4().hex[:8]}"
+    adapter = MongoDBAdapter(MongoDBAdapter.build_connection_uri(host=args.mongo_host, port=args.mongo_port), db_name)
+    payloads = build_synthetic_payloads(int(args.duration * 5))
+    for city in {city for payload in payloads for alert in payload for city in alert["cities"]}:
+        adapter.insert_one("locations", {"location": city, "lon": 35.0, "lat": 32.0})
+
+    context = multiprocessing.get_context("spawn")
+    with FakeTzevaadomServer(payloads, rate=len(payloads) / args.duration, active_for_sec=2.0) as server:
+        processes = [context.Process(target=run_listener, daemon=True,
+                                     args=(server.url, args.mongo_host, args.mongo_port, db_name, args.interval))
+                     for _ in range(args.nodes)]
+        for process in processes:
+            process.start()
+        time.sleep(server.duration + 1)
+        for process in processes:
+            process.terminate()
+            process.join()
+        request_times = list(server.request_times)
+
+    # Ignore the start-up period, while instances are still joining and settling into their slots
+    steady_times = [t for t in request_times if t > request_times[0] + 3]
+    gaps = [later - earlier for earlier, later in zip(steady_times, steady_times[1:])]
+    raw_documents = adapter.find_all("raw_notifications")
+    unique_ids = {document["notificationId"] for document in raw_documents}
+    expected_ids = {alert["notificationId"] for payload in payloads for alert in payload}
+    adapter.client.drop_database(db_name)
+    adapter.close_connection()
+
+    print(f"nodes: {args.nodes}, per-node interval: {args.interval}s")
+    print(f"combined polls per second: {len(gaps) / sum(gaps):.2f} (ideal {args.nodes / args.interval:.2f})")
+    print(f"gap between polls: median {statistics.median(gaps) * 1000:.1f}ms, "
+          f"max {max(gaps) * 1000:.1f}ms (ideal {args.interval / args.nodes * 1000:.1f}ms)")
+    print(f"raw documents: {len(raw_documents)}, unique: {len(unique_ids)}, expected: {len(expected_ids)}")
+    if len(raw_documents) != len(unique_ids):
+        raise SystemExit("Duplicate raw documents were written")
+
+
+if __name__ == '__main__':
+    main()
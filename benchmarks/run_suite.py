@@ -0,0 +1,392 @@
+"""
+End-to-end benchmark suite for the listener pipeline.
+
+Runs everything against local stand-ins: a fake tzevaadom server replaying payloads and either an
+in-process Mongo stand-in (default) or a local `mongod`. Results are written as JSON so runs from
+different commits can be compared.
+
+Usage:
+    python -m benchmarks.run_suite [--mongo-host localhost --mongo-port 27017] [--payloads recorded.json]
+    python -m benchmarks.run_suite --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+from DEFINITIONS import ROOT_DIR
+from benchmarks import bench_parsing
+from benchmarks.standins import FakeTzevaadomServer, InMemoryMongoDBAdapter
+from red_alerts_listener.backend import database_collection_handlers as db_handlers
+from red_alerts_listener.backend.archive import SegmentArchive
+from red_alerts_listener.backend.database_populater import populate_all_collections_from_raw_notifications_collection
+from red_alerts_listener.backend.fast_parser import parse_notifications
+from red_alerts_listener.backend.listening_handlers import RedAlertNotificationsListener
+from red_alerts_listener.backend.materializer import NotificationMaterializer
+from red_alerts_listener.backend.mongo_adapter import MongoDBAdapter
+from red_alerts_listener.backend.retention import RetentionJob
+
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+
+def percentiles(samples: list[float], points: tuple[int, ...] = (50, 90, 99)) -> dict[str, Optional[float]]:
+    ordered = sorted(samples)
+    result: dict[str, Optional[float]] = {}
+    for point in points:
+        if not ordered:
+            result[f"p{point}"] = None
+            continue
+        index = min(len(ordered) - 1, max(0, round(point / 100 * len(ordered)) - 1))
+        result[f"p{point}"] = ordered[index]
+    return result
+
+
+class BenchmarkEnvironment:
+    """Builds collection handlers on top of either the in-memory stand-in or a local mongod."""
+
+    def __init__(self, mongo_host: Optional[str] = None, mongo_port: int = 27017):
+        self.use_mongod = mongo_host is not None
+        self.adapter_class = MongoDBAdapter if self.use_mongod else InMemoryMongoDBAdapter
+        self.host = mongo_host or "in-memory"
+        self.port = mongo_port
+        self._db_names: list[str] = []
+
+    def new_db_name(self) -> str:
+        """A fresh database name, dropped by `cleanup`."""
+        db_name = f"bench_{uuid.uuid4().hex[:12]}"
+        self._db_names.append(db_name)
+        return db_name
+
+    def build_handlers(self) -> tuple[db_handlers.RawAlertsLocationHandler,
+                                      db_handlers.ParsedAlertsCollectionHandler,
+                                      db_handlers.LocationsCollectionHandler]:
+        kwargs = dict(adapter=self.adapter_class, host=self.host, port=self.port, db_name=self.new_db_name())
+        return (db_handlers.RawAlertsLocationHandler(collection="raw_notifications", **kwargs),
+                db_handlers.ParsedAlertsCollectionHandler(collection="parsed_notifications", **kwargs),
+                db_handlers.LocationsCollectionHandler(collection="locations", **kwargs))
+
+    @staticmethod
+    def seed_locations(locations_handler: db_handlers.LocationsCollectionHandler, payloads: list[list[dict]]) -> None:
+        # Pre-populate every city so the benchmark never reaches the online geocoder
+        cities = {city for payload in payloads for alert in payload for city in alert["cities"]}
+        for city in cities:
+            locations_handler.adapter.insert_one(locations_handler.collection,
+                                                 {"location": city, "lon": 35.0, "lat": 32.0})
+
+    def cleanup(self) -> None:
+        if self.use_mongod:
+            adapter = MongoDBAdapter(MongoDBAdapter.build_connection_uri(host=self.host, port=self.port), "admin")
+            for db_name in self._db_names:
+                adapter.client.drop_database(db_name)
+            adapter.close_connection()
+        else:
+            InMemoryMongoDBAdapter.reset()
+
+
+def build_synthetic_payloads(count: int, alerts_per_payload: int = 1) -> list[list[dict]]:
+    alerts = bench_parsing.build_sample_alerts(count * alerts_per_payload)
+    return [alerts[i:i + alerts_per_payload] for i in range(0, len(alerts), alerts_per_payload)]
+
+
+def load_payloads(path: str) -> list[list[dict]]:
+    """Loads recorded payloads: either a list of API responses or a flat list of raw notifications."""
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    if data and isinstance(data[0], dict):
+        data = [[{key: value for key, value in alert.items() if key != "_id"}] for alert in data]
+    return data
+
+
+def bench_fetch_to_persist(env: BenchmarkEnvironment, payloads: list[list[dict]],
+                           rate: float, interval_in_sec: float) -> dict[str, Any]:
+    raw_handler, parsed_handler, locations_handler = env.build_handlers()
+    env.seed_locations(locations_handler, payloads)
+
+    latencies: dict[str, float] = {}
+    with FakeTzevaadomServer(payloads, rate=rate) as server:
+        listener = RedAlertNotificationsListener(raw_handler, parsed_handler, locations_handler,
+                                                 interval_in_sec=interval_in_sec, url=server.url)
+        deadline = time.perf_counter() + server.duration
+        while time.perf_counter() < deadline:
+            notifications = listener.poll_once()
+            persisted_at = time.perf_counter()
+            for notification in notifications:
+                if notification.notificationId not in latencies:
+                    latencies[notification.notificationId] = persisted_at - server.publish_times[
+                        notification.notificationId]
+            time.sleep(listener._seconds_until_next_poll())
+        requests_served = server.requests_served
+
+    expected = sum(len(payload) for payload in payloads)
+    return {
+        "rate_payloads_per_sec": rate,
+        "interval_in_sec": interval_in_sec,
+        "alerts_expected": expected,
+        "alerts_persisted": len(latencies),
+        "polls": requests_served,
+        "latency_ms": {key: value * 1000 if value is not None else None
+                       for key, value in percentiles(list(latencies.values())).items()},
+    }
+
+
+def bench_add_to_collections(env: BenchmarkEnvironment, payloads: list[list[dict]],
+                             raw_only: bool = False) -> dict[str, Any]:
+    raw_handler, parsed_handler, locations_handler = env.build_handlers()
+    env.seed_locations(locations_handler, payloads)
+    listener = RedAlertNotificationsListener(raw_handler, parsed_handler, locations_handler, raw_only=raw_only)
+    notifications = parse_notifications([alert for payload in payloads for alert in payload])
+
+    start = time.perf_counter()
+    for notification in notifications:
+        listener._add_to_collections(notification)
+    elapsed = time.perf_counter() - start
+    return {"alerts": len(notifications), "seconds": elapsed, "alerts_per_sec": len(notifications) / elapsed}
+
+
+def bench_database_populater(env: BenchmarkEnvironment, payloads: list[list[dict]]) -> dict[str, Any]:
+    raw_handler, parsed_handler, locations_handler = env.build_handlers()
+    env.seed_locations(locations_handler, payloads)
+    alerts = [alert for payload in payloads for alert in payload]
+    for alert in alerts:
+        raw_handler.adapter.insert_one(raw_handler.collection, dict(alert))
+
+    start = time.perf_counter()
+    parsed_ids, _ = populate_all_collections_from_raw_notifications_collection(raw_handler, parsed_handler,
+                                                                               locations_handler)
+    elapsed = time.perf_counter() - start
+    return {"alerts": len(alerts), "parsed_added": len(parsed_ids), "seconds": elapsed,
+            "alerts_per_sec": len(alerts) / elapsed}
+
+
+def bench_materializer(env: BenchmarkEnvironment, payloads: list[list[dict]]) -> dict[str, Any]:
+    raw_handler, parsed_handler, locations_handler = env.build_handlers()
+    env.seed_locations(locations_handler, payloads)
+    alerts = [alert for payload in payloads for alert in payload]
+    for alert in alerts:
+        raw_handler.adapter.insert_one(raw_handler.collection, dict(alert))
+    materializer = NotificationMaterializer(raw_handler, parsed_handler, locations_handler)
+
+    start = time.perf_counter()
+    materialized = materializer.catch_up()
+    elapsed = time.perf_counter() - start
+    return {"alerts": len(alerts), "materialized": materialized, "seconds": elapsed,
+            "alerts_per_sec": len(alerts) / elapsed}
+
+
+def bench_flask_api(duration_sec: float = 2.0,
+                    paths: tuple[str, ...] = ("/api/detected_points", "/map", "/metrics")) -> dict[str, Any]:
+    from red_alerts_listener.backend.app import app
+
+    client = app.test_client()
+    results = {}
+    for path in paths:
+        count = 0
+        latencies = []
+        deadline = time.perf_counter() + duration_sec
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}")
+            count += 1
+        results[path] = {"requests_per_sec": count / duration_sec,
+                         "latency_ms": {key: value * 1000 for key, value in percentiles(latencies).items()}}
+    return results
+
+
+def bench_alerts_api(env: BenchmarkEnvironment, payloads: list[list[dict]], page_size: int = 100) -> dict[str, Any]:
+    from red_alerts_listener.backend.app import app
+
+    raw_handler, _, _ = env.build_handlers()
+    alerts = [alert for payload in payloads for alert in payload]
+    for alert in alerts:
+        raw_handler.adapter.insert_one(raw_handler.collection, dict(alert))
+    app.config["RAW_ALERTS_HANDLER"] = raw_handler
+    client = app.test_client()
+    try:
+        export_start = time.perf_counter()
+        response = client.get("/api/alerts?format=ndjson", buffered=False)
+        first_byte_at = None
+        exported = 0
+        for chunk in response.iter_encoded():
+            first_byte_at = first_byte_at or time.perf_counter()
+            exported += chunk.count(b"\n")
+        export_seconds = time.perf_counter() - export_start
+
+        start = time.perf_counter()
+        pages, paged, cursor = 0, 0, None
+        while True:
+            body = client.get(f"/api/alerts?limit={page_size}" + (f"&cursor={cursor}" if cursor else "")).get_json()
+            pages += 1
+            paged += len(body["alerts"])
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        paging_seconds = time.perf_counter() - start
+    finally:
+        app.config.pop("RAW_ALERTS_HANDLER", None)
+
+    if exported != len(alerts) or paged != len(alerts):
+        raise RuntimeError(f"Expected {len(alerts)} alerts, exported {exported} and paged through {paged}")
+    return {
+        "alerts": len(alerts),
+        "ndjson_first_byte_ms": (first_byte_at - export_start) * 1000 if first_byte_at else None,
+        "ndjson_alerts_per_sec": exported / export_seconds,
+        "pages": pages,
+        "page_latency_ms": paging_seconds / pages * 1000,
+    }
+
+
+def bench_retention(env: BenchmarkEnvironment, payloads: list[list[dict]],
+                    spacing_sec: int = 3 * 3600, window_sec: int = 86400) -> dict[str, Any]:
+    raw_handler, parsed_handler, _ = env.build_handlers()
+    alerts = [dict(alert) for payload in payloads for alert in payload]
+    # Spread the alerts over several months, so the job has whole months to archive
+    first_time = 1700000000
+    for i, alert in enumerate(alerts):
+        alert["time"] = first_time + i * spacing_sec
+        raw_handler.adapter.insert_one(raw_handler.collection, alert)
+    last_time = alerts[-1]["time"]
+
+    with tempfile.TemporaryDirectory() as archive_dir:
+        raw_handler.archive = SegmentArchive(os.path.join(archive_dir, raw_handler.collection))
+        parsed_handler.archive = SegmentArchive(os.path.join(archive_dir, parsed_handler.collection),
+                                                time_field="raw_notification.time",
+                                                id_field="raw_notification.notificationId",
+                                                cities_field="raw_notification.cities")
+        job = RetentionJob(raw_handler, parsed_handler, max_age_days=1)
+        start = time.perf_counter()
+        archived = sum(result.archived for result in job.run(now=last_time))
+        archive_seconds = time.perf_counter() - start
+
+        segments = raw_handler.archive.segments()
+        json_bytes = sum(len(json.dumps(alert, ensure_ascii=False)) + 1 for alert in alerts
+                         if alert["time"] < job.cutoff(last_time))
+        segment_bytes = sum(os.path.getsize(os.path.join(raw_handler.archive.directory, segment["file"]))
+                            for segment in segments)
+        # Nothing old enough to archive (e.g. a small --alerts) leaves no index behind
+        index_path = raw_handler.archive.index_path
+        index_bytes = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+
+        # One-day windows spread over the archived range, then the same over the hot range
+        def window_latency_ms(window_starts: list[int]) -> float:
+            query_start = time.perf_counter()
+            for window_start in window_starts:
+                list(raw_handler.iter_notifications(start=window_start, end=window_start + window_sec))
+            return (time.perf_counter() - query_start) / len(window_starts) * 1000
+
+        archived_range = range(first_time, job.cutoff(last_time) - window_sec, window_sec * 7)
+        hot_range = range(job.cutoff(last_time), last_time - window_sec, window_sec * 7)
+        archived_window_ms = window_latency_ms(list(archived_range)) if archived_range else None
+        hot_window_ms = window_latency_ms(list(hot_range)) if hot_range else None
+        total = sum(1 for _ in raw_handler.iter_notifications())
+
+    if total != len(alerts):
+        raise RuntimeError(f"Expected {len(alerts)} alerts across the archive and the hot collection, got {total}")
+    return {
+        "alerts": len(alerts),
+        "archived": archived,
+        "segments": len(segments),
+        "archive_docs_per_sec": archived / archive_seconds if archive_seconds else None,
+        "compression_ratio": json_bytes / segment_bytes if segment_bytes else None,
+        "index_bytes": index_bytes,
+        "archived_window_ms": archived_window_ms,
+        "hot_window_ms": hot_window_ms,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args: argparse.Namespace) -> dict[str, Any]:
+    env = BenchmarkEnvironment(args.mongo_host, args.mongo_port)
+    payloads = load_payloads(args.payloads) if args.payloads else build_synthetic_payloads(args.alerts)
+    try:
+        return {
+            "meta": {
+                "revision": git_revision(),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "mongo": f"{env.host}:{env.port}" if env.use_mongod else "in-memory",
+                "payloads": len(payloads),
+            },
+            "parsing": bench_parsing.run(alerts_count=len(payloads)),
+            "fetch_to_persist": bench_fetch_to_persist(env, payloads, args.rate, args.interval),
+            "add_to_collections": bench_add_to_collections(env, payloads),
+            "add_to_collections_raw_only": bench_add_to_collections(env, payloads, raw_only=True),
+            "materializer": bench_materializer(env, payloads),
+            "database_populater": bench_database_populater(env, payloads),
+            "flask_api": bench_flask_api(args.api_duration),
+            "alerts_api": bench_alerts_api(env, payloads),
+            "retention": bench_retention(env, payloads),
+        }
+    finally:
+        env.cleanup()
+
+
+def _flatten(results: dict[str, Any], prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline_path: str, current_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = _flatten(json.load(file))
+    with open(current_path, "r", encoding="utf-8") as file:
+        current = _flatten(json.load(file))
+    for name in sorted(baseline.keys() & current.keys()):
+        if name.startswith("meta."):
+            continue
+        old, new = baseline[name], current[name]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{name:60} {old:14.3f} {new:14.3f} {change:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-host", default=None, help="Use a local mongod instead of the in-memory stand-in")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--payloads", default=None, help="JSON file with recorded payloads to replay")
+    parser.add_argument("--alerts", type=int, default=200, help="Number of synthetic payloads to generate")
+    parser.add_argument("--rate", type=float, default=20.0, help="Payloads published per second")
+    parser.add_argument("--interval", type=float, default=0.05, help="Listener poll interval in seconds")
+    parser.add_argument("--api-duration", type=float, default=2.0, help="Seconds spent on each API route")
+    parser.add_argument("--output", default=None, help="Where to write the results JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run_suite(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{results['meta']['revision'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,511 @@
+"""
+Local stand-ins for the external services used by the listener: the tzevaadom HTTP API, MongoDB and webhook
+subscribers.
+"""
+import copy
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Union
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeTzevaadomServer:
+    """
+    A local HTTP server replaying recorded notification payloads at a chosen rate.
+
+    Each payload (a list of alerts, as returned by the real API) becomes active `1 / rate` seconds
+    after the previous one and is served for `active_for_sec` seconds, mimicking how the real API keeps
+    returning an alert for a while after it was issued.
+
+    It also serves `history` (newest first) on `/alerts-history?page=N`, `history_page_size` items per page.
+
+    A `slow_request_ratio` of notification requests is delayed by `slow_request_delay_sec`, to reproduce
+    the tail latency of the real API.
+
+    Attributes:
+        publish_times (dict[str, float]): `time.perf_counter()` at which each notificationId became visible.
+    """
+
+    def __init__(self, payloads: List[List[dict]], rate: float = 10.0, active_for_sec: float = 1.0,
+                 host: str = "127.0.0.1", port: int = 0, history: Optional[List[dict]] = None,
+                 history_page_size: int = 50, slow_request_ratio: float = 0.0, slow_request_delay_sec: float = 0.0,
+                 seed: int = 0):
+        self.payloads = payloads
+        self.history = history or []
+        self.history_page_size = history_page_size
+        self.history_pages_served: list[int] = []
+        self.rate = rate
+        self.active_for_sec = active_for_sec
+        self.slow_request_ratio = slow_request_ratio
+        self.slow_request_delay_sec = slow_request_delay_sec
+        self._random = random.Random(seed)
+        self.publish_times: dict[str, float] = {}
+        self.requests_served = 0
+        self.request_times: list[float] = []
+        self._start: Optional[float] = None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._build_request_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/notifications"
+
+    @property
+    def history_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/alerts-history"
+
+    @property
+    def duration(self) -> float:
+        return len(self.payloads) / self.rate + self.active_for_sec
+
+    def start(self) -> "FakeTzevaadomServer":
+        self._start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeTzevaadomServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def history_page(self, page: int) -> List[dict]:
+        with self._lock:
+            self.history_pages_served.append(page)
+        start = page * self.history_page_size
+        return self.history[start:start + self.history_page_size]
+
+    def active_alerts(self) -> List[dict]:
+        now = time.perf_counter()
+        elapsed = now - self._start
+        last = min(int(elapsed * self.rate), len(self.payloads) - 1)
+        first = max(0, int((elapsed - self.active_for_sec) * self.rate))
+        alerts = []
+        with self._lock:
+            for index in range(first, last + 1):
+                published_at = self._start + index / self.rate
+                if published_at > now:
+                    continue
+                for alert in self.payloads[index]:
+                    self.publish_times.setdefault(alert["notificationId"], published_at)
+                    alerts.append(alert)
+            self.requests_served += 1
+            self.request_times.append(now)
+        return alerts
+
+    def _build_request_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/notifications":
+                    data = server.active_alerts()
+                    with server._lock:
+                        slow = server._random.random() < server.slow_request_ratio
+                    if slow:
+                        time.sleep(server.slow_request_delay_sec)
+                elif url.path == "/alerts-history":
+                    data = server.history_page(int(parse_qs(url.query).get("page", ["0"])[0]))
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class WebhookSink:
+    """
+    A local HTTP server receiving webhook deliveries (`POST {"alerts": [...]}` on any path), with keep-alive
+    connections like a real endpoint.
+
+    A `failure_ratio` of requests is answered with 503, to exercise the dispatcher's retries.
+
+    Attributes:
+        received (list[tuple[str, dict, float]]): The path, alert and `time.perf_counter()` of each received alert.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, failure_ratio: float = 0.0, seed: int = 0):
+        self.failure_ratio = failure_ratio
+        self.received: list[tuple[str, dict, float]] = []
+        self.requests_served = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._build_request_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "WebhookSink":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "WebhookSink":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _build_request_handler(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                received_at = time.perf_counter()
+                with sink._lock:
+                    sink.requests_served += 1
+                    failed = sink._random.random() < sink.failure_ratio
+                    if not failed:
+                        sink.received.extend((self.path, alert, received_at)
+                                             for alert in json.loads(body)["alerts"])
+                self.send_response(503 if failed else 204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _get_path(document: Dict[str, Any], path: str) -> Any:
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$in":
+                values = value if isinstance(value, list) else [value]
+                if not any(v in operand for v in values):
+                    return False
+            elif operator == "$gte":
+                if value is None or value < operand:
+                    return False
+            elif operator == "$gt":
+                if value is None or value <= operand:
+                    return False
+            elif operator == "$lte":
+                if value is None or value > operand:
+                    return False
+            elif operator == "$lt":
+                if value is None or value >= operand:
+                    return False
+            elif operator == "$ne":
+                if value == operand:
+                    return False
+            else:
+                raise NotImplementedError(f"Operator {operator} is not supported by the in-memory stand-in")
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches_query(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for path, condition in query.items():
+        if path == "$or":
+            if not any(matches_query(document, clause) for clause in condition):
+                return False
+        elif path == "$and":
+            if not all(matches_query(document, clause) for clause in condition):
+                return False
+        elif not _matches_condition(_get_path(document, path), condition):
+            return False
+    return True
+
+
+class InMemoryChangeStream:
+    """
+    A change stream over the insert events recorded by InMemoryMongoDBAdapter, with the subset of the
+    pymongo ChangeStream interface used by the materializer. Resume tokens are `{"_data": <position>}`.
+    """
+
+    def __init__(self, events: List[dict], condition: threading.Condition, pipeline: List[dict],
+                 position: int, max_await_time_ms: int):
+        self._events = events
+        self._condition = condition
+        self._filters = [stage["$match"] for stage in pipeline if "$match" in stage]
+        self._position = position
+        self._max_await_sec = max_await_time_ms / 1000
+
+    @property
+    def resume_token(self) -> dict:
+        return {"_data": self._position}
+
+    def try_next(self) -> Optional[dict]:
+        with self._condition:
+            if self._position >= len(self._events):
+                self._condition.wait(self._max_await_sec)
+            while self._position < len(self._events):
+                event = self._events[self._position]
+                self._position += 1
+                if all(matches_query(event, condition) for condition in self._filters):
+                    return copy.deepcopy(event)
+        return None
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "InMemoryChangeStream":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class InMemoryMongoDBAdapter:
+    """
+    An in-process stand-in for MongoDBAdapter with the same interface.
+
+    Adapters created with the same uri and db_name share their data, like clients of one server would.
+    Inserts are recorded as change events, so `watch` behaves like a change stream on a replica set.
+    """
+    _databases: dict[tuple[str, str], dict[str, list[dict]]] = {}
+    _databases_lock = threading.Lock()
+    _ids = itertools.count(1)
+    _change_events: dict[tuple[str, str, str], list[dict]] = {}
+    _changes = threading.Condition()
+    _time_series: dict[tuple[str, str, str], dict[str, str]] = {}
+
+    def __init__(self, uri: str, db_name: str):
+        self.uri = uri
+        self.db_name = db_name
+        with self._databases_lock:
+            self.db = self._databases.setdefault((uri, db_name), {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._databases_lock:
+            cls._databases.clear()
+        with cls._changes:
+            cls._change_events.clear()
+        cls._time_series.clear()
+
+    def _collection(self, collection_name: str) -> list[dict]:
+        return self.db.setdefault(collection_name, [])
+
+    def _events(self, collection_name: str) -> list[dict]:
+        return self._change_events.setdefault((self.uri, self.db_name, collection_name), [])
+
+    def insert_one(self, collection_name: str, document: Dict[str, Any]) -> str:
+        document = copy.deepcopy(document)
+        document.setdefault("_id", f"{next(self._ids):024x}")
+        with self._lock:
+            self._collection(collection_name).append(document)
+        with self._changes:
+            events = self._events(collection_name)
+            events.append({"_id": {"_data": len(events) + 1}, "operationType": "insert",
+                           "ns": {"db": self.db_name, "coll": collection_name},
+                           "documentKey": {"_id": document["_id"]}, "fullDocument": copy.deepcopy(document)})
+            self._changes.notify_all()
+        return str(document["_id"])
+
+    def watch(self, collection_name: str, pipeline: Optional[List[Dict[str, Any]]] = None,
+              resume_after: Optional[Dict[str, Any]] = None, max_await_time_ms: int = 1000) -> InMemoryChangeStream:
+        with self._changes:
+            events = self._events(collection_name)
+            position = resume_after["_data"] if resume_after else len(events)
+        return InMemoryChangeStream(events, self._changes, pipeline or [], position, max_await_time_ms)
+
+    def insert_many(self, collection_name: str, documents: List[Dict[str, Any]]) -> List[str]:
+        return [self.insert_one(collection_name, document) for document in documents]
+
+    def _reject_on_time_series(self, collection_name: str, operation: str) -> None:
+        if (self.uri, self.db_name, collection_name) in self._time_series:
+            raise NotImplementedError(f"{operation} is not supported on time-series collection {collection_name}")
+
+    def insert_if_absent(self, collection_name: str, query: Dict[str, Any], document: Dict[str, Any]) -> Optional[str]:
+        self._reject_on_time_series(collection_name, "Upsert")
+        with self._databases_lock:
+            if self.find_one(collection_name, query) is not None:
+                return None
+            return self.insert_one(collection_name, document)
+
+    def find_one(self, collection_name: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for document in self._collection(collection_name):
+            if matches_query(document, query):
+                return copy.deepcopy(document)
+        return None
+
+    def find_all(self, collection_name: str, query: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return [copy.deepcopy(document) for document in self._collection(collection_name)
+                if matches_query(document, query or {})]
+
+    def find_iter(self, collection_name: str, query: Optional[Dict[str, Any]] = None,
+                  sort: Optional[List[tuple]] = None, limit: int = 0, projection: Optional[Dict[str, Any]] = None,
+                  batch_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        documents = [document for document in self._collection(collection_name) if matches_query(document, query or {})]
+        for field, direction in reversed(sort or []):
+            documents.sort(key=lambda document: _get_path(document, field), reverse=direction < 0)
+        for document in documents[:limit or None]:
+            document = copy.deepcopy(document)
+            if projection:
+                excluded = {key for key, value in projection.items() if not value}
+                included = {key for key, value in projection.items() if value}
+                document = {key: value for key, value in document.items()
+                            if key not in excluded and (not included or key in included or key == "_id")}
+            yield document
+
+    def count_documents(self, collection_name: str, query: Optional[Dict[str, Any]] = None) -> int:
+        return sum(1 for document in self._collection(collection_name) if matches_query(document, query or {}))
+
+    def find_latest(self, collection_name: str, field_name: str,
+                    query: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        documents = [document for document in self.find_all(collection_name, query)
+                     if _get_path(document, field_name) is not None]
+        return max(documents, key=lambda document: _get_path(document, field_name), default=None)
+
+    def update_one(self, collection_name: str, query: Dict[str, Any], update: Dict[str, Any]) -> int:
+        with self._lock:
+            for document in self._collection(collection_name):
+                if matches_query(document, query):
+                    document.update(copy.deepcopy(update))
+                    return 1
+        return 0
+
+    def upsert_one(self, collection_name: str, query: Dict[str, Any], update: Dict[str, Any]) -> int:
+        self._reject_on_time_series(collection_name, "Upsert")
+        unsupported = set(update) - {"$set", "$setOnInsert", "$inc"}
+        if unsupported:
+            raise NotImplementedError(f"Update operators {unsupported} are not supported by the in-memory stand-in")
+        with self._databases_lock:
+            for document in self._collection(collection_name):
+                if matches_query(document, query):
+                    document.update(copy.deepcopy(update.get("$set", {})))
+                    for key, amount in update.get("$inc", {}).items():
+                        document[key] = document.get(key, 0) + amount
+                    return 1
+            document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            document.update(update.get("$setOnInsert", {}))
+            document.update(update.get("$set", {}))
+            document.update(update.get("$inc", {}))
+            self.insert_one(collection_name, document)
+            return 1
+
+    def increment_once(self, collection_name: str, query: Dict[str, Any], operation_id: str,
+                       increments: Dict[str, int], set_on_insert: Optional[Dict[str, Any]] = None) -> bool:
+        with self._databases_lock:
+            document = self.find_one(collection_name, query)
+            if document is None:
+                document = {**query, **(set_on_insert or {}), "applied_ids": []}
+                self.insert_one(collection_name, document)
+            with self._lock:
+                stored = next(d for d in self._collection(collection_name) if matches_query(d, query))
+                if operation_id in stored["applied_ids"]:
+                    return False
+                stored["applied_ids"].append(operation_id)
+                for path, amount in increments.items():
+                    *parents, leaf = path.split(".")
+                    target = stored
+                    for parent in parents:
+                        target = target.setdefault(parent, {})
+                    target[leaf] = target.get(leaf, 0) + amount
+            return True
+
+    def delete_one(self, collection_name: str, query: Dict[str, Any]) -> int:
+        with self._lock:
+            documents = self._collection(collection_name)
+            for index, document in enumerate(documents):
+                if matches_query(document, query):
+                    del documents[index]
+                    return 1
+        return 0
+
+    def delete_many(self, collection_name: str, query: Dict[str, Any]) -> int:
+        with self._lock:
+            documents = self._collection(collection_name)
+            remaining = [document for document in documents if not matches_query(document, query)]
+            deleted = len(documents) - len(remaining)
+            documents[:] = remaining
+        return deleted
+
+    def add_new_index_key(self, collection_name: str, key_name: str) -> str:
+        return f"{key_name}_1"
+
+    def create_index(self, collection_name: str, keys: List[tuple], unique: bool = False,
+                     expire_after_sec: Optional[int] = None) -> str:
+        return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    def create_time_series_collection(self, collection_name: str, time_field: str,
+                                      meta_field: Optional[str] = None, granularity: str = "seconds") -> bool:
+        if self.collection_exists(collection_name):
+            return False
+        self._collection(collection_name)
+        self._time_series[(self.uri, self.db_name, collection_name)] = {
+            "timeField": time_field, "metaField": meta_field, "granularity": granularity}
+        return True
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self.db
+
+    def is_time_series(self, collection_name: str) -> bool:
+        return (self.uri, self.db_name, collection_name) in self._time_series
+
+    def rename_collection(self, collection_name: str, new_name: str) -> None:
+        self._reject_on_time_series(collection_name, "Rename")
+        with self._lock:
+            self.db[new_name] = self.db.pop(collection_name, [])
+
+    def drop_collection(self, collection_name: str) -> None:
+        with self._lock:
+            self.db.pop(collection_name, None)
+        self._time_series.pop((self.uri, self.db_name, collection_name), None)
+
+    def collection_stats(self, collection_name: str) -> Dict[str, Any]:
+        # Nothing is compressed in memory, so storageSize is just the size of the documents as JSON
+        size = sum(len(json.dumps(document, default=str)) for document in self._collection(collection_name))
+        return {"count": len(self._collection(collection_name)), "size": size, "storageSize": size,
+                "totalIndexSize": 0}
+
+    def find_by_range(self, collection_name: str,
+                      field_name: str,
+                      start_value: Union[int, datetime],
+                      end_value: Union[int, datetime]) -> List[Dict[str, Any]]:
+        return self.find_all(collection_name, {field_name: {"$gte": start_value, "$lte": end_value}})
+
+    def close_connection(self) -> None:
+        pass
+
+    @staticmethod
+    def build_connection_uri(base_url: str = "mongodb", host: str = "localhost", port: int = 27017, **_) -> str:
+        return f"{base_url}://{host}:{port}/"
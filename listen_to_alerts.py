@@ -1,40 +1,31 @@
-from multiprocessing import Process
+import argparse
 from datetime import datetime
+from typing import Optional
 
+from red_alerts_listener.backend import metrics
 from red_alerts_listener.backend.config_reader import config
 from red_alerts_listener.backend.logger import logger
-from red_alerts_listener.backend.listening_handlers import RedAlertNotificationsListener
-from red_alerts_listener.backend import database_collection_handlers as db_handlers
+from red_alerts_listener.backend.supervisor import PipelineSupervisor
 
 
-def start_listening():
+def start_listening(fetch_workers: Optional[int] = None,
+                    persist_workers: Optional[int] = None,
+                    geocode_workers: Optional[int] = None):
     logger.info(f"Begin listening at {datetime.now()}")
-    raw_alerts_collection_handler = db_handlers.RawAlertsLocationHandler(
-        host=config.mongodb.host,
-        port=config.mongodb.port,
-        collection=config.mongodb.raw_notifications_collection,
-        db_name=config.mongodb.db_name
-    )
-    parsed_alerts_collection_handler = db_handlers.ParsedAlertsCollectionHandler(
-        host=config.mongodb.host,
-        port=config.mongodb.port,
-        collection=config.mongodb.parsed_notifications_collection,
-        db_name=config.mongodb.db_name
-    )
-    locations_collection_handler = db_handlers.LocationsCollectionHandler(
-        host=config.mongodb.host,
-        port=config.mongodb.port,
-        collection=config.mongodb.locations_collection,
-        db_name=config.mongodb.db_name
-    )
+    metrics.start_metrics_server(config.metrics.listener_port, config.metrics.host)
+    logger.info(f"Serving supervisor metrics on {config.metrics.host}:{config.metrics.listener_port}/metrics")
 
-    notifications_listener = RedAlertNotificationsListener(raw_alerts_collection_handler,
-                                                           parsed_alerts_collection_handler,
-                                                           locations_collection_handler)
-    notifications_listener.poll_alerts()
-    p = Process(target=notifications_listener.poll_alerts)
-    p.start()
+    supervisor = PipelineSupervisor(fetch_workers=fetch_workers,
+                                    persist_workers=persist_workers,
+                                    geocode_workers=geocode_workers)
+    supervisor.run()
 
 
 if __name__ == '__main__':
-    start_listening()
+    parser = argparse.ArgumentParser(description="Listen to red alerts and record them to MongoDB")
+    parser.add_argument("--fetch-workers", type=int, default=config.pipeline.fetch_workers)
+    parser.add_argument("--persist-workers", type=int, default=config.pipeline.persist_workers)
+    parser.add_argument("--geocode-workers", type=int, default=config.pipeline.geocode_workers)
+    args = parser.parse_args()
+
+    start_listening(args.fetch_workers, args.persist_workers, args.geocode_workers)
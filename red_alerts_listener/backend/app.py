@@ -1,6 +1,8 @@
 from flask import Flask
 import os
+from red_alerts_listener.backend.routes.alerts_routes import alerts_blueprint
 from red_alerts_listener.backend.routes.map_routes import map_blueprint
+from red_alerts_listener.backend.routes.metrics_routes import metrics_blueprint
 from DEFINITIONS import ROOT_DIR
 
 app = Flask(__name__)
@@ -11,6 +13,8 @@ app.register_blueprint(map_blueprint,
                        static_folder=os.path.join(ROOT_DIR, "red_alerts_listener/frontend/static"),
                        template_folder=os.path.join(ROOT_DIR, "red_alerts_listener/frontend/templates")
                        )
+app.register_blueprint(metrics_blueprint)
+app.register_blueprint(alerts_blueprint)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,242 @@
+import gzip
+import heapq
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Optional
+
+from DEFINITIONS import ROOT_DIR
+from red_alerts_listener.backend.config_reader import config
+
+INDEX_FILE = "index.json"
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+def get_path(document: dict[str, Any], path: str) -> Any:
+    """Returns the value of a dotted field path (e.g. "raw_notification.time"), or None if it is missing."""
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def month_of(timestamp: int) -> str:
+    """The UTC month ("YYYY-MM") of a unix timestamp, which names the segment holding it."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m")
+
+
+def month_bounds(month: str) -> tuple[int, int]:
+    """The [start, end) unix seconds of a "YYYY-MM" month."""
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def merge_sorted(*sources: Iterable[dict[str, Any]], key) -> Iterator[dict[str, Any]]:
+    """
+    Lazily merges iterables that are each sorted by `key`, dropping documents whose key was already yielded
+    (a notification can briefly exist both in an archive and in its hot collection).
+    """
+    last_key = None
+    for document in heapq.merge(*sources, key=key):
+        document_key = key(document)
+        if document_key != last_key:
+            yield document
+            last_key = document_key
+
+
+class SegmentArchive:
+    """
+    The archived documents of one collection: one compressed segment file per UTC month, on local disk.
+
+    A segment is a sequence of independent gzip members ("blocks") of `block_size` JSON lines each, sorted by
+    (time, id). Concatenated gzip members are still a valid gzip file, so `zcat` reads a segment as is, while
+    a reader can decompress any single block on its own. `index.json` is the sparse index: for every segment it
+    keeps its time range, its cities and one entry per block (offset, length and time range), so a range query
+    only decompresses the blocks overlapping the range and a city query skips the segments without the city.
+
+    Segments are immutable: rewriting a month writes a new file, swaps the index to it and then removes the old
+    file, each step an atomic rename, so concurrent readers always see a consistent archive.
+
+    Attributes:
+        directory (str): The directory of this collection's segments and index.
+        time_field (str): The (dotted) field holding the unix time of a document.
+        id_field (str): The (dotted) field identifying a document.
+        cities_field (str): The (dotted) field listing the cities of a document.
+        block_size (int): Number of documents per compressed block.
+    """
+
+    def __init__(self, directory: str, time_field: str = "time", id_field: str = "notificationId",
+                 cities_field: str = "cities", block_size: int = 1000):
+        self.directory = directory
+        self.time_field = time_field
+        self.id_field = id_field
+        self.cities_field = cities_field
+        self.block_size = block_size
+        self._index: Optional[dict[str, Any]] = None
+        self._index_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_collection(cls, collection: str, **fields) -> Optional["SegmentArchive"]:
+        """
+        Returns the archive of a collection as configured in the retention section, or None if retention is off.
+        """
+        if not config.retention.enabled:
+            return None
+        return cls(os.path.join(ROOT_DIR, config.retention.archive_dir, collection),
+                   block_size=config.retention.block_size, **fields)
+
+    def key(self, document: dict[str, Any]) -> tuple[int, str]:
+        return get_path(document, self.time_field), get_path(document, self.id_field)
+
+    # Index
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self) -> dict[str, Any]:
+        # Reloaded whenever the file changes, so long-running readers see segments written by the retention job
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return {"segments": {}}
+        with self._lock:
+            if self._index is None or mtime != self._index_mtime:
+                with open(self.index_path, "r", encoding="utf-8") as file:
+                    self._index = json.load(file)
+                self._index_mtime = mtime
+            return self._index
+
+    def segments(self) -> list[dict[str, Any]]:
+        """The index entries of all segments, oldest month first."""
+        index = self._load_index()
+        return [index["segments"][month] for month in sorted(index["segments"])]
+
+    def segment(self, month: str) -> Optional[dict[str, Any]]:
+        return self._load_index()["segments"].get(month)
+
+    def _replace_file(self, path: str, content: bytes) -> None:
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+    # Writing
+    def write_segment(self, month: str, documents: list[dict[str, Any]]) -> dict[str, Any]:
+        """
+        Writes (or rewrites) the segment of a month with the given documents and records it in the index.
+
+        Args:
+            month: The "YYYY-MM" month all the documents belong to
+            documents: The documents, in any order and without their Mongo `_id`
+
+        Returns:
+            The index entry of the new segment
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        documents = sorted(documents, key=self.key)
+        previous = self.segment(month)
+        generation = previous["generation"] + 1 if previous else 1
+        file_name = f"{month}.{generation}{SEGMENT_SUFFIX}"
+
+        content, blocks, cities = bytearray(), [], set()
+        for first in range(0, len(documents), self.block_size):
+            block = documents[first:first + self.block_size]
+            lines = "".join(json.dumps(document, ensure_ascii=False, default=str) + "\n" for document in block)
+            compressed = gzip.compress(lines.encode("utf-8"), compresslevel=9, mtime=0)
+            blocks.append({"offset": len(content), "length": len(compressed), "count": len(block),
+                           "first_time": get_path(block[0], self.time_field),
+                           "last_time": get_path(block[-1], self.time_field)})
+            content += compressed
+            for document in block:
+                cities.update(get_path(document, self.cities_field) or ())
+        self._replace_file(os.path.join(self.directory, file_name), bytes(content))
+
+        entry = {"month": month, "file": file_name, "generation": generation, "count": len(documents),
+                 "first_time": blocks[0]["first_time"] if blocks else None,
+                 "last_time": blocks[-1]["last_time"] if blocks else None,
+                 "cities": sorted(cities), "blocks": blocks}
+        index = self._load_index()
+        segments = {**index["segments"], month: entry}
+        self._replace_file(self.index_path, json.dumps({"segments": segments}, ensure_ascii=False).encode("utf-8"))
+        if previous:
+            try:
+                os.remove(os.path.join(self.directory, previous["file"]))
+            except FileNotFoundError:
+                pass
+        return entry
+
+    # Reading
+    def _read_block(self, segment: dict[str, Any], block: dict[str, Any]) -> list[dict[str, Any]]:
+        with open(os.path.join(self.directory, segment["file"]), "rb") as file:
+            file.seek(block["offset"])
+            lines = gzip.decompress(file.read(block["length"])).decode("utf-8").splitlines()
+        return [json.loads(line) for line in lines]
+
+    def read_segment(self, month: str) -> list[dict[str, Any]]:
+        """All the documents of a month's segment (empty if there is none)."""
+        segment = self.segment(month)
+        if segment is None:
+            return []
+        return [document for block in segment["blocks"] for document in self._read_block(segment, block)]
+
+    def _iter_once(self, start: Optional[int], end: Optional[int], city: Optional[str],
+                   after: Optional[tuple[int, str]]) -> Iterator[dict[str, Any]]:
+        for segment in self.segments():
+            if not segment["count"] or (city is not None and city not in segment["cities"]):
+                continue
+            if (start is not None and segment["last_time"] < start) or (after and segment["last_time"] < after[0]):
+                continue
+            if end is not None and segment["first_time"] > end:
+                return
+            for block in segment["blocks"]:
+                if (start is not None and block["last_time"] < start) or (after and block["last_time"] < after[0]):
+                    continue
+                if end is not None and block["first_time"] > end:
+                    return
+                for document in self._read_block(segment, block):
+                    time = get_path(document, self.time_field)
+                    if start is not None and time < start:
+                        continue
+                    if end is not None and time > end:
+                        return
+                    if after and self.key(document) <= tuple(after):
+                        continue
+                    if city is not None and city not in (get_path(document, self.cities_field) or ()):
+                        continue
+                    yield document
+
+    def iter_documents(self, start: Optional[int] = None, end: Optional[int] = None, city: Optional[str] = None,
+                       after: Optional[tuple[int, str]] = None) -> Iterator[dict[str, Any]]:
+        """
+        Lazily iterates archived documents ordered by (time, id), decompressing one block at a time.
+
+        Args:
+            start: Only documents with time >= start (unix seconds)
+            end: Only documents with time <= end (unix seconds)
+            city: Only documents that include this city
+            after: Only documents after this (time, id) key
+
+        Returns:
+            An iterator over the matching documents
+        """
+        retried = False
+        while True:
+            try:
+                for document in self._iter_once(start, end, city, after):
+                    yield document
+                    after = self.key(document)
+                return
+            except FileNotFoundError:
+                if retried:
+                    raise
+                # The segment being read was rewritten meanwhile; continue from the last document on the new index
+                retried = True
+                with self._lock:
+                    self._index = None
@@ -0,0 +1,141 @@
+"""
+The map API as an ASGI app on Starlette, for serving it with an async server (e.g. uvicorn) instead of Flask's
+development server. It serves the same routes as `app.py`; database reads run on Starlette's thread pool, so a
+slow query never blocks the event loop.
+
+Usage:
+    python -m red_alerts_listener.backend.asgi [--host 127.0.0.1] [--port 8000] [--workers 1]
+    uvicorn red_alerts_listener.backend.asgi:app --workers 4
+"""
+import argparse
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+
+from DEFINITIONS import ROOT_DIR
+from red_alerts_listener.backend import metrics
+from red_alerts_listener.backend.database_collection_handlers import RawAlertsLocationHandler
+from red_alerts_listener.backend.services.alerts_service import DEFAULT_PAGE_SIZE, NDJSON_CONTENT_TYPE, QueryError, \
+    encode_cursor, ndjson_chunks, parse_filters, parse_limit
+from red_alerts_listener.backend.services.detection_service import get_detected_points, get_map_points
+
+FRONTEND_DIR = os.path.join(ROOT_DIR, "red_alerts_listener/frontend")
+STATIC_URL_PATH = "/static"
+
+templates = Jinja2Templates(directory=os.path.join(FRONTEND_DIR, "templates"))
+
+
+def _static_url(endpoint: str, filename: str) -> str:
+    # The templates are shared with the Flask app, so they call url_for with Flask's signature
+    return f"{STATIC_URL_PATH}/{filename}"
+
+
+templates.env.globals["url_for"] = _static_url
+
+
+def get_alerts_handler(request: Request) -> RawAlertsLocationHandler:
+    """
+    Returns the raw notifications handler used by the API, stored in `app.state.raw_alerts_handler`.
+    It is built from config.yaml on first use unless the application set one.
+    """
+    handler = getattr(request.app.state, "raw_alerts_handler", None)
+    if handler is None:
+        handler = RawAlertsLocationHandler()
+        handler.ensure_query_indexes()
+        request.app.state.raw_alerts_handler = handler
+    return handler
+
+
+async def show_map(request: Request) -> Response:
+    return templates.TemplateResponse(request, "map.html", {"points": get_map_points()})
+
+
+async def test_page(request: Request) -> Response:
+    return HTMLResponse("<h1>This is a test page!</h1>")
+
+
+async def get_points(request: Request) -> Response:
+    return JSONResponse(get_detected_points())
+
+
+async def show_metrics(request: Request) -> Response:
+    return Response(metrics.REGISTRY.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+async def query_alerts(request: Request) -> Response:
+    """The ASGI version of `alerts_routes.query_alerts`, with the same parameters and responses."""
+    try:
+        filters = parse_filters(request.query_params)
+        ndjson = (request.query_params.get("format") == "ndjson"
+                  or request.headers.get("accept", "").split(",")[0].strip() == NDJSON_CONTENT_TYPE)
+        limit = parse_limit(request.query_params.get("limit"), default=0 if ndjson else DEFAULT_PAGE_SIZE)
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    handler = get_alerts_handler(request)
+    if ndjson:
+        # Each chunk is read from the database cursor on a worker thread, while the stream is being sent
+        chunks = iterate_in_threadpool(ndjson_chunks(handler.iter_notifications(**filters, limit=limit)))
+        return StreamingResponse(chunks, media_type=NDJSON_CONTENT_TYPE, headers={"X-Accel-Buffering": "no"})
+
+    page = await run_in_threadpool(lambda: list(handler.iter_notifications(**filters, limit=limit + 1)))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return JSONResponse({"alerts": page[:limit], "next_cursor": next_cursor})
+
+
+# Named after the Flask endpoints, so both servers report the same request metrics labels
+routes = [
+    Route("/map", show_map, name="map_blueprint.show_map"),
+    Route("/test", test_page, name="map_blueprint.test_page"),
+    Route("/api/detected_points", get_points, name="map_blueprint.get_points"),
+    Route("/metrics", show_metrics, name="metrics_blueprint.show_metrics"),
+    Route("/api/alerts", query_alerts, name="alerts_blueprint.query_alerts"),
+    Mount(STATIC_URL_PATH, StaticFiles(directory=os.path.join(FRONTEND_DIR, "static")),
+          name="map_blueprint.static"),
+]
+_ENDPOINT_NAMES = {route.endpoint: route.name for route in routes if isinstance(route, Route)}
+
+
+class RequestTimingMiddleware:
+    """Observes the duration of every request, until its response is fully sent, in API_REQUEST_LATENCY."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router adds the matched endpoint to the scope
+            endpoint = _ENDPOINT_NAMES.get(scope.get("endpoint"), "unknown")
+            metrics.API_REQUEST_LATENCY.labels(endpoint=endpoint).observe(time.perf_counter() - start_time)
+
+
+app = Starlette(routes=routes)
+app.add_middleware(RequestTimingMiddleware)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the map API with uvicorn")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Serving the ASGI app needs uvicorn: pip install uvicorn")
+    uvicorn.run("red_alerts_listener.backend.asgi:app", host=args.host, port=args.port, workers=args.workers,
+                access_log=False)
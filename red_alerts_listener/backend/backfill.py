@@ -0,0 +1,256 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler, \
+    RawAlertsLocationHandler, ParsedAlertsCollectionHandler
+from red_alerts_listener.backend.fast_parser import AnyRedAlertNotification, parse_notification
+from red_alerts_listener.backend.logger import logger
+
+
+class RateLimiter:
+    """
+    A thread-safe limiter spacing out calls to at most `rate_per_sec` per second.
+    """
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1 / rate_per_sec if rate_per_sec > 0 else 0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+@dataclass
+class BackfillResult:
+    fetched: int = 0
+    already_stored: int = 0  # fetched alerts matching a stored alert, or an earlier one of the fetch, by content
+    raw_ids: list[str] = field(default_factory=list)
+    parsed_ids: list[str] = field(default_factory=list)
+    location_ids: list[str] = field(default_factory=list)
+
+
+def normalize_history_items(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Flattens a history response into raw notification dicts.
+
+    Items that already look like notifications are kept as is. Grouped items
+    (`{"id": ..., "alerts": [{"time", "cities", "threat", "isDrill"}, ...]}`) have no notificationId,
+    so a deterministic one is derived from the group id and the alert's position in the group.
+    """
+    alerts = []
+    for item in items:
+        if "alerts" not in item:
+            alerts.append(item)
+            continue
+        for index, alert in enumerate(item["alerts"]):
+            alerts.append({"notificationId": f"history-{item['id']}-{index}", **alert})
+    return alerts
+
+
+def content_key(time: int, threat: int, cities: list[str]) -> tuple[int, int, tuple[str, ...]]:
+    """Identifies an alert by its content, for matching history alerts to the live ones they duplicate."""
+    return time, int(threat), tuple(sorted(cities))
+
+
+class HistoryBackfiller:
+    """
+    Fills gaps in the collections from the alerts history endpoint.
+
+    Pages are requested concurrently in waves of `max_workers`, newest first, through a shared rate limiter,
+    until a page reaches alerts older than the requested range. Grouped history alerts get synthetic ids that never
+    equal the live poller's notificationIds, so the results are deduplicated by content (time, threat and cities)
+    against the stored alerts and each other, then bulk-inserted through the collection handlers.
+    """
+
+    def __init__(self,
+                 raw_alerts_collection_handler: RawAlertsLocationHandler,
+                 parsed_alerts_collection_handler: ParsedAlertsCollectionHandler,
+                 locations_collection_handler: LocationsCollectionHandler,
+                 url: Optional[str] = None,
+                 max_workers: Optional[int] = None,
+                 requests_per_sec: Optional[float] = None,
+                 max_pages: Optional[int] = None,
+                 request_timeout_sec: Optional[float] = None):
+        import requests
+
+        self.raw_alerts_collection_handler = raw_alerts_collection_handler
+        self.parsed_alerts_collection_handler = parsed_alerts_collection_handler
+        self.locations_collection_handler = locations_collection_handler
+        self.url = url or config.urls.tzevaadom_history_api
+        self.max_workers = max_workers or config.backfill.max_workers
+        self.max_pages = max_pages or config.backfill.max_pages
+        self.request_timeout_sec = request_timeout_sec or config.backfill.request_timeout_sec
+        self._rate_limiter = RateLimiter(requests_per_sec or config.backfill.requests_per_sec)
+        self._session = requests.Session()
+
+    def fetch_page(self, page: int) -> list[dict[str, Any]]:
+        self._rate_limiter.acquire()
+        response = self._session.get(self.url, params={"page": page}, timeout=self.request_timeout_sec)
+        response.raise_for_status()
+        return normalize_history_items(response.json() or [])
+
+    def fetch_range(self, start: int, end: int) -> list[AnyRedAlertNotification]:
+        """
+        Fetches every alert with `start <= time <= end` from the history endpoint.
+
+        Args:
+            start (int): Unix time of the beginning of the range.
+            end (int): Unix time of the end of the range.
+
+        Returns:
+            The parsed notifications in the range, possibly with duplicates across pages.
+        """
+        notifications = []
+        page = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="backfill") as executor:
+            while page < self.max_pages:
+                pages = range(page, min(page + self.max_workers, self.max_pages))
+                reached_start = False
+                for alerts in executor.map(self.fetch_page, pages):
+                    if not alerts:
+                        reached_start = True
+                        continue
+                    for alert in alerts:
+                        if start <= alert.get("time", 0) <= end:
+                            try:
+                                notifications.append(parse_notification(alert))
+                            except ValueError as e:
+                                logger.warning(f"Skipping malformed history alert {alert}. reason: {e}")
+                    if min(alert.get("time", 0) for alert in alerts) < start:
+                        reached_start = True
+                if reached_start:
+                    break
+                page = pages.stop
+        return notifications
+
+    def drop_known(self, notifications: list[AnyRedAlertNotification], start: int,
+                   end: int) -> list[AnyRedAlertNotification]:
+        """
+        Drops the notifications whose content matches a stored notification in [start, end] or an earlier one
+        of `notifications`.
+        """
+        seen = {content_key(stored["time"], stored["threat"], stored["cities"])
+                for stored in self.raw_alerts_collection_handler.iter_notifications(start, end)}
+        new_notifications = []
+        for notification in notifications:
+            key = content_key(notification.time, notification.threat, notification.cities)
+            if key not in seen:
+                seen.add(key)
+                new_notifications.append(notification)
+        return new_notifications
+
+    def backfill(self, start: int, end: Optional[int] = None) -> BackfillResult:
+        end = end if end is not None else int(time.time())
+        logger.info(f"Backfilling alerts between {start} and {end} from {self.url}")
+        fetched = self.fetch_range(start, end)
+        notifications = self.drop_known(fetched, start, end)
+
+        result = BackfillResult(fetched=len(fetched), already_stored=len(fetched) - len(notifications))
+        result.raw_ids = self.raw_alerts_collection_handler.add_multiple_new_notifications(notifications)
+        result.parsed_ids = self.parsed_alerts_collection_handler.add_multiple_new_notifications_from_raw(
+            notifications)
+        for city in {city for notification in notifications for city in notification.cities}:
+            if location_id := self.locations_collection_handler.add_new_city_location(city):
+                result.location_ids.append(location_id)
+
+        logger.info(f"Backfill done. fetched: {result.fetched}, already stored: {result.already_stored}, "
+                    f"raw added: {len(result.raw_ids)}, parsed added: {len(result.parsed_ids)}, "
+                    f"locations added: {len(result.location_ids)}")
+        return result
+
+    def backfill_gap(self, end: Optional[int] = None) -> Optional[BackfillResult]:
+        """
+        Backfills from the newest stored alert up to `end` (default: now).
+
+        Returns:
+            The backfill result, or None if nothing is stored yet (there is no gap to anchor on).
+        """
+        latest = self.raw_alerts_collection_handler.find_latest_notification()
+        if not latest:
+            logger.info("No stored alerts found, skipping gap backfill")
+            return None
+        return self.backfill(latest["time"] + 1, end)
+
+
+class GapBackfill:
+    """
+    Backfills the alerts a running listener missed: on startup, the gap since the newest stored alert, and after
+    an outage (network or API), the time between the last successful poll and the next one.
+
+    Backfills run on a background thread, one at a time, so the poll loop never waits for them. A failed backfill
+    is logged, and the gap stays missing until the history is backfilled by hand.
+
+    Attributes:
+        min_outage_sec (float): Shorter outages are not backfilled; the live feed keeps serving an alert for a
+            while after it was issued, so its next poll still returns what was missed.
+    """
+
+    def __init__(self, backfiller: HistoryBackfiller, min_outage_sec: Optional[float] = None):
+        self.backfiller = backfiller
+        self.min_outage_sec = config.backfill.min_outage_sec if min_outage_sec is None else min_outage_sec
+        self.last_successful_poll: Optional[float] = None
+        self._lock = threading.Lock()  # runs the backfills one at a time
+
+    def start(self, backfill_since_latest: bool) -> None:
+        """
+        Marks the start of polling; call before the first poll. With `backfill_since_latest`, the gap from the
+        newest stored alert is backfilled, anchored now, so alerts of the first polls cannot cover it up.
+        """
+        now = time.time()
+        self.last_successful_poll = now
+        if not backfill_since_latest:
+            return
+        latest = self.backfiller.raw_alerts_collection_handler.find_latest_notification()
+        if not latest:
+            logger.info("No stored alerts found, skipping gap backfill")
+            return
+        self._backfill_in_background(latest["time"] + 1, int(now))
+
+    def poll_succeeded(self, poll_time: float, backfill: bool = True) -> None:
+        """
+        Records a successful poll, backfilling the outage before it if it was long enough and `backfill` is set
+        (e.g. only on the leader of coordinated listeners).
+        """
+        if self.last_successful_poll is None or poll_time <= self.last_successful_poll:
+            return
+        outage_sec = poll_time - self.last_successful_poll
+        if backfill and outage_sec > self.min_outage_sec:
+            logger.warning(f"No successful poll for {outage_sec:.0f}s, backfilling the gap")
+            self._backfill_in_background(int(self.last_successful_poll), int(poll_time))
+        self.last_successful_poll = poll_time
+
+    def _backfill_in_background(self, start: int, end: int) -> None:
+        threading.Thread(target=self._backfill_logged, args=(start, end), name="backfill", daemon=True).start()
+
+    def _backfill_logged(self, start: int, end: int) -> None:
+        with self._lock:
+            try:
+                self.backfiller.backfill(start, end)
+            except Exception as e:
+                logger.error(f"Failed to backfill alerts between {start} and {end}. {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill alerts from the tzevaadom history endpoint")
+    parser.add_argument("--start", type=int, default=None, help="Unix time to backfill from (default: latest stored)")
+    parser.add_argument("--end", type=int, default=None, help="Unix time to backfill to (default: now)")
+    parser.add_argument("--url", default=None, help="History endpoint (default: urls.tzevaadom_history_api)")
+    args = parser.parse_args()
+
+    backfiller = HistoryBackfiller(RawAlertsLocationHandler(), ParsedAlertsCollectionHandler(),
+                                   LocationsCollectionHandler(), url=args.url)
+    if args.start is not None:
+        backfiller.backfill(args.start, args.end)
+    else:
+        backfiller.backfill_gap(args.end)
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+import functools
 import os
+from typing import Optional
 
 from DEFINITIONS import ROOT_DIR
 from red_alerts_listener.backend.yaml_parser import YamlFileProcessor
@@ -12,6 +14,10 @@ class AppConfig:
     version: str
     log_file: str
     debug: bool
+    log_mode: str = "sync"  # sync | queue
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rate_limit_per_sec: float = 0
 
 
 @dataclass
@@ -24,25 +30,208 @@ class MongoDatabaseConfig:
     raw_notifications_collection: str
     parsed_notifications_collection: str
     locations_collection: str
+    raw_notifications_storage: str = "standard"  # standard | timeseries
+    timeseries_granularity: str = "seconds"
+    server_selection_timeout_ms: Optional[int] = None
 
 
 @dataclass
 class URLS:
     tzevaadom_api: str
+    tzevaadom_history_api: str = ""
+
+
+@dataclass
+class PollingConfig:
+    interval_in_sec: float
+    request_timeout_sec: float
+    hedge_enabled: bool
+    hedge_percentile: float
+    hedge_min_delay_sec: float
+    latency_report_interval_sec: float
+
+
+@dataclass
+class BackfillConfig:
+    on_startup: bool
+    after_outage: bool
+    min_outage_sec: float
+    max_workers: int
+    requests_per_sec: float
+    max_pages: int
+    request_timeout_sec: float
+
+
+@dataclass
+class CoordinationConfig:
+    enabled: bool
+    lease_collection: str
+    heartbeat_interval_sec: float
+    lease_ttl_sec: float
+
+
+@dataclass
+class PipelineConfig:
+    fetch_workers: int
+    persist_workers: int
+    geocode_workers: int
+    queue_size: int
+    restart_backoff_initial_sec: float
+    restart_backoff_max_sec: float
+    shutdown_timeout_sec: float
+
+
+@dataclass
+class IngestQueueConfig:
+    maxsize: int
+    policy: str  # block | coalesce | spill
+    spill_path: str
+    persist_batch_size: int
+
+
+@dataclass
+class MaterializerConfig:
+    enabled: bool
+    name: str
+    state_collection: str
+    rollups_collection: str
+    batch_size: int
+    max_await_time_ms: int
+
+
+@dataclass
+class RetentionConfig:
+    enabled: bool
+    max_age_days: int
+    archive_dir: str
+    block_size: int
+    delete_batch_size: int
+
+
+@dataclass
+class GazetteerConfig:
+    enabled: bool
+    path: str
+    fuzzy_threshold: float
+    fuzzy_margin: float
+    online_fallback: bool
+
+
+@dataclass
+class SubscriptionsConfig:
+    enabled: bool
+    collection: str
+    refresh_interval_sec: float
+    geo_cell_deg: float
+    batch_max_size: int
+    batch_max_wait_ms: int
+    delivery_workers: int
+    pool_maxsize: int
+    request_timeout_sec: float
+    max_pending_per_target: int
+
+
+@dataclass
+class DependencyPolicy:
+    max_attempts: int = 3  # including the first call
+    base_delay_sec: float = 0.5
+    max_delay_sec: float = 4.0
+    deadline_sec: float = 10.0  # total time of all the attempts of one call, 0 for none
+    failure_threshold: int = 5  # consecutive failures that open the breaker
+    reset_timeout_sec: float = 30.0
+    retry_budget_ratio: float = 0.2
+    retry_budget_min_per_sec: float = 1.0
+
+
+@dataclass
+class ResilienceConfig:
+    geocoder: DependencyPolicy
+    mongodb: DependencyPolicy
+    alerts_api: DependencyPolicy
+    webhooks: DependencyPolicy
+
+    def __post_init__(self):
+        # Each dependency is a nested section, which the YAML processor hands over as a dict
+        for name in ("geocoder", "mongodb", "alerts_api", "webhooks"):
+            if isinstance(getattr(self, name), dict):
+                setattr(self, name, DependencyPolicy(**getattr(self, name)))
+
+
+@dataclass
+class MetricsConfig:
+    host: str
+    listener_port: int
 
 
 class AlertConfig:
+    """
+    The application configuration. config.yaml is only read when a section is first accessed,
+    so importing this module has no side effects.
+    """
 
     def __init__(self, file_path: str):
-        try:
-            self.processor = YamlFileProcessor(file_path)
-        except (FileNotFoundError, ValueError) as e:
-            print(f"Error: {e}")
+        self.file_path = file_path
+
+    @functools.cached_property
+    def processor(self) -> YamlFileProcessor:
+        return YamlFileProcessor(self.file_path)
+
+    # Sections, each parsed on first access
+    @functools.cached_property
+    def app(self) -> AppConfig:
+        return self.parse_app_section()
+
+    @functools.cached_property
+    def mongodb(self) -> MongoDatabaseConfig:
+        return self.parse_mongodb_section()
+
+    @functools.cached_property
+    def urls(self) -> URLS:
+        return self.parse_urls_section()
+
+    @functools.cached_property
+    def metrics(self) -> MetricsConfig:
+        return self.parse_metrics_section()
+
+    @functools.cached_property
+    def polling(self) -> PollingConfig:
+        return self.parse_polling_section()
+
+    @functools.cached_property
+    def backfill(self) -> BackfillConfig:
+        return self.parse_backfill_section()
+
+    @functools.cached_property
+    def coordination(self) -> CoordinationConfig:
+        return self.parse_coordination_section()
+
+    @functools.cached_property
+    def pipeline(self) -> PipelineConfig:
+        return self.parse_pipeline_section()
 
-        # Parsing section
-        self.app = self.parse_app_section()
-        self.mongodb = self.parse_mongodb_section()
-        self.urls = self.parse_urls_section()
+    @functools.cached_property
+    def ingest_queue(self) -> IngestQueueConfig:
+        return self.parse_ingest_queue_section()
+
+    @functools.cached_property
+    def materializer(self) -> MaterializerConfig:
+        return self.parse_materializer_section()
+
+    @functools.cached_property
+    def retention(self) -> RetentionConfig:
+        return self.parse_retention_section()
+
+    @functools.cached_property
+    def gazetteer(self) -> GazetteerConfig:
+        return self.parse_gazetteer_section()
+
+    @functools.cached_property
+    def resilience(self) -> ResilienceConfig:
+        return self.parse_resilience_section()
+
+    @functools.cached_property
+    def subscriptions(self) -> SubscriptionsConfig:
+        return self.parse_subscriptions_section()
 
     def parse_app_section(self, section: str = 'app') -> AppConfig:
         return self.processor.parse_to_object(section=section, obj_class=AppConfig)
@@ -53,5 +242,38 @@ class AlertConfig:
     def parse_urls_section(self, section: str = 'urls') -> URLS:
         return self.processor.parse_to_object(section=section, obj_class=URLS)
 
+    def parse_metrics_section(self, section: str = 'metrics') -> MetricsConfig:
+        return self.processor.parse_to_object(section=section, obj_class=MetricsConfig)
+
+    def parse_polling_section(self, section: str = 'polling') -> PollingConfig:
+        return self.processor.parse_to_object(section=section, obj_class=PollingConfig)
+
+    def parse_backfill_section(self, section: str = 'backfill') -> BackfillConfig:
+        return self.processor.parse_to_object(section=section, obj_class=BackfillConfig)
+
+    def parse_coordination_section(self, section: str = 'coordination') -> CoordinationConfig:
+        return self.processor.parse_to_object(section=section, obj_class=CoordinationConfig)
+
+    def parse_pipeline_section(self, section: str = 'pipeline') -> PipelineConfig:
+        return self.processor.parse_to_object(section=section, obj_class=PipelineConfig)
+
+    def parse_ingest_queue_section(self, section: str = 'ingest_queue') -> IngestQueueConfig:
+        return self.processor.parse_to_object(section=section, obj_class=IngestQueueConfig)
+
+    def parse_materializer_section(self, section: str = 'materializer') -> MaterializerConfig:
+        return self.processor.parse_to_object(section=section, obj_class=MaterializerConfig)
+
+    def parse_retention_section(self, section: str = 'retention') -> RetentionConfig:
+        return self.processor.parse_to_object(section=section, obj_class=RetentionConfig)
+
+    def parse_gazetteer_section(self, section: str = 'gazetteer') -> GazetteerConfig:
+        return self.processor.parse_to_object(section=section, obj_class=GazetteerConfig)
+
+    def parse_resilience_section(self, section: str = 'resilience') -> ResilienceConfig:
+        return self.processor.parse_to_object(section=section, obj_class=ResilienceConfig)
+
+    def parse_subscriptions_section(self, section: str = 'subscriptions') -> SubscriptionsConfig:
+        return self.processor.parse_to_object(section=section, obj_class=SubscriptionsConfig)
+
 
 config = AlertConfig(os.path.join(ROOT_DIR, "config.yaml"))
@@ -0,0 +1,102 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Type
+
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.logger import logger
+from red_alerts_listener.backend.mongo_adapter import MongoDBAdapter
+
+
+class ListenerCoordinator:
+    """
+    Coordinates redundant listener instances through a shared Mongo lease collection.
+
+    Every instance keeps a lease document alive with periodic heartbeats. The live instances, ordered by
+    node id, each get a slot; an instance in slot `i` out of `n` shifts its poll phase by `i * interval / n`,
+    so together they sample the API `n` times per interval while each instance keeps its own request rate.
+    The instance in slot 0 is the leader and runs singleton jobs such as the startup backfill.
+
+    Poll phases are aligned to the wall clock, so the nodes' clocks are assumed to be NTP-synchronized.
+
+    An instance releases its lease when stopped. A TTL index on `expires_at` has MongoDB delete the leases of
+    instances that died without stopping, once they expire.
+    """
+    BASE_URI = 'mongodb'
+
+    def __init__(self, adapter: Type[MongoDBAdapter] = MongoDBAdapter,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 collection: Optional[str] = None,
+                 db_name: Optional[str] = None,
+                 node_id: Optional[str] = None,
+                 heartbeat_interval_sec: Optional[float] = None,
+                 lease_ttl_sec: Optional[float] = None) -> None:
+        self._uri = adapter.build_connection_uri(self.BASE_URI, host or config.mongodb.host,
+                                                 port or config.mongodb.port)
+        self._db_name = db_name or config.mongodb.db_name
+        self.adapter = adapter(self._uri, self._db_name)
+        self.collection = collection or config.coordination.lease_collection
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.heartbeat_interval_sec = heartbeat_interval_sec or config.coordination.heartbeat_interval_sec
+        self.lease_ttl_sec = lease_ttl_sec or config.coordination.lease_ttl_sec
+        self._slot = (0, 1)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def slot(self) -> tuple[int, int]:
+        """The (index, count) of this instance among the live instances, as of the last heartbeat."""
+        return self._slot
+
+    @property
+    def is_leader(self) -> bool:
+        return self._slot[0] == 0
+
+    def heartbeat(self) -> tuple[int, int]:
+        now = datetime.now(timezone.utc)
+        self.adapter.upsert_one(self.collection, {"_id": self.node_id}, {
+            "$set": {"heartbeat_at": now,
+                     "expires_at": now + timedelta(seconds=self.lease_ttl_sec),
+                     "host": socket.gethostname(),
+                     "pid": os.getpid()}
+        })
+        live_nodes = sorted(document["_id"] for document in
+                            self.adapter.find_all(self.collection, {"expires_at": {"$gt": now}}))
+        if self.node_id not in live_nodes:  # Our own lease can only be missing if the clock jumped
+            live_nodes = sorted(live_nodes + [self.node_id])
+        slot = (live_nodes.index(self.node_id), len(live_nodes))
+        if slot != self._slot:
+            logger.info(f"Listener {self.node_id} moved to slot {slot[0] + 1}/{slot[1]}")
+        self._slot = slot
+        return slot
+
+    def phase_offset(self, interval_in_sec: float) -> float:
+        index, count = self._slot
+        return interval_in_sec * index / count
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop_event.wait(self.heartbeat_interval_sec):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"Listener {self.node_id} failed to renew its lease. reason: {e}")
+
+    def start(self) -> "ListenerCoordinator":
+        self.adapter.create_index(self.collection, [("expires_at", 1)], expire_after_sec=0)
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat_interval_sec)
+        try:
+            self.adapter.delete_one(self.collection, {"_id": self.node_id})
+        except Exception as e:
+            # The TTL index removes the lease once it expires
+            logger.warning(f"Listener {self.node_id} failed to release its lease. reason: {e}")
@@ -1,13 +1,53 @@
 import abc
-from datetime import datetime
-from typing import Type, Optional, Any, Union
+import itertools
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Iterator, Type, Optional, Any, Union
 
+from red_alerts_listener.backend import metrics
+from red_alerts_listener.backend.archive import SegmentArchive, merge_sorted
 from red_alerts_listener.backend.config_reader import config
 from red_alerts_listener.backend.logger import logger
 
+from red_alerts_listener.backend.fast_parser import AnyRedAlertNotification
 from red_alerts_listener.backend.mongo_adapter import MongoDBAdapter
 from red_alerts_listener.backend.object_builders import LocationBuilder, ParsedNotificationBuilder
-from red_alerts_listener.backend.schemas import RedAlertNotification, SavedNotification
+
+if TYPE_CHECKING:
+    from red_alerts_listener.backend.schemas import SavedNotification
+
+
+STANDARD_STORAGE = "standard"
+TIME_SERIES_STORAGE = "timeseries"
+# In time-series storage the fields notifications are bucketed by are nested under the metaField
+TIME_SERIES_META_FIELD = "meta"
+TIME_SERIES_META_KEYS = ("threat", "isDrill")
+
+
+def _as_unix(value: Union[int, datetime]) -> int:
+    if not isinstance(value, datetime):
+        return value
+    # pymongo returns naive datetimes in UTC
+    return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+
+
+def notification_key(notification: dict[str, Any]) -> tuple[int, str]:
+    return notification["time"], notification["notificationId"]
+
+
+def to_time_series_document(notification: dict[str, Any]) -> dict[str, Any]:
+    """Converts a raw notification to its time-series layout: a BSON date `time` and a `meta` of threat/isDrill."""
+    document = {key: value for key, value in notification.items() if key not in TIME_SERIES_META_KEYS}
+    document["time"] = datetime.fromtimestamp(notification["time"], timezone.utc)
+    document[TIME_SERIES_META_FIELD] = {key: notification[key] for key in TIME_SERIES_META_KEYS if key in notification}
+    return document
+
+
+def from_time_series_document(document: dict[str, Any]) -> dict[str, Any]:
+    """The inverse of to_time_series_document."""
+    notification = {key: value for key, value in document.items() if key != TIME_SERIES_META_FIELD}
+    notification.update(document.get(TIME_SERIES_META_FIELD) or {})
+    notification["time"] = _as_unix(document["time"])
+    return notification
 
 
 class AbcAlertsDataBaseHandlers(abc.ABC):
@@ -36,104 +76,344 @@ class LocationsCollectionHandler:
     BASE_URI = 'mongodb'
 
     def __init__(self, adapter: Type[MongoDBAdapter] = MongoDBAdapter,
-                 host: str = config.mongodb.host,
-                 port: int = config.mongodb.port,
-                 collection: str = config.mongodb.locations_collection,
-                 db_name: str = config.mongodb.db_name,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 collection: Optional[str] = None,
+                 db_name: Optional[str] = None,
                  set_new_index_key: Optional[str] = None) -> None:
-        self._uri = adapter.build_connection_uri(self.BASE_URI, host, port)
-        self._db_name = db_name
+        # Defaults are resolved here rather than in the signature, so importing the module does not read config
+        self._uri = adapter.build_connection_uri(
+            self.BASE_URI, host or config.mongodb.host, port or config.mongodb.port,
+            server_selection_timeout_ms=config.mongodb.server_selection_timeout_ms)
+        self._db_name = db_name or config.mongodb.db_name
         self.adapter = adapter(self._uri, self._db_name)
-        self.collection = collection
+        self.collection = collection or config.mongodb.locations_collection
         if set_new_index_key:
-            self.adapter.add_new_index_key(collection, set_new_index_key)
+            self.adapter.add_new_index_key(self.collection, set_new_index_key)
+
+    def _insert_if_absent(self, query: dict[str, Any], document: dict[str, Any]) -> Optional[str]:
+        with metrics.STAGE_LATENCY.time(stage="insert"):
+            inserted_id = self.adapter.insert_if_absent(self.collection, query, document)
+        if inserted_id:
+            metrics.DOCUMENTS_INSERTED.labels(collection=self.collection).inc()
+        return inserted_id
 
     def find_location_by_city(self, city: str) -> Optional[dict[str, Any]]:
         query = {"location": city}
         return self.adapter.find_one(self.collection, query)
 
-    def add_new_city_location(self, city: str) -> Optional[str]:
-        if not self.find_location_by_city(city):
-            geo_location = LocationBuilder.build_location_for_city(city)
-            if geo_location.lon and geo_location.lat:
+    def store_city_location(self, city: str) -> tuple[Optional[str], bool]:
+        """
+        Geocodes and stores the location of a city that has none yet.
+
+        Returns:
+            The id of the inserted location (None if none was inserted), and whether the city has a stored
+            location now; it has none only when its coordinates could not be resolved
+        """
+        with metrics.STAGE_LATENCY.time(stage="dedupe_lookup"):
+            existing_location = self.find_location_by_city(city)
+        if not existing_location:
+            with metrics.STAGE_LATENCY.time(stage="geocode"):
+                geo_location = LocationBuilder.build_location_for_city(city)
+            if not (geo_location.lon and geo_location.lat):
+                # Not stored, so the city is looked up again the next time it appears
+                logger.warning(f"Could not resolve the coordinates of {city}")
+                metrics.GEOCODE_MISSES.inc()
+                return None, False
+            if inserted_id := self._insert_if_absent({"location": city}, geo_location.dict()):
                 logger.info(f"Added location: {geo_location}")
-                return self.adapter.insert_one(self.collection, geo_location.dict())
+                return inserted_id, True
         logger.info(f"city {city} already exists in the collection")
-        return None
+        metrics.DUPLICATES_SKIPPED.labels(collection=self.collection).inc()
+        return None, True
+
+    def add_new_city_location(self, city: str) -> Optional[str]:
+        return self.store_city_location(city)[0]
 
 
 class RawAlertsLocationHandler:
+    """
+    Stores the raw notifications, either as regular documents or, with the "timeseries" storage, in a time-series
+    collection with `time` as its timeField and threat/isDrill as its metaField. The storage layout stays inside
+    this handler: every method takes and returns notifications in the API's shape, with `time` in unix seconds.
+
+    Time-series collections support neither upserts nor unique indexes, so there a single notification is
+    deduplicated by a lookup before the insert, and concurrent writers may store a notification twice;
+    iter_notifications drops such duplicates.
+    """
     BASE_URI = 'mongodb'
 
     def __init__(self, adapter: Type[MongoDBAdapter] = MongoDBAdapter,
-                 host: str = config.mongodb.host,
-                 port: int = config.mongodb.port,
-                 collection: str = config.mongodb.raw_notifications_collection,
-                 db_name: str = config.mongodb.db_name,
-                 set_new_index_key: Optional[str] = None) -> None:
-        self._uri = adapter.build_connection_uri(self.BASE_URI, host, port)
-        self._db_name = db_name
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 collection: Optional[str] = None,
+                 db_name: Optional[str] = None,
+                 set_new_index_key: Optional[str] = None,
+                 archive: Optional[SegmentArchive] = None,
+                 storage: Optional[str] = None) -> None:
+        self._uri = adapter.build_connection_uri(
+            self.BASE_URI, host or config.mongodb.host, port or config.mongodb.port,
+            server_selection_timeout_ms=config.mongodb.server_selection_timeout_ms)
+        self._db_name = db_name or config.mongodb.db_name
         self.adapter = adapter(self._uri, self._db_name)
-        self.collection = collection
-        if set_new_index_key:
-            self.adapter.add_new_index_key(collection, set_new_index_key)
+        self.collection = collection or config.mongodb.raw_notifications_collection
+        # Notifications moved out of the collection by the retention job; the read queries include them
+        self.archive = archive or SegmentArchive.for_collection(self.collection)
+        self.storage = storage or config.mongodb.raw_notifications_storage
+        if self.storage not in (STANDARD_STORAGE, TIME_SERIES_STORAGE):
+            raise ValueError(f"Unknown raw notifications storage {self.storage!r}")
+        if self.time_series:
+            self._ensure_time_series_collection()
+            if set_new_index_key:
+                logger.warning(f"Time-series collections have no unique indexes, not indexing {set_new_index_key}")
+        elif set_new_index_key:
+            self.adapter.add_new_index_key(self.collection, set_new_index_key)
+
+    @property
+    def time_series(self) -> bool:
+        return self.storage == TIME_SERIES_STORAGE
+
+    def _ensure_time_series_collection(self) -> None:
+        self.adapter.create_time_series_collection(self.collection, "time", TIME_SERIES_META_FIELD,
+                                                   config.mongodb.timeseries_granularity)
+        if not self.adapter.is_time_series(self.collection):
+            raise ValueError(f"{self.collection} is a regular collection, convert it first with "
+                             f"`python -m red_alerts_listener.backend.storage_migration --to {TIME_SERIES_STORAGE}`")
+
+    # Conversions between the API's shape and the stored layout
+    def to_stored(self, notification: dict[str, Any]) -> dict[str, Any]:
+        return to_time_series_document(notification) if self.time_series else notification
+
+    def from_stored(self, document: dict[str, Any]) -> dict[str, Any]:
+        return from_time_series_document(document) if self.time_series else document
+
+    def stored_time(self, unix_time: Union[int, datetime]) -> Union[int, datetime]:
+        if self.time_series:
+            return datetime.fromtimestamp(_as_unix(unix_time), timezone.utc)
+        return unix_time
+
+    def _stored_field(self, field: str) -> str:
+        if self.time_series and field in TIME_SERIES_META_KEYS:
+            return f"{TIME_SERIES_META_FIELD}.{field}"
+        return field
+
+    def _insert_if_absent(self, query: dict[str, Any], document: dict[str, Any]) -> Optional[str]:
+        with metrics.STAGE_LATENCY.time(stage="insert"):
+            if not self.time_series:
+                inserted_id = self.adapter.insert_if_absent(self.collection, query, document)
+            elif self.adapter.find_one(self.collection, query) is None:
+                inserted_id = self.adapter.insert_one(self.collection, self.to_stored(document))
+            else:
+                inserted_id = None
+        if inserted_id:
+            metrics.DOCUMENTS_INSERTED.labels(collection=self.collection).inc()
+        return inserted_id
+
+    def _insert_many(self, documents: list[dict[str, Any]]) -> list[str]:
+        if not documents:
+            return []
+        with metrics.STAGE_LATENCY.time(stage="insert"):
+            inserted_ids = self.adapter.insert_many(self.collection, [self.to_stored(document)
+                                                                      for document in documents])
+        metrics.DOCUMENTS_INSERTED.labels(collection=self.collection).inc(len(inserted_ids))
+        return inserted_ids
 
     def get_all_notifications(self) -> list[dict]:
         query = {}
         results = self.adapter.find_all(self.collection, query=query)
-        return results
+        return [self.from_stored(document) for document in results]
 
     # Read only queries
     def find_notification_by_id(self, notification_id: str) -> Optional[dict[str, Any]]:
         query = {"notificationId": notification_id}
-        return self.adapter.find_one(self.collection, query)
+        document = self.adapter.find_one(self.collection, query)
+        return self.from_stored(document) if document else None
 
     def find_notifications_by_city(self, city: str):
         query = {"cities": {"$in": [city]}}
-        return self.adapter.find_all(self.collection, query)
+        archived = list(self.archive.iter_documents(city=city)) if self.archive else []
+        return archived + [self.from_stored(document) for document in self.adapter.find_all(self.collection, query)]
 
     def find_notification_by_datetime_range(self, start: Union[int, datetime],
                                             end: Union[int, datetime]) -> list[dict]:
-        results = self.adapter.find_by_range(self.collection, "time", start, end)
+        results = self.adapter.find_by_range(self.collection, "time", self.stored_time(start), self.stored_time(end))
+        results = [self.from_stored(document) for document in results]
+        if self.archive:
+            archived = self.archive.iter_documents(_as_unix(start), _as_unix(end))
+            results = list(archived) + results
         return results
 
+    def find_latest_notification(self) -> Optional[dict[str, Any]]:
+        document = self.adapter.find_latest(self.collection, "time")
+        return self.from_stored(document) if document else None
+
+    def ensure_query_indexes(self) -> None:
+        # Serve iter_notifications in (time, notificationId) order, with and without a city filter
+        self.adapter.create_index(self.collection, [("time", 1), ("notificationId", 1)])
+        self.adapter.create_index(self.collection, [("cities", 1), ("time", 1), ("notificationId", 1)])
+
+    def iter_notifications(self, start: Optional[int] = None, end: Optional[int] = None,
+                           city: Optional[str] = None, threat: Optional[int] = None,
+                           after: Optional[tuple[int, str]] = None, limit: int = 0,
+                           batch_size: int = 500) -> Iterator[dict[str, Any]]:
+        """
+        Lazily iterates notifications ordered by (time, notificationId), without their Mongo `_id`.
+
+        Pagination is keyset based: pass the (time, notificationId) of the last notification of a page as
+        `after` to continue right after it. Unlike skip/offset, this costs the same on every page and does not
+        skip or repeat notifications inserted between requests.
+
+        Args:
+            start: Only notifications with time >= start (unix seconds)
+            end: Only notifications with time <= end (unix seconds)
+            city: Only notifications that include this city
+            threat: Only notifications of this threat type
+            after: The (time, notificationId) keyset cursor to continue after
+            limit: Maximum number of notifications (0 for no limit)
+            batch_size: Number of notifications fetched from the server per round trip
+
+        Returns:
+            An iterator over the matching notifications, archived ones included
+        """
+        query: dict[str, Any] = {}
+        time_range = {operator: self.stored_time(value)
+                      for operator, value in (("$gte", start), ("$lte", end)) if value is not None}
+        if time_range:
+            query["time"] = time_range
+        if city:
+            query["cities"] = city
+        if threat is not None:
+            query[self._stored_field("threat")] = threat
+        if after:
+            after_time, after_id = self.stored_time(after[0]), after[1]
+            query["$or"] = [{"time": {"$gt": after_time}}, {"time": after_time, "notificationId": {"$gt": after_id}}]
+        # A time-series collection may hold duplicates that merge_sorted drops, so its cursor is not limited
+        hot = self.adapter.find_iter(self.collection, query, sort=[("time", 1), ("notificationId", 1)],
+                                     limit=0 if self.time_series else limit, projection={"_id": 0},
+                                     batch_size=batch_size)
+        if self.time_series:
+            hot = itertools.islice(merge_sorted(map(self.from_stored, hot), key=notification_key), limit or None)
+        if not self.archive:
+            return hot
+        archived = self.archive.iter_documents(start, end, city=city, after=after)
+        if threat is not None:
+            archived = (notification for notification in archived if notification.get("threat") == threat)
+        return itertools.islice(merge_sorted(archived, hot, key=notification_key), limit or None)
+
+    def find_existing_notification_ids(self, notification_ids: list[str]) -> set[str]:
+        query = {"notificationId": {"$in": notification_ids}}
+        return {document["notificationId"] for document in self.adapter.find_all(self.collection, query)}
+
     # Crud
-    def add_new_notification(self, notification: RedAlertNotification) -> Optional[str]:
-        if not self.find_notification_by_id(notification.notificationId):
-            return self.adapter.insert_one(self.collection, notification.dict())
-        return None
+    def add_multiple_new_notifications(self, notifications: list[AnyRedAlertNotification]) -> list[str]:
+        """
+        Bulk-inserts the notifications that are not stored yet, deduplicating by notificationId.
+
+        Args:
+            notifications: RedAlertNotification or FastRedAlertNotification objects
+
+        Returns:
+            The ids (_id) of the inserted documents
+        """
+        unique_notifications = {notification.notificationId: notification for notification in notifications}
+        if not unique_notifications:
+            return []
+        with metrics.STAGE_LATENCY.time(stage="dedupe_lookup"):
+            existing_ids = self.find_existing_notification_ids(list(unique_notifications))
+        documents = [notification.dict() for notification_id, notification in unique_notifications.items()
+                     if notification_id not in existing_ids]
+        metrics.DUPLICATES_SKIPPED.labels(collection=self.collection).inc(len(unique_notifications) - len(documents))
+        return self._insert_many(documents)
+
+    def add_new_notification(self, notification: AnyRedAlertNotification) -> Optional[str]:
+        inserted_id = self._insert_if_absent({"notificationId": notification.notificationId}, notification.dict())
+        if not inserted_id:
+            metrics.DUPLICATES_SKIPPED.labels(collection=self.collection).inc()
+        return inserted_id
 
 
 class ParsedAlertsCollectionHandler:
     BASE_URI = 'mongodb'
 
     def __init__(self, adapter: Type[MongoDBAdapter] = MongoDBAdapter,
-                 host: str = config.mongodb.host,
-                 port: int = config.mongodb.port,
-                 collection: str = config.mongodb.parsed_notifications_collection,
-                 db_name: str = config.mongodb.db_name,
-                 set_new_index_key: Optional[str] = None) -> None:
-        self._uri = adapter.build_connection_uri(self.BASE_URI, host, port)
-        self._db_name = db_name
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 collection: Optional[str] = None,
+                 db_name: Optional[str] = None,
+                 set_new_index_key: Optional[str] = None,
+                 archive: Optional[SegmentArchive] = None) -> None:
+        self._uri = adapter.build_connection_uri(
+            self.BASE_URI, host or config.mongodb.host, port or config.mongodb.port,
+            server_selection_timeout_ms=config.mongodb.server_selection_timeout_ms)
+        self._db_name = db_name or config.mongodb.db_name
         self.adapter = adapter(self._uri, self._db_name)
-        self.collection = collection
+        self.collection = collection or config.mongodb.parsed_notifications_collection
+        self.archive = archive or SegmentArchive.for_collection(
+            self.collection, time_field="raw_notification.time", id_field="raw_notification.notificationId",
+            cities_field="raw_notification.cities")
         if set_new_index_key:
-            self.adapter.add_new_index_key(collection, set_new_index_key)
+            self.adapter.add_new_index_key(self.collection, set_new_index_key)
+
+    # Parsed notifications are always stored as regular documents, in the API's shape
+    @staticmethod
+    def from_stored(document: dict[str, Any]) -> dict[str, Any]:
+        return document
+
+    @staticmethod
+    def stored_time(unix_time: int) -> int:
+        return unix_time
+
+    def _insert_if_absent(self, query: dict[str, Any], document: dict[str, Any]) -> Optional[str]:
+        with metrics.STAGE_LATENCY.time(stage="insert"):
+            inserted_id = self.adapter.insert_if_absent(self.collection, query, document)
+        if inserted_id:
+            metrics.DOCUMENTS_INSERTED.labels(collection=self.collection).inc()
+        return inserted_id
+
+    def _insert_many(self, documents: list[dict[str, Any]]) -> list[str]:
+        if not documents:
+            return []
+        with metrics.STAGE_LATENCY.time(stage="insert"):
+            inserted_ids = self.adapter.insert_many(self.collection, documents)
+        metrics.DOCUMENTS_INSERTED.labels(collection=self.collection).inc(len(inserted_ids))
+        return inserted_ids
 
     def find_notification_by_id(self, notification_id: str) -> Optional[dict[str, Any]]:
         query = {"raw_notification.notificationId": notification_id}
         return self.adapter.find_one(self.collection, query)
 
-    def add_new_notification(self, notification_to_db: SavedNotification) -> Optional[str]:
-        if not self.find_notification_by_id(notification_to_db.raw_notification.notificationId):
-            return self.adapter.insert_one(self.collection, notification_to_db.dict())
+    def find_existing_notification_ids(self, notification_ids: list[str]) -> set[str]:
+        query = {"raw_notification.notificationId": {"$in": notification_ids}}
+        return {document["raw_notification"]["notificationId"]
+                for document in self.adapter.find_all(self.collection, query)}
+
+    def add_multiple_new_notifications_from_raw(self, raw_notifications: list[AnyRedAlertNotification]) -> list[str]:
+        unique_notifications = {notification.notificationId: notification for notification in raw_notifications}
+        if not unique_notifications:
+            return []
+        with metrics.STAGE_LATENCY.time(stage="dedupe_lookup"):
+            existing_ids = self.find_existing_notification_ids(list(unique_notifications))
+        documents = [ParsedNotificationBuilder.build_document_from_raw(notification)
+                     for notification_id, notification in unique_notifications.items()
+                     if notification_id not in existing_ids]
+        metrics.DUPLICATES_SKIPPED.labels(collection=self.collection).inc(len(unique_notifications) - len(documents))
+        return self._insert_many(documents)
+
+    def add_new_notification(self, notification_to_db: "SavedNotification") -> Optional[str]:
+        notification_id = notification_to_db.raw_notification.notificationId
+        if inserted_id := self._insert_if_absent({"raw_notification.notificationId": notification_id},
+                                                 notification_to_db.dict()):
+            return inserted_id
         logger.info(f"Notification with {notification_to_db.raw_notification.notificationId} already exists")
+        metrics.DUPLICATES_SKIPPED.labels(collection=self.collection).inc()
         return None
 
-    def add_new_notification_from_raw(self, raw_notification: RedAlertNotification) -> Optional[str]:
-        if not self.find_notification_by_id(raw_notification.notificationId):
-            notification_to_db = ParsedNotificationBuilder.build_from_raw_notification(raw_notification)
-            logger.info(f"Adding {notification_to_db} to the collection")
-            return self.adapter.insert_one(self.collection, notification_to_db.dict())
+    def add_new_notification_from_raw(self, raw_notification: AnyRedAlertNotification) -> Optional[str]:
+        notification_to_db = ParsedNotificationBuilder.build_document_from_raw(raw_notification)
+        if inserted_id := self._insert_if_absent({"raw_notification.notificationId": raw_notification.notificationId},
+                                                 notification_to_db):
+            logger.info(f"Added {notification_to_db} to the collection")
+            return inserted_id
         logger.info(f"Notification with {raw_notification.notificationId} already exists in collection")
+        metrics.DUPLICATES_SKIPPED.labels(collection=self.collection).inc()
         return None
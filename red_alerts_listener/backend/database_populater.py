@@ -1,10 +1,15 @@
+from typing import Optional
+
 from red_alerts_listener.backend.logger import logger
 from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler, RawAlertsLocationHandler, \
     ParsedAlertsCollectionHandler
-from red_alerts_listener.backend import schemas
+from red_alerts_listener.backend.fast_parser import parse_notifications
 
 
-def populate_all_collections_from_raw_notifications_collection():
+def populate_all_collections_from_raw_notifications_collection(
+        raw_notifications_handler: Optional[RawAlertsLocationHandler] = None,
+        parsed_notifications_handler: Optional[ParsedAlertsCollectionHandler] = None,
+        locations_handler: Optional[LocationsCollectionHandler] = None):
     """
     Populates the location and parsed_alerts collections with data collected by the listener from the Tzevaadom API.
 
@@ -20,22 +25,27 @@ def populate_all_collections_from_raw_notifications_collection():
     If there is an error during the population process, the function logs a warning but continues processing
     the remaining notifications.
 
+    Args:
+        raw_notifications_handler: Handler for the raw_notifications collection (default: built from config)
+        parsed_notifications_handler: Handler for the parsed_alerts collection (default: built from config)
+        locations_handler: Handler for the locations collection (default: built from config)
+
     Returns:
         tuple: A tuple of two lists:
             - List of IDs for the documents added to the `parsed_alerts` collection.
             - List of IDs for the documents added to the `locations` collection.
     """
     # initiate handlers
-    raw_notifications_handler = RawAlertsLocationHandler()
-    parsed_notifications_handler = ParsedAlertsCollectionHandler()
-    locations_handler = LocationsCollectionHandler()
+    raw_notifications_handler = raw_notifications_handler or RawAlertsLocationHandler()
+    parsed_notifications_handler = parsed_notifications_handler or ParsedAlertsCollectionHandler()
+    locations_handler = locations_handler or LocationsCollectionHandler()
 
     # all database ids arrays
     all_parsed_collection_ids = []
     all_loc_collection_ids = []
 
     all_raw_notifications = raw_notifications_handler.get_all_notifications()
-    raw_notifications = [schemas.RedAlertNotification.parse_obj(report) for report in all_raw_notifications]
+    raw_notifications = parse_notifications(all_raw_notifications)
 
     for raw_notification in raw_notifications:
         try:
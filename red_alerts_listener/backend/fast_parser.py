@@ -0,0 +1,119 @@
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Union
+
+if TYPE_CHECKING:
+    # pydantic is only imported once an alert needs the lenient fallback parser
+    from red_alerts_listener.backend.schemas import RedAlertNotification
+
+
+class FastRedAlertNotification:
+    """
+    A lightweight, slotted record mirroring RedAlertNotification for the hot poll loop.
+
+    It exposes the same attribute names and a compatible `dict()` method so the collection
+    handlers can consume it interchangeably with the pydantic model.
+    """
+    __slots__ = ("notificationId", "time", "threat", "isDrill", "cities")
+
+    def __init__(self, notificationId: str, time: int, threat: int, isDrill: bool, cities: list[str]):
+        self.notificationId = notificationId
+        self.time = time
+        self.threat = threat
+        self.isDrill = isDrill
+        self.cities = cities
+
+    def dict(self) -> dict[str, Any]:
+        return {
+            "notificationId": self.notificationId,
+            "time": self.time,
+            "threat": self.threat,
+            "isDrill": self.isDrill,
+            "cities": list(self.cities),
+        }
+
+    def __eq__(self, other: object) -> bool:
+        from red_alerts_listener.backend.schemas import RedAlertNotification
+
+        if isinstance(other, (FastRedAlertNotification, RedAlertNotification)):
+            return self.dict() == other.dict()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return (f"FastRedAlertNotification(notificationId={self.notificationId!r}, time={self.time!r}, "
+                f"threat={self.threat!r}, isDrill={self.isDrill!r}, cities={self.cities!r})")
+
+
+AnyRedAlertNotification = Union[FastRedAlertNotification, "RedAlertNotification"]
+
+
+def parse_notification_fast(alert: Any) -> Optional[FastRedAlertNotification]:
+    """
+    Validates a decoded alert in a single pass, accepting only exactly-typed payloads.
+
+    Anything that would need coercion (numeric strings, floats, ints used as booleans, etc.) is
+    rejected so that pydantic stays the single source of truth for the lenient cases.
+
+    Args:
+        alert: A decoded JSON object, as returned by the tzevaadom API.
+
+    Returns:
+        Optional[FastRedAlertNotification]: The record, or None if the payload is not strictly valid.
+    """
+    if type(alert) is not dict:
+        return None
+    try:
+        notification_id = alert["notificationId"]
+        time = alert["time"]
+        threat = alert["threat"]
+        is_drill = alert["isDrill"]
+        cities = alert["cities"]
+    except KeyError:
+        return None
+
+    if (type(notification_id) is not str
+            or type(time) is not int
+            or type(threat) is not int
+            or type(is_drill) is not bool
+            or type(cities) is not list):
+        return None
+    for city in cities:
+        if type(city) is not str:
+            return None
+
+    return FastRedAlertNotification(notification_id, time, threat, is_drill, list(cities))
+
+
+def parse_notification(alert: Any) -> AnyRedAlertNotification:
+    """
+    Parses an alert through the fast path, falling back to full pydantic validation.
+
+    Raises:
+        pydantic.ValidationError: If the payload is malformed.
+    """
+    notification = parse_notification_fast(alert)
+    if notification is not None:
+        return notification
+    from red_alerts_listener.backend.schemas import RedAlertNotification
+
+    return RedAlertNotification.parse_obj(alert)
+
+
+def parse_notifications(alerts: Iterable[Any]) -> list[AnyRedAlertNotification]:
+    return [parse_notification(alert) for alert in alerts]
+
+
+def parse_valid_notifications(alerts: Iterable[Any]) -> list[AnyRedAlertNotification]:
+    """
+    Parses alerts one by one, so a malformed alert is logged, counted and dropped on its own instead of failing
+    the whole batch.
+    """
+    from red_alerts_listener.backend import metrics
+    from red_alerts_listener.backend.logger import logger
+
+    notifications = []
+    for alert in alerts:
+        try:
+            notifications.append(parse_notification(alert))
+        except ValueError as e:  # pydantic's ValidationError is a ValueError
+            metrics.INVALID_ALERTS.inc()
+            logger.error(f"Dropping malformed alert {alert}. {e}")
+    return notifications
@@ -0,0 +1,241 @@
+import argparse
+import csv
+import functools
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from DEFINITIONS import ROOT_DIR
+from red_alerts_listener.backend import metrics
+from red_alerts_listener.backend.config_reader import config
+
+GAZETTEER_LOOKUPS = metrics.Counter("red_alerts_gazetteer_lookups_total",
+                                    "City lookups in the offline gazetteer, by the step that resolved them",
+                                    labelnames=("method",))
+
+FIELDS = ("name", "lat", "lon", "aliases")
+ALIAS_SEPARATOR = "|"
+
+_COMBINING_MARKS = re.compile("[֑-ׇ]")  # cantillation and niqqud
+_IN_WORD_MARKS = re.compile("[\"'`׳״‘’“”]")  # geresh, gershayim and quotes
+_SEPARATORS = re.compile(r"[-־‐-―_.,;:/()\[\]]")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+_MATRES_LECTIONIS = re.compile("[וי ]")
+# Alert areas are a city followed by " - <area>" (e.g. "אשקלון - דרום") or "(<area>)"
+_AREA_SUFFIX = re.compile(r"\s+[-–—]\s+|\s*\(")
+
+
+def normalize(name: str) -> str:
+    """
+    The spelling-insensitive form of a Hebrew name: no niqqud, geresh or punctuation, regular instead of final
+    letters, single spaces.
+    """
+    # Separators go first: the maqaf is in the range of the combining marks
+    name = _SEPARATORS.sub(" ", unicodedata.normalize("NFKD", name))
+    name = _COMBINING_MARKS.sub("", _IN_WORD_MARKS.sub("", name))
+    return " ".join(name.split()).translate(_FINAL_LETTERS)
+
+
+def skeleton(normalized: str) -> str:
+    """
+    A normalized name without vav, yod and spaces, so full and defective spellings (e.g. "קריית" and "קרית")
+    share a skeleton.
+    """
+    return _MATRES_LECTIONIS.sub("", normalized)
+
+
+def trigrams(normalized: str) -> set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def strip_area(name: str) -> str:
+    """The city part of an alert area, e.g. "תל אביב" for "תל אביב - מרכז העיר"."""
+    return _AREA_SUFFIX.split(name, 1)[0].strip()
+
+
+@dataclass
+class GazetteerMatch:
+    name: str  # the gazetteer's name of the locality
+    lat: float
+    lon: float
+    method: str  # exact, normalized, skeleton or fuzzy, prefixed with "area_" when matched without the area
+    score: float = 1.0  # the trigram similarity of fuzzy matches
+
+
+class Gazetteer:
+    """
+    A compact in-memory index of localities and their coordinates, for resolving alert cities without a network
+    call.
+
+    A city is looked up by its exact name, then by its normalized form, then by its skeleton (see `normalize` and
+    `skeleton`), then by trigram similarity. Every step is tried on the name as is, and then on the name without
+    its area suffix. A fuzzy match must also beat the next most similar locality by `fuzzy_margin`: a name about
+    as close to two localities is more likely a third one missing from the file, which the online geocoder
+    resolves better than a guess. Coordinates live in two `array('d')`s and the trigram postings in `array('I')`s,
+    rather than in per-locality objects, to keep the index compact.
+
+    Attributes:
+        fuzzy_threshold (float): The minimum Dice similarity of the trigrams of a fuzzy match.
+        fuzzy_margin (float): How much more similar a fuzzy match must be than the next locality.
+    """
+
+    def __init__(self, localities: Iterable[tuple[str, float, float, list[str]]], fuzzy_threshold: float = 0.7,
+                 fuzzy_margin: float = 0.1):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_margin = fuzzy_margin
+        self._names: list[str] = []
+        self._lats = array("d")
+        self._lons = array("d")
+        self._exact: dict[str, int] = {}
+        self._normalized: dict[str, int] = {}
+        self._skeletons: dict[str, int] = {}
+        self._forms: list[str] = []  # the normalized names and aliases, indexed by trigram
+        self._form_localities = array("I")
+        self._form_sizes = array("H")  # the number of trigrams of each form
+        postings: dict[str, list[int]] = {}
+        for name, lat, lon, aliases in localities:
+            locality = len(self._names)
+            self._names.append(name)
+            self._lats.append(lat)
+            self._lons.append(lon)
+            for spelling in (name, *aliases):
+                self._exact.setdefault(spelling, locality)
+                form = normalize(spelling)
+                if form in self._normalized:
+                    continue
+                self._normalized[form] = locality
+                # A skeleton shared by different localities resolves nothing
+                existing = self._skeletons.get(skeleton(form), locality)
+                self._skeletons[skeleton(form)] = locality if existing == locality else -1
+                form_trigrams = trigrams(form)
+                for trigram in form_trigrams:
+                    postings.setdefault(trigram, []).append(len(self._forms))
+                self._forms.append(form)
+                self._form_localities.append(locality)
+                self._form_sizes.append(len(form_trigrams))
+        self._postings = {trigram: array("I", form_ids) for trigram, form_ids in postings.items()}
+
+    @classmethod
+    def from_csv(cls, path: str, fuzzy_threshold: float = 0.7, fuzzy_margin: float = 0.1) -> "Gazetteer":
+        """Loads a gazetteer file with the columns name, lat, lon and aliases (separated by "|")."""
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            localities = [(row["name"], float(row["lat"]), float(row["lon"]),
+                           [alias for alias in (row.get("aliases") or "").split(ALIAS_SEPARATOR) if alias])
+                          for row in csv.DictReader(file)]
+        return cls(localities, fuzzy_threshold, fuzzy_margin)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _match(self, locality: int, method: str, score: float = 1.0) -> GazetteerMatch:
+        return GazetteerMatch(self._names[locality], self._lats[locality], self._lons[locality], method, score)
+
+    def _fuzzy(self, form: str) -> Optional[tuple[int, float]]:
+        query = trigrams(form)
+        shared = Counter(form_id for trigram in query for form_id in self._postings.get(trigram, ()))
+        scores: dict[int, float] = {}  # the best score of each locality, over its name and aliases
+        for form_id, count in shared.items():
+            score = 2 * count / (len(query) + self._form_sizes[form_id])
+            locality = self._form_localities[form_id]
+            if score > scores.get(locality, 0.0):
+                scores[locality] = score
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:2]
+        if not ranked or ranked[0][1] < self.fuzzy_threshold:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.fuzzy_margin:
+            return None
+        return ranked[0]
+
+    def _lookup_exactly(self, name: str, prefix: str = "") -> Optional[GazetteerMatch]:
+        if name in self._exact:
+            return self._match(self._exact[name], prefix + "exact")
+        form = normalize(name)
+        if form in self._normalized:
+            return self._match(self._normalized[form], prefix + "normalized")
+        if self._skeletons.get(skeleton(form), -1) >= 0:
+            return self._match(self._skeletons[skeleton(form)], prefix + "skeleton")
+        return None
+
+    def lookup(self, city: str) -> Optional[GazetteerMatch]:
+        """
+        Resolves an alert city to a locality.
+
+        Args:
+            city: The city as it appears in alerts, e.g. "אשקלון - דרום"
+
+        Returns:
+            The match, or None if no locality is similar enough
+        """
+        city = city.strip()
+        base = strip_area(city)
+        match = self._lookup_exactly(city) or (self._lookup_exactly(base, "area_") if base != city else None)
+        if match is None:
+            fuzzy = self._fuzzy(normalize(city))
+            if base != city:
+                fuzzy_base = self._fuzzy(normalize(base))
+                if fuzzy_base and (not fuzzy or fuzzy_base[1] > fuzzy[1]):
+                    match = self._match(fuzzy_base[0], "area_fuzzy", fuzzy_base[1])
+            if match is None and fuzzy:
+                match = self._match(fuzzy[0], "fuzzy", fuzzy[1])
+        GAZETTEER_LOOKUPS.labels(method=match.method if match else "miss").inc()
+        return match
+
+
+def gazetteer_path() -> str:
+    return os.path.join(ROOT_DIR, config.gazetteer.path)
+
+
+@functools.lru_cache(maxsize=1)
+def default_gazetteer() -> Gazetteer:
+    # Loaded on the first lookup, then shared by the process
+    return Gazetteer.from_csv(gazetteer_path(), config.gazetteer.fuzzy_threshold, config.gazetteer.fuzzy_margin)
+
+
+def lookup_city(city: str) -> Optional[GazetteerMatch]:
+    """Looks a city up in the configured gazetteer; None if it is disabled or has no match."""
+    if not config.gazetteer.enabled:
+        return None
+    return default_gazetteer().lookup(city)
+
+
+def import_locations(path: str, locations: Iterable[dict]) -> int:
+    """
+    Adds geocoded cities (documents of the locations collection) that the gazetteer does not resolve by spelling
+    to the gazetteer file. Returns the number of localities added.
+    """
+    gazetteer = Gazetteer.from_csv(path)
+    new_rows = {}
+    for location in locations:
+        city, lat, lon = location.get("location"), location.get("lat"), location.get("lon")
+        if not city or not lat or not lon or city in new_rows:
+            continue
+        match = gazetteer.lookup(city)
+        # Areas and fuzzy matches are added, so the area or variant gets its own, geocoded coordinates
+        if match is None or match.method not in ("exact", "normalized", "skeleton"):
+            new_rows[city] = {"name": city, "lat": lat, "lon": lon, "aliases": ""}
+    with open(path, "a", encoding="utf-8", newline="") as file:
+        csv.DictWriter(file, FIELDS).writerows(new_rows.values())
+    return len(new_rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Look cities up in the offline gazetteer, or extend it with the "
+                                                 "cities already geocoded into the locations collection")
+    parser.add_argument("cities", nargs="*", help="Cities to look up")
+    parser.add_argument("--import-locations", action="store_true",
+                        help="Append the geocoded cities of the locations collection that are missing")
+    args = parser.parse_args()
+
+    if args.import_locations:
+        from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler
+
+        handler = LocationsCollectionHandler()
+        added = import_locations(gazetteer_path(), handler.adapter.find_all(handler.collection))
+        print(f"Added {added} localities to {gazetteer_path()}")
+    for city_name in args.cities:
+        print(f"{city_name}: {default_gazetteer().lookup(city_name)}")
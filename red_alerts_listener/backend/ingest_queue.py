@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from DEFINITIONS import ROOT_DIR
+from red_alerts_listener.backend import metrics
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.logger import logger
+
+BLOCK_POLICY = "block"
+COALESCE_POLICY = "coalesce"
+SPILL_POLICY = "spill"
+POLICIES = (BLOCK_POLICY, COALESCE_POLICY, SPILL_POLICY)
+
+QUEUE_DEPTH = metrics.Gauge("red_alerts_ingest_queue_depth", "Alerts waiting in memory to be persisted",
+                            labelnames=("queue",))
+QUEUE_SPILLED = metrics.Gauge("red_alerts_ingest_queue_spilled", "Alerts waiting on disk to be persisted",
+                              labelnames=("queue",))
+QUEUE_COALESCED = metrics.Counter("red_alerts_ingest_queue_coalesced_total",
+                                  "Alerts merged into an already queued alert with the same notificationId",
+                                  labelnames=("queue",))
+QUEUE_SPILL_SKIPPED = metrics.Counter("red_alerts_ingest_queue_spill_skipped_total",
+                                      "Unreadable lines of the spill file that were skipped, e.g. cut off by a crash",
+                                      labelnames=("queue",))
+QUEUE_STALL = metrics.Histogram("red_alerts_ingest_queue_stall_seconds",
+                                "Time the producer spent blocked on a full queue", labelnames=("queue",))
+
+
+class RecentIds:
+    """A bounded set of recently seen ids, evicting the oldest first."""
+
+    def __init__(self, maxlen: int = 10000):
+        self.maxlen = maxlen
+        self._ids: OrderedDict[str, None] = OrderedDict()
+
+    def add(self, item_id: str) -> bool:
+        """Adds the id and returns True if it was not seen recently."""
+        if item_id in self._ids:
+            self._ids.move_to_end(item_id)
+            return False
+        self._ids[item_id] = None
+        if len(self._ids) > self.maxlen:
+            self._ids.popitem(last=False)
+        return True
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._ids
+
+
+class IngestQueue:
+    """
+    A bounded queue of raw alerts between polling and persistence, with an explicit backpressure policy.
+
+    When `maxsize` alerts are waiting in memory, new alerts are handled according to the policy:
+
+    * block: the producer waits for room (the poll loop stalls, visible in the stall histogram).
+    * coalesce: an alert whose notificationId is already queued replaces the queued one without taking room;
+      only a full queue of distinct alerts blocks the producer.
+    * spill: overflowing alerts are appended to a JSON-lines file and read back, in order, once the
+      consumer catches up, so the producer never waits.
+
+    Attributes:
+        name (str): The queue name used as the metrics label.
+        maxsize (int): Maximum number of alerts kept in memory.
+        policy (str): One of block, coalesce or spill.
+        spill_path (Optional[str]): The file used by the spill policy.
+    """
+
+    def __init__(self, name: str, maxsize: int, policy: str = BLOCK_POLICY, spill_path: Optional[str] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy}, expected one of {POLICIES}")
+        if policy == SPILL_POLICY and not spill_path:
+            raise ValueError("The spill policy requires a spill_path")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill_path = spill_path
+        self._items: OrderedDict[Any, dict] = OrderedDict()
+        self._sequence = 0
+        self._spilled = 0
+        self._spill_read_offset = 0
+        self._condition = threading.Condition()
+        if policy == SPILL_POLICY and os.path.exists(spill_path):
+            self._recover_spill_file()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._items) + self._spilled
+
+    def _key(self, alert: dict) -> Any:
+        if self.policy == COALESCE_POLICY and "notificationId" in alert:
+            return alert["notificationId"]
+        self._sequence += 1
+        return self._sequence
+
+    def _recover_spill_file(self) -> None:
+        # Alerts spilled by a previous run that did not get persisted are replayed first
+        with open(self.spill_path, "rb+") as file:
+            content = file.read()
+            complete = content.rfind(b"\n") + 1
+            if complete < len(content):
+                # A crash while spilling cut the last line off; drop it, so the next spill starts on a new line
+                logger.error(f"Dropping the incomplete last line of {self.spill_path}: {content[complete:]!r}")
+                QUEUE_SPILL_SKIPPED.labels(queue=self.name).inc()
+                file.truncate(complete)
+        self._spilled = sum(1 for line in content[:complete].split(b"\n") if line.strip())
+        if self._spilled:
+            logger.warning(f"Recovered {self._spilled} spilled alerts from {self.spill_path}")
+        QUEUE_SPILLED.labels(queue=self.name).set(self._spilled)
+
+    def _spill(self, alerts: list[dict]) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as file:
+            for alert in alerts:
+                file.write(json.dumps(alert, ensure_ascii=False) + "\n")
+        self._spilled += len(alerts)
+        QUEUE_SPILLED.labels(queue=self.name).set(self._spilled)
+
+    def _unspill(self) -> None:
+        """Moves spilled alerts back to memory while there is room. Must hold the condition."""
+        # Undecodable bytes are replaced, so a damaged line fails to parse below instead of failing every read
+        with open(self.spill_path, "r", encoding="utf-8", errors="replace") as file:
+            file.seek(self._spill_read_offset)
+            while len(self._items) < self.maxsize:
+                line = file.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                self._spilled -= 1
+                try:
+                    alert = json.loads(line)
+                except ValueError as e:
+                    # Skipped rather than retried, or every later read would fail on the same line
+                    logger.error(f"Skipping an unreadable line of {self.spill_path}: {line!r}. {e}")
+                    QUEUE_SPILL_SKIPPED.labels(queue=self.name).inc()
+                    continue
+                self._items[self._key(alert)] = alert
+            self._spill_read_offset = file.tell()
+        if not self._spilled:
+            os.remove(self.spill_path)
+            self._spill_read_offset = 0
+        QUEUE_SPILLED.labels(queue=self.name).set(self._spilled)
+
+    def put_many(self, alerts: list[dict], timeout: Optional[float] = None) -> bool:
+        """
+        Enqueues alerts according to the backpressure policy.
+
+        Args:
+            alerts (list[dict]): Raw alerts as decoded from the API.
+            timeout (Optional[float]): Maximum time to block for room (block and coalesce policies).
+
+        Returns:
+            bool: False if the timeout expired before every alert was enqueued.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        stalled_since = None
+        with self._condition:
+            try:
+                for index, alert in enumerate(alerts):
+                    if self.policy == COALESCE_POLICY and alert.get("notificationId") in self._items:
+                        self._items[alert["notificationId"]] = alert
+                        QUEUE_COALESCED.labels(queue=self.name).inc()
+                        continue
+                    if self.policy == SPILL_POLICY and (self._spilled or len(self._items) >= self.maxsize):
+                        # Once spilling, keep appending to the file so alerts stay in order
+                        self._spill(alerts[index:])
+                        break
+                    while len(self._items) >= self.maxsize:
+                        stalled_since = stalled_since or time.monotonic()
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            return False
+                        self._condition.wait(remaining)
+                    self._items[self._key(alert)] = alert
+                return True
+            finally:
+                if stalled_since is not None:
+                    QUEUE_STALL.labels(queue=self.name).observe(time.monotonic() - stalled_since)
+                QUEUE_DEPTH.labels(queue=self.name).set(len(self._items))
+                self._condition.notify_all()
+
+    def get_batch(self, max_items: int = 100, timeout: Optional[float] = None) -> list[dict]:
+        """
+        Dequeues up to `max_items` alerts, waiting up to `timeout` seconds for the first one.
+        """
+        with self._condition:
+            if not self._items and self._spilled:
+                self._unspill()
+            if not self._items:
+                self._condition.wait_for(lambda: self._items or self._spilled, timeout)
+                if not self._items and self._spilled:
+                    self._unspill()
+            batch = []
+            while self._items and len(batch) < max_items:
+                batch.append(self._items.popitem(last=False)[1])
+            if self._spilled and len(self._items) < self.maxsize:
+                self._unspill()
+            QUEUE_DEPTH.labels(queue=self.name).set(len(self._items))
+            self._condition.notify_all()
+            return batch
+
+
+def build_ingest_queue_from_config(name: str, suffix: str = "") -> IngestQueue:
+    """
+    Builds an IngestQueue from the ingest_queue section of config.yaml.
+
+    Args:
+        name (str): The queue name used as the metrics label.
+        suffix (str): Appended to the spill file name, so several processes do not share a spill file.
+    """
+    return IngestQueue(name,
+                       maxsize=config.ingest_queue.maxsize,
+                       policy=config.ingest_queue.policy,
+                       spill_path=os.path.join(ROOT_DIR, config.ingest_queue.spill_path + suffix))
@@ -1,107 +1,335 @@
-import requests
 import json
+import threading
 import time
-from typing import Optional
-import aiohttp
-import asyncio
+from typing import TYPE_CHECKING, Optional
 
+from red_alerts_listener.backend import metrics, resilience
 from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.coordination import ListenerCoordinator
 from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler, RawAlertsLocationHandler, \
     ParsedAlertsCollectionHandler
+from red_alerts_listener.backend.fast_parser import AnyRedAlertNotification, parse_valid_notifications
+from red_alerts_listener.backend.ingest_queue import IngestQueue, RecentIds
 from red_alerts_listener.backend.logger import logger
-from red_alerts_listener.backend.schemas import (
-    RedAlertNotification,
-)
+from red_alerts_listener.backend.polling import DeadlineScheduler, DetectionLatencyRecorder, HedgedFetcher
+from red_alerts_listener.backend.subscriptions import AlertFanout
+
+if TYPE_CHECKING:
+    # The HTTP clients are imported when polling starts, which keeps importing this module cheap
+    import requests
 
 
 class RedAlertNotificationsListener:
-    URL = config.urls.tzevaadom_api
 
     def __init__(self,
                  raw_alerts_collection_handler: RawAlertsLocationHandler,
                  parsed_alerts_collection_handler: ParsedAlertsCollectionHandler,
                  locations_collection_handler: LocationsCollectionHandler,
-                 interval_in_sec: float = 0.5):
+                 interval_in_sec: Optional[float] = None,
+                 url: Optional[str] = None,
+                 coordinator: Optional[ListenerCoordinator] = None,
+                 hedge: Optional[bool] = None,
+                 request_timeout_sec: Optional[float] = None,
+                 raw_only: Optional[bool] = None,
+                 fanout: Optional[AlertFanout] = None):
+        interval_in_sec = interval_in_sec or config.polling.interval_in_sec
+        hedge = config.polling.hedge_enabled if hedge is None else hedge
+        self.URL = url or config.urls.tzevaadom_api
         self.raw_alerts_collection_handler = raw_alerts_collection_handler
         self.locations_collection_handler = locations_collection_handler
         self.parsed_alerts_collection_handler = parsed_alerts_collection_handler
         self.interval_in_sec = interval_in_sec
+        self.coordinator = coordinator
+        self.request_timeout_sec = request_timeout_sec or config.polling.request_timeout_sec
+        # With the materializer running, parsed notifications and locations are derived from the raw inserts
+        self.raw_only = config.materializer.enabled if raw_only is None else raw_only
+        # Publishes every newly stored alert to its webhook subscribers
+        self.fanout = fanout
+        # Staggered listeners shift their clock by the phase offset of their coordination slot
+        self.scheduler = DeadlineScheduler(interval_in_sec,
+                                           phase_offset=coordinator.phase_offset if coordinator else None)
+        self.hedged_fetcher = HedgedFetcher(self._request_alerts,
+                                            hedge_percentile=config.polling.hedge_percentile,
+                                            min_hedge_delay_sec=config.polling.hedge_min_delay_sec,
+                                            initial_hedge_delay_sec=interval_in_sec) if hedge else None
+        self.detection_latency = DetectionLatencyRecorder(config.polling.latency_report_interval_sec)
+        # The unix time of the last poll the API answered, so outages can be backfilled once it answers again
+        self.last_successful_poll: Optional[float] = None
+        self._sessions = threading.local()
+
+    @classmethod
+    def from_config(cls, coordinator: Optional[ListenerCoordinator] = None,
+                    unique_indexes: bool = False, db_name: Optional[str] = None,
+                    **kwargs) -> "RedAlertNotificationsListener":
+        """
+        Builds a listener with collection handlers for the collections configured in config.yaml.
+
+        Args:
+            coordinator: Optional coordinator for running as one of several redundant listeners
+            unique_indexes: Whether to create unique indexes on the dedupe keys of each collection
+            db_name: The database to write to (default: mongodb.db_name)
+            **kwargs: Extra arguments for the listener (interval_in_sec, url, hedge, request_timeout_sec, raw_only,
+                fanout)
+        """
+        raw_alerts_collection_handler = RawAlertsLocationHandler(
+            host=config.mongodb.host,
+            port=config.mongodb.port,
+            collection=config.mongodb.raw_notifications_collection,
+            db_name=db_name or config.mongodb.db_name,
+            set_new_index_key="notificationId" if unique_indexes else None
+        )
+        parsed_alerts_collection_handler = ParsedAlertsCollectionHandler(
+            host=config.mongodb.host,
+            port=config.mongodb.port,
+            collection=config.mongodb.parsed_notifications_collection,
+            db_name=db_name or config.mongodb.db_name,
+            set_new_index_key="raw_notification.notificationId" if unique_indexes else None
+        )
+        locations_collection_handler = LocationsCollectionHandler(
+            host=config.mongodb.host,
+            port=config.mongodb.port,
+            collection=config.mongodb.locations_collection,
+            db_name=db_name or config.mongodb.db_name,
+            set_new_index_key="location" if unique_indexes else None
+        )
+        return cls(raw_alerts_collection_handler, parsed_alerts_collection_handler, locations_collection_handler,
+                   coordinator=coordinator, **kwargs)
+
+    def _request_alerts(self) -> "requests.Response":
+        # Hedged requests run on worker threads, each keeping its own pooled session
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            import requests
+
+            session = self._sessions.session = requests.Session()
+        return session.get(self.URL, timeout=self.request_timeout_sec)
 
     def _get_red_alert_notifications(self) -> Optional[list[dict]]:
-        response = requests.get(self.URL)
+        metrics.POLLS.inc()
+        self.scheduler.mark_poll_started()
+        poll_time = time.time()
+        with metrics.STAGE_LATENCY.time(stage="fetch"):
+            # While the API is down the breaker fails polls at once, so they do not each wait for the timeout
+            response = resilience.dependency(resilience.ALERTS_API).call(
+                self.hedged_fetcher if self.hedged_fetcher is not None else self._request_alerts)
         if response.status_code == 200:
-            message = response.text.strip()
-            parsed_message = json.loads(message)
+            self.last_successful_poll = poll_time
+            with metrics.STAGE_LATENCY.time(stage="json_parse"):
+                message = response.text.strip()
+                parsed_message = json.loads(message)
             if parsed_message:
-                logger.info(f"Got an alert!: {parsed_message}")
+                self.detection_latency.observe(parsed_message)
+                metrics.ALERTS_FETCHED.inc(len(parsed_message))
+                logger.info("Got an alert!: %s", parsed_message)
                 return parsed_message
         return None
 
-    def _add_to_collections(self, notification: RedAlertNotification
+    def _add_to_collections(self, notification: AnyRedAlertNotification
                             ) -> tuple[Optional[str], Optional[str], list[str]]:
         """
         Helper functions that populates collections used by the RedAlertNotificationsListener class
         Args:
-            notification: RedAlertNotification valid object
+            notification: RedAlertNotification or FastRedAlertNotification valid object
 
         Returns:
              A tuple containing the new ids (_id) for collections raw_alerts, parsed_alerts and list of location ids
 
         """
-        # Initiate returning objects
-        location_ids = []
+        raw_id, parsed_id = self._persist_notification(notification)
+        location_ids = [] if self.raw_only else self._add_locations(notification.cities)
+        return raw_id, parsed_id, location_ids
 
-        if raw_id := self.raw_alerts_collection_handler.add_new_notification(notification):
+    def _persist_notification(self, notification: AnyRedAlertNotification) -> tuple[Optional[str], Optional[str]]:
+        # Raises CircuitOpenError while MongoDB is unreachable; the inserts are idempotent, so retrying is safe
+        mongodb = resilience.dependency(resilience.MONGODB)
+        if raw_id := mongodb.call(self.raw_alerts_collection_handler.add_new_notification, notification):
             logger.info(f"Added notification to raw_alerts collection. id: {raw_id}")
-        if parsed_id := self.parsed_alerts_collection_handler.add_new_notification_from_raw(notification):
+            self._publish(notification)
+        if self.raw_only:
+            return raw_id, None
+        if parsed_id := mongodb.call(self.parsed_alerts_collection_handler.add_new_notification_from_raw,
+                                     notification):
             logger.info(f"Added notification to parsed_alerts collection. id: {parsed_id}")
-        for city in notification.cities:
+        return raw_id, parsed_id
+
+    def _publish(self, notification: AnyRedAlertNotification) -> None:
+        if self.fanout is None:
+            return
+        # The alert is stored at this point, so a failed fan-out must not fail (and retry) its persistence
+        try:
+            self.fanout.publish(notification)
+        except Exception as e:
+            logger.error(f"Could not publish notification {notification.notificationId} to subscribers. {e}")
+
+    def _add_locations(self, cities: list[str]) -> list[str]:
+        location_ids = []
+        for city in cities:
             if location_id := self.locations_collection_handler.add_new_city_location(city):
                 location_ids.append(location_id)
                 logger.info(f"Added new city location to locations collection. id: {location_id}")
+        return location_ids
 
-        return raw_id, parsed_id, location_ids
+    def _seconds_until_next_poll(self) -> float:
+        return self.scheduler.seconds_until_next()
+
+    def poll_once(self) -> list[AnyRedAlertNotification]:
+        """
+        Runs a single poll iteration: fetch, parse and persist the currently active alerts.
+
+        Returns:
+            The notifications that were fetched during this iteration
+        """
+        alerts = self._get_red_alert_notifications()  # poll for alerts from the frontend
+        if not alerts:
+            return []
+        with metrics.STAGE_LATENCY.time(stage="validation"):
+            raw_notifications = parse_valid_notifications(alerts)
+        for raw_notification in raw_notifications:
+            self._add_to_collections(raw_notification)
+        return raw_notifications
+
+    def enqueue_once(self, ingest_queue: IngestQueue, recent_ids: RecentIds) -> int:
+        """
+        Runs a single poll iteration that only fetches and hands new alerts over to the ingest queue.
+
+        Returns:
+            The number of alerts that were enqueued
+        """
+        alerts = self._get_red_alert_notifications() or []
+        new_alerts = [alert for alert in alerts if recent_ids.add(str(alert.get("notificationId")))]
+        if new_alerts:
+            ingest_queue.put_many(new_alerts)
+        return len(new_alerts)
+
+    def persist_from_queue(self, ingest_queue: IngestQueue, stop_event: threading.Event,
+                           batch_size: Optional[int] = None) -> None:
+        """
+        Persists alerts from the ingest queue until `stop_event` is set and the queue is drained.
+        """
+        batch_size = batch_size or config.ingest_queue.persist_batch_size
+        pending: list[AnyRedAlertNotification] = []
+        while not stop_event.is_set() or len(ingest_queue) or pending:
+            if not pending:
+                try:
+                    alerts = ingest_queue.get_batch(batch_size, timeout=0.5)
+                except Exception as e:
+                    # Not a persistence error: there is no batch to hold or drop
+                    logger.error(f"Encountered an error while reading the ingest queue. {e}")
+                    if stop_event.wait(0.5):
+                        return
+                    continue
+                if not alerts:
+                    continue
+            try:
+                if not pending:
+                    with metrics.STAGE_LATENCY.time(stage="validation"):
+                        # enqueue_once already marked these ids as seen, so a dropped alert is never polled again:
+                        # a malformed alert must not take the valid ones of its batch with it
+                        pending = parse_valid_notifications(alerts)
+                while pending:
+                    self._add_to_collections(pending[0])
+                    pending.pop(0)
+            except Exception as e:
+                hold_sec = resilience.hold_time(e, resilience.MONGODB)
+                if hold_sec is None:
+                    # Retrying would fail the same way; only the failing alert is dropped
+                    failed = pending[0] if pending else alerts
+                    logger.error(f"Encountered an error while persisting alert {failed}. {e}")
+                    pending = pending[1:]
+                elif stop_event.is_set():
+                    logger.error(f"Dropped {len(pending)} alerts while shutting down. {e}")
+                    return
+                else:
+                    # Keep the batch until MongoDB is back instead of dropping it; polling keeps filling the queue
+                    logger.warning(f"Holding {len(pending)} alerts for {hold_sec:.1f}s. {e}")
+                    stop_event.wait(hold_sec)
+
+    def poll_alerts(self, ingest_queue: Optional[IngestQueue] = None):
+        """
+        Polls the alerts API forever.
+
+        Args:
+            ingest_queue: When given, persistence runs on a background thread fed through this queue,
+                so slow database writes do not delay the next poll
+        """
+        import requests
 
-    def poll_alerts(self):
         logger.info(f"Begin polling alerts from {self.URL}")
+        recent_ids = RecentIds()
+        if ingest_queue is not None:
+            threading.Thread(target=self.persist_from_queue, args=(ingest_queue, threading.Event()),
+                             name="persist", daemon=True).start()
         while True:
             try:
-                alerts = self._get_red_alert_notifications()  # poll for alerts from the frontend
-                if alerts:
-                    raw_notifications = [RedAlertNotification.parse_obj(alert) for alert in alerts]
-                    for raw_notification in raw_notifications:
-                        self._add_to_collections(raw_notification)
+                if ingest_queue is None:
+                    self.poll_once()
+                else:
+                    self.enqueue_once(ingest_queue, recent_ids)
             except requests.RequestException as e:
+                metrics.POLL_ERRORS.labels(kind="request").inc()
+                logger.warning(f"Error: {e}")
+            except resilience.CircuitOpenError as e:
+                metrics.POLL_ERRORS.labels(kind="circuit_open").inc()
                 logger.warning(f"Error: {e}")
             except Exception as e:
+                metrics.POLL_ERRORS.labels(kind="other").inc()
                 logger.error(f"Encountered an error during polling alerts. {e}")
-            time.sleep(self.interval_in_sec)
+            time.sleep(self._seconds_until_next_poll())
 
     async def _async_get_red_alert_notifications(self) -> Optional[list[dict]]:
-        async with aiohttp.ClientSession() as session:
+        import asyncio
+
+        import aiohttp
+
+        metrics.POLLS.inc()
+        self.scheduler.mark_poll_started()
+        async def request_alerts() -> tuple[int, str]:
+            async with session.get(self.URL) as response:
+                return response.status, await response.text()
+
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout_sec)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
             try:
-                async with session.get(self.URL) as response:
-                    if response.status == 200:
-                        message = await response.text()
+                poll_time = time.time()
+                with metrics.STAGE_LATENCY.time(stage="fetch"):
+                    status, message = await resilience.dependency(resilience.ALERTS_API).call_async(request_alerts)
+                if status == 200:
+                    self.last_successful_poll = poll_time
+                    with metrics.STAGE_LATENCY.time(stage="json_parse"):
                         parsed_message = json.loads(message.strip())
-                        if parsed_message:
-                            logger.info(f"Got an alert!: {parsed_message}")
-                            return parsed_message
-            except aiohttp.ClientError as e:
+                    if parsed_message:
+                        self.detection_latency.observe(parsed_message)
+                        metrics.ALERTS_FETCHED.inc(len(parsed_message))
+                        logger.info("Got an alert!: %s", parsed_message)
+                        return parsed_message
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.POLL_ERRORS.labels(kind="request").inc()
+                logger.warning(f"Error: {e!r}")
+            except resilience.CircuitOpenError as e:
+                metrics.POLL_ERRORS.labels(kind="circuit_open").inc()
                 logger.warning(f"Error: {e}")
             except Exception as e:
+                metrics.POLL_ERRORS.labels(kind="other").inc()
                 logger.error(f"Encountered an error during fetching alerts. {e}")
         return None
 
     async def async_poll_alerts(self):
+        import asyncio
+
         logger.info(f"Begin polling alerts from {self.URL} asynchronously")
         while True:
             try:
                 alerts = await self._async_get_red_alert_notifications()
                 if alerts:
-                    raw_notifications = [RedAlertNotification.parse_obj(alert) for alert in alerts]
+                    with metrics.STAGE_LATENCY.time(stage="validation"):
+                        raw_notifications = parse_valid_notifications(alerts)
+                    # The database writes and geocoding block, so they run off the event loop
                     for raw_notification in raw_notifications:
-                        self._add_to_collections(raw_notification)
+                        await asyncio.to_thread(self._add_to_collections, raw_notification)
+            except resilience.CircuitOpenError as e:
+                metrics.POLL_ERRORS.labels(kind="circuit_open").inc()
+                logger.warning(f"Error: {e}")
             except Exception as e:
+                metrics.POLL_ERRORS.labels(kind="other").inc()
                 logger.error(f"Encountered an error during polling alerts. {e}")
-            await asyncio.sleep(self.interval_in_sec)
+            await asyncio.sleep(self._seconds_until_next_poll())
@@ -1,9 +1,132 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 import os
 import codecs
+import copy
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
 
 from DEFINITIONS import ROOT_DIR
+from red_alerts_listener.backend.config_reader import config
+
+TEXT_FORMATTER = logging.Formatter(
+    '%(asctime)s - %(filename)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats each record as a single JSON object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token-bucket rate limiting per call site (file and line), so a hot log line cannot flood the handlers.
+
+    The number of dropped records is attached to the next record that passes as `record.suppressed`.
+
+    Attributes:
+        rate_per_sec (float): Records allowed per second for each call site.
+        burst (int): Records allowed in a burst before limiting kicks in.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int = 10):
+        super().__init__()
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self._buckets: dict[tuple[str, int], list[float]] = {}  # call site -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate_per_sec)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that drops records instead of blocking the caller when the queue is full.
+
+    The message and the traceback are formatted before the record is enqueued, into `msg` and `exc_text`, so the
+    record can be pickled to another process and the JSON-lines file keeps the traceback in its own field.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = TEXT_FORMATTER.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Checked first, so a record that would be dropped is not formatted
+        if self.queue.full():
+            self.dropped += 1
+            return
+        super().emit(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# The handlers writing each configured logger's records, which also write the records forwarded by worker processes
+_output_handlers: dict[str, tuple[logging.Handler, ...]] = {}
+
+
+def _build_stream_handler() -> logging.Handler:
+    # Wrap sys.stdout with a UTF-8 writer if needed (for Windows compatibility)
+    stream_handler = logging.StreamHandler(codecs.getwriter('utf-8')(sys.stdout.buffer))
+    stream_handler.setFormatter(TEXT_FORMATTER)
+    return stream_handler
+
 
 def setup_logger(name: str, log_filename: str = 'message.log') -> logging.Logger:
     # Create logger with the given name
@@ -13,25 +136,130 @@ def setup_logger(name: str, log_filename: str = 'message.log') -> logging.Logger
     # Create a file handler for logging to a file
     file_handler = logging.FileHandler(log_filename, encoding='utf-8')  # Ensure UTF-8 encoding
 
-    # Create a stream handler for logging to stdout with UTF-8 encoding
-    # Wrap sys.stdout with a UTF-8 writer if needed (for Windows compatibility)
-    stream_handler = logging.StreamHandler(codecs.getwriter('utf-8')(sys.stdout.buffer))
-
-    # Create a logging format including the filename
-    formatter = logging.Formatter(
-        '%(asctime)s - %(filename)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-
     # Set the same formatter for both handlers
-    file_handler.setFormatter(formatter)
-    stream_handler.setFormatter(formatter)
+    file_handler.setFormatter(TEXT_FORMATTER)
 
     # Add both handlers to the logger
+    stream_handler = _build_stream_handler()
     logger.addHandler(file_handler)
     logger.addHandler(stream_handler)
+    _output_handlers[name] = (file_handler, stream_handler)
 
     return logger
 
-# Initialize the logger
-logger = setup_logger('main_logger', os.path.join(ROOT_DIR, 'messages.log'))
+
+def setup_queue_logger(name: str,
+                       log_filename: str = 'message.log',
+                       max_bytes: int = 10 * 1024 * 1024,
+                       backup_count: int = 5,
+                       rate_limit_per_sec: float = 0,
+                       queue_size: int = 10000) -> logging.Logger:
+    """
+    Sets up a logger whose callers only enqueue records; formatting and I/O happen on a background thread.
+
+    Records are written as JSON lines to a size-rotated file and as text to stdout. When the queue is full,
+    records are dropped rather than blocking the caller.
+
+    Args:
+        name (str): The logger name.
+        log_filename (str): The path of the JSON-lines log file.
+        max_bytes (int): Size at which the log file is rotated.
+        backup_count (int): Number of rotated files to keep.
+        rate_limit_per_sec (float): Per call site rate limit for records below WARNING (0 disables it).
+        queue_size (int): Maximum number of records waiting to be written.
+
+    Returns:
+        logging.Logger: The configured logger.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+
+    file_handler = logging.handlers.RotatingFileHandler(log_filename, maxBytes=max_bytes,
+                                                        backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    if rate_limit_per_sec:
+        queue_handler.addFilter(RateLimitFilter(rate_limit_per_sec))
+    logger.addHandler(queue_handler)
+
+    _output_handlers[name] = (file_handler, _build_stream_handler())
+    listener = logging.handlers.QueueListener(queue_handler.queue, *_output_handlers[name], respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    return logger
+
+
+def setup_forwarding_logger(name: str, log_queue: queue.Queue, rate_limit_per_sec: float = 0) -> logging.Logger:
+    """
+    Sets up a logger that only puts records on `log_queue`, for a worker process whose records are written by its
+    parent (see `_LazyLogger.start_forwarded_listener`). Records are dropped when the queue is full.
+
+    Args:
+        name (str): The logger name.
+        log_queue (queue.Queue): A queue shared with the parent process, e.g. a multiprocessing.Queue.
+        rate_limit_per_sec (float): Per call site rate limit for records below WARNING (0 disables it).
+
+    Returns:
+        logging.Logger: The configured logger.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    if rate_limit_per_sec:
+        queue_handler.addFilter(RateLimitFilter(rate_limit_per_sec))
+    logger.addHandler(queue_handler)
+    return logger
+
+
+def _setup_configured_logger(name: str) -> logging.Logger:
+    log_filename = os.path.join(ROOT_DIR, config.app.log_file)
+    if config.app.log_mode == "queue":
+        return setup_queue_logger(name, log_filename,
+                                  max_bytes=config.app.log_max_bytes,
+                                  backup_count=config.app.log_backup_count,
+                                  rate_limit_per_sec=config.app.log_rate_limit_per_sec)
+    return setup_logger(name, log_filename)
+
+
+class _LazyLogger:
+    """
+    Stands in for the application logger and sets it up on first use, so importing this module
+    neither reads config.yaml nor opens the log file.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._logger: Optional[logging.Logger] = None
+        self._lock = threading.Lock()
+
+    def _get_logger(self) -> logging.Logger:
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    self._logger = _setup_configured_logger(self._name)
+        return self._logger
+
+    def forward_to(self, log_queue: queue.Queue) -> None:
+        """
+        Sends this process's records to `log_queue` instead of writing them. Worker processes forward to their
+        parent, so a single process writes (and rotates) the log file; rotating it from several would lose lines.
+        """
+        rate_limit_per_sec = config.app.log_rate_limit_per_sec if config.app.log_mode == "queue" else 0
+        with self._lock:
+            self._logger = setup_forwarding_logger(self._name, log_queue, rate_limit_per_sec)
+
+    def start_forwarded_listener(self, log_queue: queue.Queue) -> logging.handlers.QueueListener:
+        """Writes the records worker processes forward to `log_queue` through this process's handlers."""
+        self._get_logger()
+        listener = logging.handlers.QueueListener(log_queue, *_output_handlers[self._name],
+                                                  respect_handler_level=True)
+        listener.start()
+        return listener
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get_logger(), name)
+
+
+logger = _LazyLogger('main_logger')
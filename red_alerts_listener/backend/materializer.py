@@ -0,0 +1,219 @@
+import argparse
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from red_alerts_listener.backend import metrics, resilience, utils
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler, \
+    RawAlertsLocationHandler, ParsedAlertsCollectionHandler
+from red_alerts_listener.backend.fast_parser import parse_notification
+from red_alerts_listener.backend.logger import logger
+from red_alerts_listener.backend.mongo_adapter import CHANGE_STREAM_HISTORY_LOST_CODE
+
+MATERIALIZED = metrics.Counter("red_alerts_materialized_total", "Raw notifications materialized")
+MATERIALIZE_ERRORS = metrics.Counter("red_alerts_materialize_errors_total",
+                                     "Raw notifications the materializer failed to derive documents from")
+
+INSERTS_ONLY = [{"$match": {"operationType": "insert"}}]
+
+
+@dataclass
+class MaterializeResult:
+    parsed_id: Optional[str]
+    location_ids: list[str]
+    rollups_applied: int
+
+
+class NotificationMaterializer:
+    """
+    Derives the parsed notifications, locations and daily rollups from the raw notifications collection by
+    following its change stream, so the listener only has to insert raw documents.
+
+    Progress is tracked with the change stream's resume token, stored in the state collection after every
+    `batch_size` changes. After a restart the changes since the last saved token are replayed; every derived
+    write is idempotent (upserts keyed by notificationId and city, and rollup increments applied at most once
+    per notificationId), so replays never duplicate documents or counts.
+
+    Rollups are one document per day (Israel time) and city: `{_id: "<day>|<city>", day, city, count,
+    threats: {<munition>: count}}`.
+
+    Attributes:
+        name (str): The key of this materializer's resume token.
+        state_collection (str): The collection storing resume tokens.
+        rollups_collection (str): The collection storing the daily rollups.
+        batch_size (int): Number of changes processed between resume token saves.
+    """
+
+    def __init__(self,
+                 raw_alerts_collection_handler: Optional[RawAlertsLocationHandler] = None,
+                 parsed_alerts_collection_handler: Optional[ParsedAlertsCollectionHandler] = None,
+                 locations_collection_handler: Optional[LocationsCollectionHandler] = None,
+                 name: Optional[str] = None,
+                 state_collection: Optional[str] = None,
+                 rollups_collection: Optional[str] = None,
+                 batch_size: Optional[int] = None,
+                 max_await_time_ms: Optional[int] = None):
+        self.raw_alerts_collection_handler = raw_alerts_collection_handler or RawAlertsLocationHandler()
+        self.parsed_alerts_collection_handler = parsed_alerts_collection_handler or ParsedAlertsCollectionHandler()
+        self.locations_collection_handler = locations_collection_handler or LocationsCollectionHandler()
+        if self.raw_alerts_collection_handler.time_series:
+            raise ValueError("The materializer needs change streams, which time-series collections do not support")
+        self.adapter = self.raw_alerts_collection_handler.adapter
+        self.name = name or config.materializer.name
+        self.state_collection = state_collection or config.materializer.state_collection
+        self.rollups_collection = rollups_collection or config.materializer.rollups_collection
+        self.batch_size = batch_size or config.materializer.batch_size
+        self.max_await_time_ms = max_await_time_ms or config.materializer.max_await_time_ms
+        self._known_cities: set[str] = set()  # cities already looked up by this process
+
+    def load_resume_token(self) -> Optional[dict[str, Any]]:
+        state = self.adapter.find_one(self.state_collection, {"_id": self.name})
+        return state.get("resume_token") if state else None
+
+    def save_resume_token(self, resume_token: Optional[dict[str, Any]]) -> None:
+        if resume_token is None:
+            return
+        self.adapter.upsert_one(self.state_collection, {"_id": self.name},
+                                {"$set": {"resume_token": resume_token, "updated_at": datetime.now(timezone.utc)}})
+
+    def _apply_rollups(self, notification) -> int:
+        from red_alerts_listener.backend.schemas import KnownThreats
+
+        day = utils.convert_unix_to_datetime(notification.time, "%Y-%m-%d", timezone_str="Asia/Jerusalem")
+        munition = KnownThreats(int(notification.threat)).name
+        applied = 0
+        for city in set(notification.cities):
+            applied += self.adapter.increment_once(self.rollups_collection, {"_id": f"{day}|{city}"},
+                                                   notification.notificationId,
+                                                   {"count": 1, f"threats.{munition}": 1},
+                                                   set_on_insert={"day": day, "city": city})
+        return applied
+
+    def materialize(self, raw_document: dict[str, Any]) -> MaterializeResult:
+        """
+        Derives every document that depends on a single raw notification. Safe to call more than once.
+
+        The parsed notification is written last: `catch_up` treats it as the mark of a materialized notification,
+        so one that failed halfway is derived again instead of being skipped.
+        """
+        notification = parse_notification({key: value for key, value in raw_document.items() if key != "_id"})
+        with metrics.STAGE_LATENCY.time(stage="materialize"):
+            location_ids = []
+            for city in notification.cities:
+                if city in self._known_cities:
+                    continue
+                location_id, has_location = self.locations_collection_handler.store_city_location(city)
+                if location_id:
+                    location_ids.append(location_id)
+                if has_location:
+                    # A city whose geocoding failed is looked up again the next time it appears
+                    self._known_cities.add(city)
+            rollups_applied = self._apply_rollups(notification)
+            parsed_id = self.parsed_alerts_collection_handler.add_new_notification_from_raw(notification)
+        MATERIALIZED.inc()
+        return MaterializeResult(parsed_id, location_ids, rollups_applied)
+
+    def catch_up(self, stop_event: Optional[threading.Event] = None) -> int:
+        """
+        Materializes raw notifications that have no parsed counterpart yet, e.g. those stored before the
+        materializer first ran. Returns the number of notifications materialized.
+        """
+        stop_event = stop_event or threading.Event()
+        raw_documents = self.raw_alerts_collection_handler.get_all_notifications()
+        existing_ids = self.parsed_alerts_collection_handler.find_existing_notification_ids(
+            [document["notificationId"] for document in raw_documents])
+        missing = [document for document in raw_documents if document["notificationId"] not in existing_ids]
+        materialized = 0
+        for document in missing:
+            if not self._materialize_until_stored(document, stop_event):
+                break
+            materialized += 1
+        logger.info(f"Materializer {self.name} caught up on {materialized}/{len(missing)} raw notifications")
+        return materialized
+
+    def _materialize_until_stored(self, raw_document: dict[str, Any], stop_event: threading.Event) -> bool:
+        """
+        Materializes a raw notification, holding it while MongoDB is unavailable. Returns False if `stop_event`
+        was set before it could be stored, so the caller does not move past it.
+        """
+        notification_id = raw_document.get("notificationId")
+        while True:
+            try:
+                resilience.dependency(resilience.MONGODB).call(self.materialize, raw_document)
+                return True
+            except ValueError as e:
+                # A malformed raw document fails the same way every time; it is logged and skipped
+                MATERIALIZE_ERRORS.inc()
+                logger.error(f"Failed to materialize raw notification {notification_id}. {e}")
+                return True
+            except Exception as e:
+                hold_sec = resilience.hold_time(e, resilience.MONGODB)
+                if hold_sec is None:
+                    raise
+                logger.warning(f"Holding raw notification {notification_id} for {hold_sec:.1f}s. {e}")
+                if stop_event.wait(hold_sec):
+                    return False
+
+    def _open_stream(self, stop_event: threading.Event):
+        resume_token = self.load_resume_token()
+        if resume_token is not None:
+            try:
+                return self.adapter.watch(self.raw_alerts_collection_handler.collection, INSERTS_ONLY,
+                                          resume_after=resume_token, max_await_time_ms=self.max_await_time_ms)
+            except Exception as e:
+                if getattr(e, "code", None) != CHANGE_STREAM_HISTORY_LOST_CODE:
+                    raise
+                logger.warning(f"Materializer {self.name} resume token is older than the oplog, rescanning")
+        # Open the stream before scanning, so inserts made during the scan are not missed
+        stream = self.adapter.watch(self.raw_alerts_collection_handler.collection, INSERTS_ONLY,
+                                    max_await_time_ms=self.max_await_time_ms)
+        self.catch_up(stop_event)
+        if not stop_event.is_set():
+            self.save_resume_token(stream.resume_token)
+        return stream
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> None:
+        """
+        Follows the raw notifications change stream until `stop_event` is set.
+
+        The saved resume token never moves past a change that was not materialized: MongoDB errors are held
+        until it is back, and any other error is raised with the token left at the last materialized change.
+        """
+        stop_event = stop_event or threading.Event()
+        logger.info(f"Materializer {self.name} watching {self.raw_alerts_collection_handler.collection}")
+        with self._open_stream(stop_event) as stream:
+            unsaved = 0
+            materialized_token = None  # the resume token of the last materialized change
+            try:
+                while not stop_event.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        if not self._materialize_until_stored(change["fullDocument"], stop_event):
+                            break
+                        materialized_token = change["_id"]
+                        unsaved += 1
+                    if unsaved and (change is None or unsaved >= self.batch_size):
+                        self.save_resume_token(stream.resume_token if change is None else materialized_token)
+                        unsaved = 0
+            finally:
+                if unsaved:
+                    self.save_resume_token(materialized_token)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Materialize parsed notifications, locations and rollups "
+                                                 "from the raw notifications change stream")
+    parser.add_argument("--catch-up-only", action="store_true",
+                        help="Only materialize stored raw notifications that were not materialized yet, then exit")
+    args = parser.parse_args()
+
+    materializer = NotificationMaterializer()
+    if args.catch_up_only:
+        materializer.catch_up()
+    else:
+        try:
+            materializer.run()
+        except KeyboardInterrupt:
+            pass
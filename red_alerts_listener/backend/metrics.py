@@ -0,0 +1,259 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, Optional, Sequence
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MetricsRegistry:
+    """
+    Holds all the metrics of a process and renders them in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> "_Metric":
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default_child(self):
+        if self.labelnames:
+            raise ValueError(f"Metric {self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    def _labelled_children(self) -> list[tuple[dict[str, str], object]]:
+        with self._lock:
+            items = list(self._children.items())
+        return [(dict(zip(self.labelnames, key)), child) for key, child in items]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class _ValueChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _ValueMetric(_Metric):
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default_child().inc(amount)
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"
+                for labels, child in self._labelled_children()]
+
+
+class Counter(_ValueMetric):
+    TYPE = "counter"
+
+
+class Gauge(_ValueMetric):
+    TYPE = "gauge"
+
+    def set(self, value: float) -> None:
+        self._default_child().set(value)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default_child().dec(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """
+    A fixed-bucket histogram. Observing a value costs a bisect and a locked increment.
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[MetricsRegistry] = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default_child().observe(value)
+
+    def time(self, **labels: str):
+        return self.labels(**labels).time() if labels else self._default_child().time()
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, child in self._labelled_children():
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                bucket_labels = {**labels, "le": _format_value(float(upper_bound))}
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+# Listener pipeline metrics
+STAGE_LATENCY = Histogram("red_alerts_stage_duration_seconds",
+                          "Duration of each stage of the alerts ingest pipeline", labelnames=("stage",))
+POLLS = Counter("red_alerts_polls_total", "Number of polls issued to the alerts API")
+POLL_ERRORS = Counter("red_alerts_poll_errors_total", "Number of failed polls", labelnames=("kind",))
+ALERTS_FETCHED = Counter("red_alerts_fetched_total", "Number of alerts returned by the alerts API")
+DOCUMENTS_INSERTED = Counter("red_alerts_documents_inserted_total", "Number of documents inserted",
+                             labelnames=("collection",))
+DUPLICATES_SKIPPED = Counter("red_alerts_duplicates_skipped_total",
+                             "Number of documents skipped because they already exist", labelnames=("collection",))
+INVALID_ALERTS = Counter("red_alerts_invalid_total", "Number of alerts dropped because they failed validation")
+GEOCODE_MISSES = Counter("red_alerts_geocode_misses_total",
+                         "Number of cities whose coordinates could not be resolved, so no location was stored")
+
+# Map API metrics, shared by the Flask and the ASGI app
+API_REQUEST_LATENCY = Histogram("red_alerts_api_request_duration_seconds",
+                                "Duration of requests served by the map API", labelnames=("endpoint",))
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0",
+                         registry: MetricsRegistry = REGISTRY) -> "ThreadingHTTPServer":
+    """
+    Serves the registry on `/metrics` from a daemon thread of the current process.
+
+    Args:
+        port (int): The port to listen on (0 picks a free port).
+        host (str): The interface to bind.
+        registry (MetricsRegistry): The registry to expose.
+
+    Returns:
+        ThreadingHTTPServer: The running server, which can be stopped with `shutdown()`.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -1,6 +1,9 @@
-from pymongo import MongoClient, ASCENDING
+# pymongo is imported by the methods that use it, so importing this module stays cheap
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+CHANGE_STREAM_HISTORY_LOST_CODE = 286
 
 
 class MongoDBAdapter:
@@ -24,6 +27,8 @@ class MongoDBAdapter:
             uri (str): The MongoDB connection string.
             db_name (str): The name of the database to connect to.
         """
+        from pymongo import MongoClient
+
         self.uri = uri
         self.client = MongoClient(self.uri)
         self.db_name = db_name
@@ -44,6 +49,104 @@ class MongoDBAdapter:
         result = collection.insert_one(document)
         return str(result.inserted_id)
 
+    def insert_many(self, collection_name: str, documents: List[Dict[str, Any]]) -> List[str]:
+        """
+        Inserts multiple documents into a MongoDB collection in a single unordered bulk write.
+
+        Args:
+            collection_name (str): The name of the collection.
+            documents (List[Dict[str, Any]]): The documents to insert.
+
+        Returns:
+            List[str]: The inserted documents' IDs.
+        """
+        if not documents:
+            return []
+        from pymongo.errors import BulkWriteError
+
+        collection = self.db[collection_name]
+        try:
+            result = collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Documents rejected by a unique index were already stored; the rest of the batch was written
+            failed = {error["index"] for error in e.details.get("writeErrors", [])
+                      if error.get("code") == DUPLICATE_KEY_ERROR_CODE}
+            if len(failed) != len(e.details.get("writeErrors", [])):
+                raise
+            return [str(document["_id"]) for index, document in enumerate(documents) if index not in failed]
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+    def insert_if_absent(self, collection_name: str, query: Dict[str, Any], document: Dict[str, Any]) -> Optional[str]:
+        """
+        Atomically inserts a document unless one matching the query already exists.
+
+        This is a single round trip (an upsert with `$setOnInsert`), so concurrent writers racing on the
+        same document are harmless, especially when the query field has a unique index.
+
+        Args:
+            collection_name (str): The name of the collection.
+            query (Dict[str, Any]): The query identifying the document.
+            document (Dict[str, Any]): The document to insert.
+
+        Returns:
+            Optional[str]: The inserted document's ID, or None if a matching document already existed.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        collection = self.db[collection_name]
+        try:
+            result = collection.update_one(query, {"$setOnInsert": document}, upsert=True)
+        except DuplicateKeyError:
+            return None
+        return str(result.upserted_id) if result.upserted_id is not None else None
+
+    def upsert_one(self, collection_name: str, query: Dict[str, Any], update: Dict[str, Any]) -> int:
+        """
+        Applies an update operation to a single document, inserting it if it does not exist.
+
+        Args:
+            collection_name (str): The name of the collection.
+            query (Dict[str, Any]): The query to match the document to update.
+            update (Dict[str, Any]): The update operators to apply (e.g. `{"$set": {...}}`).
+
+        Returns:
+            int: The number of documents modified or inserted.
+        """
+        collection = self.db[collection_name]
+        result = collection.update_one(query, update, upsert=True)
+        return result.modified_count + (1 if result.upserted_id is not None else 0)
+
+    def increment_once(self, collection_name: str, query: Dict[str, Any], operation_id: str,
+                       increments: Dict[str, int], set_on_insert: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Applies `$inc` to the document matching the query at most once per `operation_id`.
+
+        Applied operation ids are kept in the document's `applied_ids` array. When the id is already there,
+        the filter does not match and the upsert collides with the existing `_id`, so replaying an operation
+        is a no-op. The query must therefore identify the document by `_id`.
+
+        Args:
+            collection_name (str): The name of the collection.
+            query (Dict[str, Any]): The query identifying the document by `_id`.
+            operation_id (str): A unique id of the operation, e.g. a notificationId.
+            increments (Dict[str, int]): The `$inc` operand.
+            set_on_insert (Optional[Dict[str, Any]]): Fields set only when the document is created.
+
+        Returns:
+            bool: False if the operation had already been applied.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        update = {"$inc": increments, "$push": {"applied_ids": operation_id}}
+        if set_on_insert:
+            update["$setOnInsert"] = set_on_insert
+        collection = self.db[collection_name]
+        try:
+            collection.update_one({**query, "applied_ids": {"$ne": operation_id}}, update, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
     def find_one(self, collection_name: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         Finds a single document in a MongoDB collection that matches the query.
@@ -72,6 +175,55 @@ class MongoDBAdapter:
         collection = self.db[collection_name]
         return list(collection.find(query or {}))
 
+    def find_iter(self, collection_name: str, query: Optional[Dict[str, Any]] = None,
+                  sort: Optional[List[tuple]] = None, limit: int = 0, projection: Optional[Dict[str, Any]] = None,
+                  batch_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Finds documents lazily: the returned cursor fetches them from the server in batches while it is iterated,
+        so arbitrarily large results can be consumed in constant memory.
+
+        Args:
+            collection_name (str): The name of the collection.
+            query (Optional[Dict[str, Any]]): The query to match.
+            sort (Optional[List[tuple]]): (field, direction) pairs, direction being 1 or -1.
+            limit (int): Maximum number of documents (0 for no limit).
+            projection (Optional[Dict[str, Any]]): Fields to include or exclude.
+            batch_size (Optional[int]): Number of documents per server round trip.
+
+        Returns:
+            Iterator[Dict[str, Any]]: A cursor over the matched documents.
+        """
+        collection = self.db[collection_name]
+        cursor = collection.find(query or {}, projection, sort=sort, limit=limit)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    def count_documents(self, collection_name: str, query: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Counts the documents matching the query (all documents if no query is given).
+        """
+        collection = self.db[collection_name]
+        return collection.count_documents(query or {})
+
+    def find_latest(self, collection_name: str, field_name: str,
+                    query: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Finds the document with the highest value of a field.
+
+        Args:
+            collection_name (str): The name of the collection.
+            field_name (str): The field to sort by.
+            query (Optional[Dict[str, Any]]): An optional filter to apply first.
+
+        Returns:
+            Optional[Dict[str, Any]]: The matched document, or None if the collection is empty.
+        """
+        from pymongo import DESCENDING
+
+        collection = self.db[collection_name]
+        return collection.find_one(query or {}, sort=[(field_name, DESCENDING)])
+
     def update_one(self, collection_name: str, query: Dict[str, Any], update: Dict[str, Any]) -> int:
         """
         Updates a single document in a MongoDB collection.
@@ -103,7 +255,117 @@ class MongoDBAdapter:
         result = collection.delete_one(query)
         return result.deleted_count
 
+    def delete_many(self, collection_name: str, query: Dict[str, Any]) -> int:
+        """
+        Deletes all documents matching the query from a MongoDB collection.
+
+        Args:
+            collection_name (str): The name of the collection.
+            query (Dict[str, Any]): The query to match the documents to delete.
+
+        Returns:
+            int: The number of documents deleted.
+        """
+        collection = self.db[collection_name]
+        result = collection.delete_many(query)
+        return result.deleted_count
+
+    def create_index(self, collection_name: str, keys: List[tuple], unique: bool = False,
+                     expire_after_sec: Optional[int] = None) -> str:
+        """
+        Creates an index (a no-op if it already exists).
+
+        Args:
+            collection_name (str): The name of the collection.
+            keys (List[tuple]): (field, direction) pairs, direction being 1 or -1.
+            unique (bool): Whether the index enforces unique values.
+            expire_after_sec (Optional[int]): Makes it a TTL index on a single date field: MongoDB deletes each
+                document this many seconds after the date it holds.
+
+        Returns:
+            str: The index name.
+        """
+        collection = self.db[collection_name]
+        if expire_after_sec is not None:
+            return collection.create_index(keys, unique=unique, expireAfterSeconds=expire_after_sec)
+        return collection.create_index(keys, unique=unique)
+
+    def create_time_series_collection(self, collection_name: str, time_field: str,
+                                      meta_field: Optional[str] = None, granularity: str = "seconds") -> bool:
+        """
+        Creates a time-series collection (MongoDB 5.0+) unless a collection with this name already exists.
+
+        Time-series collections store documents in compressed, time-bucketed columns, but the time field must
+        hold BSON dates, and they support neither upserts nor unique indexes.
+
+        Args:
+            collection_name (str): The name of the collection.
+            time_field (str): The field holding each document's date.
+            meta_field (Optional[str]): The field holding the metadata documents are bucketed by.
+            granularity (str): "seconds", "minutes" or "hours", the typical interval between documents.
+
+        Returns:
+            bool: Whether the collection was created.
+        """
+        if self.collection_exists(collection_name):
+            return False
+        timeseries = {"timeField": time_field, "granularity": granularity}
+        if meta_field:
+            timeseries["metaField"] = meta_field
+        self.db.create_collection(collection_name, timeseries=timeseries)
+        return True
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self.db.list_collection_names(filter={"name": collection_name})
+
+    def is_time_series(self, collection_name: str) -> bool:
+        """
+        Returns whether a collection exists and is a time-series collection.
+        """
+        infos = list(self.db.list_collections(filter={"name": collection_name}))
+        return bool(infos) and infos[0].get("type") == "timeseries"
+
+    def rename_collection(self, collection_name: str, new_name: str) -> None:
+        """
+        Renames a collection. Time-series collections cannot be renamed.
+        """
+        self.db[collection_name].rename(new_name)
+
+    def drop_collection(self, collection_name: str) -> None:
+        self.db.drop_collection(collection_name)
+
+    def collection_stats(self, collection_name: str) -> Dict[str, Any]:
+        """
+        Returns the storage statistics of a collection (the `collStats` command).
+
+        Returns:
+            Dict[str, Any]: Among others `size` (uncompressed data bytes), `storageSize` (bytes on disk) and
+            `totalIndexSize`.
+        """
+        return self.db.command("collStats", collection_name)
+
+    def watch(self, collection_name: str, pipeline: Optional[List[Dict[str, Any]]] = None,
+              resume_after: Optional[Dict[str, Any]] = None, max_await_time_ms: int = 1000):
+        """
+        Opens a change stream on a collection. Change streams require the server to run as a replica set
+        (a single-node replica set is enough).
+
+        Args:
+            collection_name (str): The name of the collection.
+            pipeline (Optional[List[Dict[str, Any]]]): Aggregation stages filtering the change events.
+            resume_after (Optional[Dict[str, Any]]): A resume token to continue after, or None to start now.
+            max_await_time_ms (int): How long `try_next()` waits for a new change on the server.
+
+        Returns:
+            ChangeStream: The stream; `try_next()` returns the next change or None, and `resume_token` is the
+            position to resume from.
+        """
+        collection = self.db[collection_name]
+        return collection.watch(pipeline or [], resume_after=resume_after, max_await_time_ms=max_await_time_ms)
+
     def add_new_index_key(self, collection_name: str, key_name: str) -> str:
+        from pymongo import ASCENDING
+
         collection = self.db[collection_name]
         result = collection.create_index([(key_name, ASCENDING)], unique=True)
         return result
@@ -147,7 +409,8 @@ class MongoDBAdapter:
             ssl: bool = False,
             read_preference: str = "primary",
             app_name: Optional[str] = None,
-            direct_connection: bool = True
+            direct_connection: bool = True,
+            server_selection_timeout_ms: Optional[int] = None
     ) -> str:
         """
         Builds a MongoDB connection URI string from individual parameters.
@@ -160,6 +423,8 @@ class MongoDBAdapter:
             read_preference (str): The read preference for the connection (default: primary).
             app_name (Optional[str]): The application name for MongoDB logging (default: None).
             direct_connection (bool): Whether to directly connect to the MongoDB instance (default: True).
+            server_selection_timeout_ms (Optional[int]): How long an operation waits for a reachable server
+                (default: None, the driver's 30 seconds).
 
         Returns:
             str: The constructed MongoDB URI string.
@@ -176,6 +441,9 @@ class MongoDBAdapter:
         options.append(f"directConnection={'true' if direct_connection else 'false'}")
         options.append(f"ssl={'true' if ssl else 'false'}")
 
+        if server_selection_timeout_ms:
+            options.append(f"serverSelectionTimeoutMS={server_selection_timeout_ms}")
+
         if options:
             uri += "?" + "&".join(options)
 
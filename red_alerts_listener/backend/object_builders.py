@@ -1,23 +1,45 @@
-from red_alerts_listener.backend.schemas import (
-    RedAlertNotification,
-    SavedNotification,
-    ProcessedRedAlert,
-    KnownThreats,
-    MetaData,
-    GeoLocation
-)
-from red_alerts_listener.backend import utils
+import functools
+from typing import TYPE_CHECKING, Any, Optional
+
+from red_alerts_listener.backend import gazetteer, resilience, utils
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.logger import logger
+
+if TYPE_CHECKING:
+    from red_alerts_listener.backend.schemas import GeoLocation, RedAlertNotification, SavedNotification
 
 
 class LocationBuilder:
 
-    @utils.exponential_backoff(max_delay=16)
     @staticmethod
-    def try_fetch_city_coordinates(city: str):
-        return utils.geolocate_place(city)
+    def try_fetch_city_coordinates(city: str) -> Optional[dict[str, float]]:
+        """
+        Geocodes a city online, through the geocoder's retries and circuit breaker.
+
+        Returns:
+            The coordinates, or None if the geocoder has no match, fails, or its breaker is open
+        """
+        try:
+            return resilience.dependency(resilience.GEOCODER).call(utils.geolocate_place, city)
+        except resilience.CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not geocode {city}. {e}")
+            return None
 
     @staticmethod
-    def build_location_for_city(city: str) -> GeoLocation:
+    def build_location_for_city(city: str) -> "GeoLocation":
+        """
+        Resolves a city with the offline gazetteer, falling back to the online geocoder (if enabled) for cities
+        the gazetteer does not know.
+        """
+        from red_alerts_listener.backend.schemas import GeoLocation
+
+        match = gazetteer.lookup_city(city)
+        if match:
+            return GeoLocation(location=city, lon=match.lon, lat=match.lat)
+        if not config.gazetteer.online_fallback:
+            return GeoLocation(location=city, lon=0, lat=0)
         coordinates = LocationBuilder.try_fetch_city_coordinates(city)
         if coordinates:
             return GeoLocation(location=city, lon=coordinates.get("lon", 0), lat=coordinates.get("lat", 0))
@@ -27,12 +49,10 @@ class LocationBuilder:
 class ParsedNotificationBuilder:
 
     @staticmethod
-    def build_from_raw_notification(raw_notification: RedAlertNotification) -> SavedNotification:
-        machine_info = utils.get_machine_info()
-        meta_data = MetaData(recorder=machine_info["Hostname"],
-                             receiver_ip=machine_info["IP Address (IPv4)"],
-                             machine=machine_info["Machine"]
-                             )
+    def build_from_raw_notification(raw_notification: "RedAlertNotification") -> "SavedNotification":
+        from red_alerts_listener.backend.schemas import KnownThreats, MetaData, ProcessedRedAlert, SavedNotification
+
+        meta_data = MetaData(**_cached_meta_data())
 
         processed_notification = ProcessedRedAlert(
             notificationId=raw_notification.notificationId,
@@ -45,6 +65,41 @@ class ParsedNotificationBuilder:
                                                meta_data=meta_data)
         return notification_to_db
 
+    @staticmethod
+    def build_document_from_raw(raw_notification) -> dict[str, Any]:
+        """
+        Builds the Mongo-ready parsed notification document without going through pydantic models.
+
+        The output is identical to `build_from_raw_notification(raw_notification).dict()`.
+
+        Args:
+            raw_notification: A RedAlertNotification or FastRedAlertNotification object
+
+        Returns:
+            dict[str, Any]: The document to insert into the parsed notifications collection
+        """
+        from red_alerts_listener.backend.schemas import KnownThreats
+
+        return {
+            "raw_notification": raw_notification.dict(),
+            "processed_notification": {
+                "notificationId": raw_notification.notificationId,
+                "datetime": utils.convert_unix_to_datetime(raw_notification.time, timezone_str="Asia/Jerusalem"),
+                "munition": KnownThreats(int(raw_notification.threat)).name,
+                "locations": list(raw_notification.cities),
+            },
+            "meta_data": dict(_cached_meta_data()),
+        }
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_meta_data() -> dict[str, str]:
+    # Machine info does not change while the process runs, and resolving it costs a DNS lookup
+    machine_info = utils.get_machine_info()
+    return {"recorder": machine_info["Hostname"],
+            "machine": machine_info["Machine"],
+            "receiver_ip": machine_info["IP Address (IPv4)"]}
+
 
 if __name__ == '__main__':
     ret = LocationBuilder.build_location_for_city("כרמיאל")
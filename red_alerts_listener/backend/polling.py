@@ -0,0 +1,172 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+from red_alerts_listener.backend import metrics
+from red_alerts_listener.backend.ingest_queue import RecentIds
+from red_alerts_listener.backend.logger import logger
+
+SCHEDULE_LAG = metrics.Histogram("red_alerts_poll_schedule_lag_seconds",
+                                 "How late each poll started relative to its scheduled deadline")
+HEDGED_REQUESTS = metrics.Counter("red_alerts_hedged_requests_total",
+                                  "Duplicate requests issued because a poll was slower than the hedge delay")
+HEDGE_WINS = metrics.Counter("red_alerts_hedge_wins_total", "Polls answered first by the hedged request")
+DETECTION_LATENCY = metrics.Histogram("red_alerts_detection_latency_seconds",
+                                      "Time between an alert's issue time and the first poll that saw it",
+                                      buckets=(0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0))
+
+
+def percentile(samples: list[float], point: float) -> Optional[float]:
+    """Nearest-rank percentile of `samples` (point between 0 and 100), or None if there are no samples."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(point / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class LatencyWindow:
+    """A sliding window of the most recent latency samples."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, value: float) -> None:
+        with self._lock:
+            self._samples.append(value)
+
+    def percentile(self, point: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples)
+        return percentile(samples, point)
+
+
+class DeadlineScheduler:
+    """
+    Schedules polls on a fixed wall-clock grid (`k * interval + phase offset`) instead of sleeping a fixed
+    interval after each poll, so request latency does not stretch or drift the polling period.
+
+    A poll that overruns its slot makes the scheduler skip the missed deadlines rather than firing them
+    in a burst.
+    """
+
+    def __init__(self, interval_in_sec: float, phase_offset: Optional[Callable[[float], float]] = None,
+                 clock: Callable[[], float] = time.time):
+        self.interval_in_sec = interval_in_sec
+        self.phase_offset = phase_offset or (lambda interval: 0.0)
+        self.clock = clock
+        self._deadline: Optional[float] = None
+
+    def next_deadline(self, now: Optional[float] = None) -> float:
+        now = self.clock() if now is None else now
+        offset = self.phase_offset(self.interval_in_sec)
+        return math.floor((now - offset) / self.interval_in_sec + 1) * self.interval_in_sec + offset
+
+    def seconds_until_next(self) -> float:
+        now = self.clock()
+        self._deadline = self.next_deadline(now)
+        return max(0.0, self._deadline - now)
+
+    def mark_poll_started(self) -> None:
+        """Records how late the poll started relative to the deadline it was scheduled for."""
+        if self._deadline is not None:
+            SCHEDULE_LAG.observe(max(0.0, self.clock() - self._deadline))
+
+
+class HedgedFetcher:
+    """
+    Issues a request and, if it is still outstanding after the `hedge_percentile` of recent latencies,
+    a duplicate one. The first successful response wins; the slower request is left to finish in the background.
+
+    Attributes:
+        fetch (Callable[[], Any]): The request to issue, called from worker threads.
+        hedge_percentile (float): Latency percentile (0-100) after which a hedged request fires.
+        min_hedge_delay_sec (float): Lower bound of the hedge delay, so fast polls are not hedged on noise.
+        initial_hedge_delay_sec (float): Hedge delay used until enough latency samples are collected.
+    """
+    MIN_SAMPLES = 20
+
+    def __init__(self, fetch: Callable[[], Any], hedge_percentile: float = 90, min_hedge_delay_sec: float = 0.05,
+                 initial_hedge_delay_sec: float = 0.5, max_workers: int = 4):
+        self.fetch = fetch
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay_sec = min_hedge_delay_sec
+        self.initial_hedge_delay_sec = initial_hedge_delay_sec
+        self.latencies = LatencyWindow()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedged-fetch")
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return self.initial_hedge_delay_sec
+        return max(self.min_hedge_delay_sec, self.latencies.percentile(self.hedge_percentile))
+
+    def _timed_fetch(self) -> Any:
+        start = time.perf_counter()
+        result = self.fetch()
+        self.latencies.add(time.perf_counter() - start)
+        return result
+
+    def __call__(self) -> Any:
+        primary = self._executor.submit(self._timed_fetch)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        HEDGED_REQUESTS.inc()
+        hedge = self._executor.submit(self._timed_fetch)
+        pending: set[Future] = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        HEDGE_WINS.inc()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class DetectionLatencyRecorder:
+    """
+    Measures detection latency: the time between an alert's issue time (its `time` field) and the first poll
+    that returned it. The issue time has a resolution of one second, so single samples are coarse but the
+    percentiles over many alerts are meaningful.
+    """
+
+    def __init__(self, report_interval_sec: float = 300, clock: Callable[[], float] = time.time):
+        self.report_interval_sec = report_interval_sec
+        self.clock = clock
+        self.window = LatencyWindow(size=1000)
+        self._seen = RecentIds()
+        self._last_report = clock()
+
+    def observe(self, alerts: list[dict]) -> None:
+        now = self.clock()
+        for alert in alerts:
+            issued_at = alert.get("time")
+            if isinstance(issued_at, (int, float)) and self._seen.add(str(alert.get("notificationId"))):
+                latency = max(0.0, now - issued_at)
+                DETECTION_LATENCY.observe(latency)
+                self.window.add(latency)
+        if self.report_interval_sec and now - self._last_report >= self.report_interval_sec:
+            self.report()
+
+    def percentiles(self) -> dict[str, Optional[float]]:
+        return {f"p{point}": self.window.percentile(point) for point in (50, 90, 99)}
+
+    def report(self) -> None:
+        self._last_report = self.clock()
+        if len(self.window):
+            summary = ", ".join(f"{name}={value:.2f}s" for name, value in self.percentiles().items())
+            logger.info(f"Detection latency over the last {len(self.window)} alerts: {summary}")
@@ -0,0 +1,274 @@
+"""
+Replays recorded raw notifications through the listener pipeline, to load-test it with real traffic.
+
+A local server plays the recorded alerts back as the tzevaadom API would, on a clock running `speed` times faster
+than the recording, and a PipelineSupervisor polls it and persists what it gets into a separate database: the
+fetch, persist, geocode and materialize worker processes, their queues and the webhook fan-out all run as they do
+in production.
+
+Usage:
+    python -m red_alerts_listener.backend.replay [--speed 100] [--start UNIX] [--end UNIX] [--limit N]
+                                                 [--source-db DB] [--target-db DB] [--interval SEC]
+"""
+import argparse
+import bisect
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.database_collection_handlers import RawAlertsLocationHandler
+from red_alerts_listener.backend.logger import logger
+from red_alerts_listener.backend.polling import percentile
+from red_alerts_listener.backend.supervisor import PipelineSupervisor, WorkerOptions
+
+MIN_SPEED, MAX_SPEED = 1.0, 1000.0
+
+# How long the pipeline may take to send its first poll, e.g. while its worker processes start
+FIRST_POLL_TIMEOUT_SEC = 60.0
+
+
+class ReplayServer:
+    """
+    A local HTTP server serving recorded notifications as the tzevaadom notifications API does.
+
+    Playback starts with the first poll, so the time the pipeline takes to start is not part of the replay. A
+    notification becomes active `(time - first time) / speed` seconds later and stays active for `active_for_sec`,
+    like the real API keeps returning an alert for a while after it was issued. With `retime`, each notification's
+    `time` is rewritten to the moment it becomes active, so the listener's detection latency is measured against
+    the replay instead of the recording.
+
+    Attributes:
+        speed (float): How many times faster than recorded the notifications are played.
+        requests_served (int): Number of polls answered.
+    """
+
+    def __init__(self, notifications: list[dict[str, Any]], speed: float = 1.0, active_for_sec: float = 1.0,
+                 retime: bool = True, host: str = "127.0.0.1", port: int = 0):
+        from http.server import ThreadingHTTPServer
+
+        if not MIN_SPEED <= speed <= MAX_SPEED:
+            raise ValueError(f"speed must be between {MIN_SPEED:g} and {MAX_SPEED:g}, got {speed:g}")
+        self.notifications = sorted(notifications, key=lambda notification: notification["time"])
+        self.speed = speed
+        self.active_for_sec = active_for_sec
+        self.retime = retime
+        first_time = self.notifications[0]["time"] if self.notifications else 0
+        self._offsets = [(notification["time"] - first_time) / speed for notification in self.notifications]
+        self._bodies: list[str] = []
+        self._start: Optional[float] = None
+        self._start_lock = threading.Lock()
+        self.requests_served = 0
+        self._server = ThreadingHTTPServer((host, port), self._build_request_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="replay-server", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/notifications"
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the start of playback until the last notification stops being served."""
+        return (self._offsets[-1] if self._offsets else 0.0) + self.active_for_sec
+
+    @property
+    def started_at(self) -> Optional[float]:
+        """The unix time playback started at, or None before the first poll."""
+        return self._start
+
+    @property
+    def finished(self) -> bool:
+        return self._start is not None and time.time() - self._start > self.duration
+
+    def activation_time(self, index: int) -> float:
+        """The unix time `notifications[index]` became active."""
+        return self._start + self._offsets[index]
+
+    def active_count(self) -> int:
+        """The number of notifications that became active so far; they are the first of `notifications`."""
+        return bisect.bisect_right(self._offsets, time.time() - self._start) if self._start is not None else 0
+
+    def start(self) -> "ReplayServer":
+        self._thread.start()
+        return self
+
+    def _start_playback(self) -> None:
+        with self._start_lock:
+            if self._start is not None:
+                return
+            start = time.time()
+            # Serialized once, so serving a poll costs a slice and a join even when thousands of alerts are active
+            self._bodies = [json.dumps(dict(notification, time=int(start + offset)) if self.retime
+                                       else notification, ensure_ascii=False)
+                            for notification, offset in zip(self.notifications, self._offsets)]
+            self._start = start
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def active_body(self) -> str:
+        """The JSON array of the currently active notifications."""
+        self._start_playback()
+        elapsed = time.time() - self._start
+        first = bisect.bisect_right(self._offsets, elapsed - self.active_for_sec)
+        last = bisect.bisect_right(self._offsets, elapsed)
+        self.requests_served += 1
+        return "[" + ",".join(self._bodies[first:last]) + "]"
+
+    def _build_request_handler(self):
+        from http.server import BaseHTTPRequestHandler
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/notifications":
+                    self.send_error(404)
+                    return
+                body = server.active_body().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@dataclass
+class ReplayResult:
+    replayed: int  # notifications served by the replay server
+    stored: int  # notifications in the target collection after the replay
+    polls: int
+    elapsed_sec: float  # from the start of playback until the last notification was seen stored
+    ingest_latency_sec: dict[str, Optional[float]]  # from a notification becoming active until it was seen stored
+
+    @property
+    def alerts_per_sec(self) -> float:
+        return self.stored / self.elapsed_sec if self.elapsed_sec else 0.0
+
+
+def replay(notifications: list[dict[str, Any]], db_name: str, speed: float = 1.0,
+           active_for_sec: Optional[float] = None, interval_in_sec: Optional[float] = None,
+           check_interval_sec: float = 0.05, **supervisor_kwargs) -> ReplayResult:
+    """
+    Plays `notifications` back at `speed` through a PipelineSupervisor writing to `db_name`, until all are stored
+    or the replay is over.
+
+    While the replay runs, the raw notifications collection of `db_name` is checked every `check_interval_sec`
+    for the notifications that became active and were not seen yet, which times each one end to end: from
+    being served until the persist stage stored it.
+
+    Args:
+        notifications: Recorded notifications, in the API's shape
+        db_name: The database the pipeline writes to; never the one the notifications were recorded in
+        speed: How many times faster than recorded to play (1 to 1000)
+        active_for_sec: How long each notification is served (default: three poll intervals)
+        interval_in_sec: The poll interval of the fetch workers (default: polling.interval_in_sec)
+        check_interval_sec: How often the target collection is checked for newly stored notifications
+        **supervisor_kwargs: Extra arguments for the supervisor (fetch_workers, persist_workers, ...)
+    """
+    interval_in_sec = interval_in_sec or config.polling.interval_in_sec
+    active_for_sec = active_for_sec or 3 * interval_in_sec
+    handler = RawAlertsLocationHandler(db_name=db_name)
+    with ReplayServer(notifications, speed=speed, active_for_sec=active_for_sec) as server:
+        # No backfill, which would fetch the real API's history, and metrics on free ports, next to a running
+        # listener's
+        supervisor = PipelineSupervisor(backfill_on_startup=False, backfill_after_outage=False,
+                                        options=WorkerOptions(db_name=db_name, url=server.url,
+                                                              interval_in_sec=interval_in_sec, metrics_port=0),
+                                        **supervisor_kwargs)
+        supervisor_thread = threading.Thread(target=supervisor.run, kwargs={"install_signal_handlers": False},
+                                             name="supervisor", daemon=True)
+        supervisor_thread.start()
+        try:
+            latencies = _watch_stored(server, handler, check_interval_sec,
+                                      settle_sec=supervisor.shutdown_timeout_sec + active_for_sec)
+        finally:
+            supervisor.request_stop()
+            supervisor_thread.join()
+        polls = server.requests_served
+    seen_at = [stored_at for _, stored_at in latencies]
+    return ReplayResult(replayed=len(notifications),
+                        stored=handler.adapter.count_documents(handler.collection),
+                        polls=polls,
+                        elapsed_sec=max(seen_at) - server.started_at if seen_at else 0.0,
+                        ingest_latency_sec={f"p{point}": percentile([latency for latency, _ in latencies], point)
+                                            for point in (50, 90, 99)})
+
+
+def _watch_stored(server: ReplayServer, handler: RawAlertsLocationHandler, check_interval_sec: float,
+                  settle_sec: float) -> list[tuple[float, float]]:
+    """
+    Checks the target collection for active notifications until every one is stored, or `settle_sec` after the
+    replay is over. Returns the ingest latency and the unix time each stored notification was seen at.
+    """
+    first_poll_deadline = time.time() + FIRST_POLL_TIMEOUT_SEC
+    while server.started_at is None:
+        if time.time() > first_poll_deadline:
+            raise RuntimeError(f"The pipeline did not poll the replay server in {FIRST_POLL_TIMEOUT_SEC:.0f}s")
+        time.sleep(check_interval_sec)
+    logger.info(f"Replaying {len(server.notifications)} notifications at {server.speed:g}x, "
+                f"about {server.duration:.1f}s")
+    latencies: list[tuple[float, float]] = []
+    pending: dict[str, int] = {}  # the ids of active notifications not seen stored yet, and their indexes
+    activated = 0
+    while True:
+        active_count = server.active_count()
+        for index in range(activated, active_count):
+            pending.setdefault(server.notifications[index]["notificationId"], index)
+        activated = active_count
+        if pending:
+            stored_ids = handler.find_existing_notification_ids(list(pending))
+            now = time.time()
+            for notification_id in stored_ids:
+                latencies.append((now - server.activation_time(pending.pop(notification_id)), now))
+        if server.finished and (not pending or time.time() - server.started_at > server.duration + settle_sec):
+            if pending:
+                logger.warning(f"{len(pending)} replayed notifications were not stored")
+            return latencies
+        time.sleep(check_interval_sec)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded raw notifications through the listener pipeline")
+    parser.add_argument("--speed", type=float, default=100.0, help="Playback speed, 1 (real time) to 1000")
+    parser.add_argument("--start", type=int, default=None, help="Unix time to replay from (default: the first)")
+    parser.add_argument("--end", type=int, default=None, help="Unix time to replay to (default: the last)")
+    parser.add_argument("--limit", type=int, default=0, help="Maximum number of notifications (0 for all)")
+    parser.add_argument("--source-db", default=None, help="Database to read from (default: mongodb.db_name)")
+    parser.add_argument("--target-db", default=None, help="Database to write to (default: <source db>_replay)")
+    parser.add_argument("--interval", type=float, default=None, help="Poll interval in seconds "
+                                                                     "(default: polling.interval_in_sec)")
+    args = parser.parse_args()
+
+    source_db = args.source_db or config.mongodb.db_name
+    target_db = args.target_db or f"{source_db}_replay"
+    if target_db == source_db:
+        parser.error("The target database must differ from the source database")
+    recorded = list(RawAlertsLocationHandler(db_name=source_db).iter_notifications(args.start, args.end,
+                                                                                     limit=args.limit))
+    if not recorded:
+        raise SystemExit(f"No notifications to replay in {source_db}")
+    result = replay(recorded, target_db, speed=args.speed, interval_in_sec=args.interval)
+    latency = ", ".join(f"{name}={value:.2f}s" for name, value in result.ingest_latency_sec.items()
+                        if value is not None)
+    print(f"Replayed {result.replayed} notifications at {args.speed:g}x into {target_db}: {result.stored} stored "
+          f"in {result.elapsed_sec:.1f}s ({result.alerts_per_sec:.0f} alerts/s) over {result.polls} polls, "
+          f"ingest latency {latency or 'n/a'}")
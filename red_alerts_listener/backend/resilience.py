@@ -0,0 +1,297 @@
+import functools
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from red_alerts_listener.backend import metrics
+from red_alerts_listener.backend.config_reader import DependencyPolicy, config
+from red_alerts_listener.backend.logger import logger
+
+GEOCODER = "geocoder"
+MONGODB = "mongodb"
+ALERTS_API = "alerts_api"
+DEPENDENCIES = (GEOCODER, MONGODB, ALERTS_API)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = metrics.Gauge("red_alerts_circuit_state",
+                              "State of each dependency's circuit breaker: 0 closed, 1 half-open, 2 open",
+                              labelnames=("dependency",))
+CIRCUIT_REJECTIONS = metrics.Counter("red_alerts_circuit_rejections_total",
+                                     "Calls failed fast because the dependency's circuit breaker was open",
+                                     labelnames=("dependency",))
+RETRIES = metrics.Counter("red_alerts_retries_total", "Retried calls to a dependency", labelnames=("dependency",))
+RETRY_BUDGET_EXHAUSTED = metrics.Counter("red_alerts_retry_budget_exhausted_total",
+                                         "Failed calls that were not retried because the retry budget was spent",
+                                         labelnames=("dependency",))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+    def __init__(self, dependency: str, retry_after_sec: float):
+        super().__init__(f"The circuit breaker of {dependency} is open, retry in {retry_after_sec:.1f}s")
+        self.dependency = dependency
+        self.retry_after_sec = retry_after_sec
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a dependency is down.
+
+    The breaker opens after `failure_threshold` consecutive failures. While open, `before_call` raises
+    CircuitOpenError without touching the dependency. After `reset_timeout_sec` it turns half-open and lets a
+    single probe call through: a success closes it, a failure opens it for another `reset_timeout_sec`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_sec: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        CIRCUIT_STATE.labels(dependency=name).set(_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning(f"Circuit breaker of {self.name}: {self._state} -> {state}")
+            self._state = state
+            CIRCUIT_STATE.labels(dependency=self.name).set(_STATE_VALUES[state])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout_sec:
+                self._set_state(HALF_OPEN)
+            return self._state
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError if the call must not reach the dependency."""
+        state = self.state
+        with self._lock:
+            if state == CLOSED or (state == HALF_OPEN and not self._probing):
+                self._probing = state == HALF_OPEN
+                return
+            retry_after = max(0.0, self.reset_timeout_sec - (self._clock() - self._opened_at))
+        CIRCUIT_REJECTIONS.labels(dependency=self.name).inc()
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._set_state(OPEN)
+            self._probing = False
+
+
+class RetryBudget:
+    """
+    Caps retries to a share of the traffic, so a struggling dependency is not hit by a retry storm.
+
+    Every call earns `ratio` tokens and every second earns `min_per_sec`, up to `max_tokens`; a retry spends one.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_sec: float = 1.0, max_tokens: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated_at = clock()
+
+    def _refill(self, earned: float) -> None:
+        now = self._clock()
+        self._tokens = min(self.max_tokens, self._tokens + earned + (now - self._updated_at) * self.min_per_sec)
+        self._updated_at = now
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill(0.0)
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def _transient_errors(name: str) -> tuple[type[BaseException], ...]:
+    # Resolved on the first failure, so the client libraries are not imported with this module
+    if name == GEOCODER:
+        from geopy.exc import GeopyError
+
+        return GeopyError, OSError
+    if name == MONGODB:
+        from pymongo.errors import ConnectionFailure
+
+        return (ConnectionFailure,)  # network errors, timeouts and primary elections
+    if name == ALERTS_API:
+        import aiohttp
+        import requests
+
+        return requests.RequestException, aiohttp.ClientError, TimeoutError
+    return (Exception,)
+
+
+class Dependency:
+    """
+    Calls a remote dependency with retries and a circuit breaker.
+
+    Failures of the dependency (see `is_transient`) are retried with jittered exponential backoff, within
+    `max_attempts`, the call's `deadline_sec` and the retry budget; any other exception is raised immediately
+    and counts as an answer from the dependency. Once the breaker opens, calls raise CircuitOpenError at once,
+    including retries already waiting, so a dead dependency costs its callers nothing until it is probed again.
+
+    `call` sleeps between attempts and suits threads; `call_async` awaits instead, so the event loop keeps running.
+
+    Attributes:
+        name (str): The dependency's name, used in logs and metric labels.
+        policy (DependencyPolicy): Retry and breaker settings.
+    """
+
+    def __init__(self, name: str, policy: Optional[DependencyPolicy] = None,
+                 transient_errors: Optional[tuple[type[BaseException], ...]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.policy = policy or DependencyPolicy()
+        self.breaker = CircuitBreaker(name, self.policy.failure_threshold, self.policy.reset_timeout_sec, clock)
+        self.budget = RetryBudget(self.policy.retry_budget_ratio, self.policy.retry_budget_min_per_sec, clock=clock)
+        self._transient_errors = transient_errors
+        self._clock = clock
+
+    def is_transient(self, error: BaseException) -> bool:
+        if self._transient_errors is None:
+            self._transient_errors = _transient_errors(self.name)
+        return isinstance(error, self._transient_errors)
+
+    def _retry_delay(self, error: BaseException, attempt: int, started: float) -> Optional[float]:
+        """Records a failed attempt; returns the delay before the next attempt, or None to give up."""
+        self.breaker.record_failure()
+        if attempt >= self.policy.max_attempts or self.breaker.state == OPEN:
+            return None
+        if not self.budget.try_spend():
+            RETRY_BUDGET_EXHAUSTED.labels(dependency=self.name).inc()
+            return None
+        # Full jitter: uniform up to the exponential delay, so the retries of concurrent callers spread out
+        delay = random.uniform(0, min(self.policy.max_delay_sec, self.policy.base_delay_sec * 2 ** (attempt - 1)))
+        if self.policy.deadline_sec and self._clock() - started + delay > self.policy.deadline_sec:
+            return None
+        RETRIES.labels(dependency=self.name).inc()
+        logger.warning(f"{self.name} attempt {attempt}/{self.policy.max_attempts} failed: {error!r}, "
+                       f"retrying in {delay:.2f}s")
+        return delay
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        started = self._clock()
+        self.budget.record_call()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_transient(e):
+                    self.breaker.record_success()
+                    raise
+                delay = self._retry_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        import asyncio
+
+        started = self._clock()
+        self.budget.record_call()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_transient(e):
+                    self.breaker.record_success()
+                    raise
+                delay = self._retry_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def __call__(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Decorates a function, or a coroutine function, to be called through this dependency."""
+        import inspect
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.call_async(func, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+
+def hold_time(error: BaseException, name: str) -> Optional[float]:
+    """
+    How long work that failed with `error` should wait before it is retried, if the failure is `name`'s: the time
+    until its open breaker lets a probe through, or a short pause after its retries ran out. None for other errors,
+    which retrying would not fix.
+    """
+    if isinstance(error, CircuitOpenError):
+        return max(error.retry_after_sec, 0.1)
+    if dependency(name).is_transient(error):
+        return max(dependency(name).policy.base_delay_sec, 0.1)
+    return None
+
+
+_dependencies: dict[str, Dependency] = {}
+_dependencies_lock = threading.Lock()
+
+
+def dependency(name: str) -> Dependency:
+    """
+    The process-wide Dependency of `name` (geocoder, mongodb or alerts_api), configured by the resilience section
+    of config.yaml. Every caller of a dependency shares its breaker and retry budget.
+    """
+    existing = _dependencies.get(name)
+    if existing is None:
+        with _dependencies_lock:
+            existing = _dependencies.get(name)
+            if existing is None:
+                existing = _dependencies[name] = Dependency(name, getattr(config.resilience, name))
+    return existing
+
+
+if __name__ == '__main__':
+    for dependency_name in DEPENDENCIES:
+        print(f"{dependency_name}: {getattr(config.resilience, dependency_name)}")
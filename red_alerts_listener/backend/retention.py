@@ -0,0 +1,119 @@
+import argparse
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+from red_alerts_listener.backend import metrics
+from red_alerts_listener.backend.archive import SegmentArchive, merge_sorted, month_bounds, month_of
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.database_collection_handlers import ParsedAlertsCollectionHandler, \
+    RawAlertsLocationHandler
+from red_alerts_listener.backend.logger import logger
+
+ARCHIVED = metrics.Counter("red_alerts_archived_total", "Documents moved from a hot collection to the archive",
+                           labelnames=("collection",))
+
+AnyArchivedHandler = Union[RawAlertsLocationHandler, ParsedAlertsCollectionHandler]
+
+
+@dataclass
+class ArchivedMonth:
+    collection: str
+    month: str
+    archived: int  # documents moved out of the hot collection
+    segment_count: int  # documents in the segment after the move
+
+
+class RetentionJob:
+    """
+    Moves documents older than `max_age_days` from the raw and parsed notifications collections into their
+    archives (see SegmentArchive), keeping the hot collections, and their indexes, small enough to stay in RAM.
+
+    Only whole months are archived: a month is moved once all of it is older than `max_age_days`. Documents that
+    land in an already archived month later (e.g. by a backfill) are merged into its segment on the next run.
+    A month's documents are deleted from the hot collection only after its segment is written, and only by the
+    ids written, so a crash at any point loses nothing and a rerun completes the move.
+
+    Attributes:
+        max_age_days (int): Age after which documents are archived.
+        delete_batch_size (int): Number of ids per delete query.
+    """
+
+    def __init__(self,
+                 raw_alerts_collection_handler: Optional[RawAlertsLocationHandler] = None,
+                 parsed_alerts_collection_handler: Optional[ParsedAlertsCollectionHandler] = None,
+                 max_age_days: Optional[int] = None,
+                 delete_batch_size: Optional[int] = None):
+        self.handlers: list[AnyArchivedHandler] = [
+            raw_alerts_collection_handler or RawAlertsLocationHandler(),
+            parsed_alerts_collection_handler or ParsedAlertsCollectionHandler(),
+        ]
+        for handler in self.handlers:
+            if handler.archive is None:
+                raise ValueError(f"{handler.collection} has no archive, enable the retention section in config.yaml")
+        self.max_age_days = max_age_days or config.retention.max_age_days
+        self.delete_batch_size = delete_batch_size or config.retention.delete_batch_size
+
+    def cutoff(self, now: Optional[float] = None) -> int:
+        """The start of the oldest month that is not entirely older than `max_age_days`; older documents move."""
+        now = time.time() if now is None else now
+        return month_bounds(month_of(int(now - self.max_age_days * 86400)))[0]
+
+    def _oldest_time(self, handler: AnyArchivedHandler, archive: SegmentArchive, before: int) -> Optional[int]:
+        query = {archive.time_field: {"$lt": handler.stored_time(before)}}
+        oldest = next(iter(handler.adapter.find_iter(handler.collection, query, sort=[(archive.time_field, 1)],
+                                                     limit=1)), None)
+        return archive.key(handler.from_stored(oldest))[0] if oldest else None
+
+    def archive_month(self, handler: AnyArchivedHandler, month: str) -> ArchivedMonth:
+        """
+        Merges a month of a hot collection into the month's segment, then deletes the moved documents.
+        """
+        archive = handler.archive
+        start, end = month_bounds(month)
+        query = {archive.time_field: {"$gte": handler.stored_time(start), "$lt": handler.stored_time(end)}}
+        hot = [handler.from_stored(document) for document in handler.adapter.find_iter(
+            handler.collection, query, sort=[(archive.time_field, 1)], projection={"_id": 0})]
+        hot.sort(key=archive.key)
+        # Hot documents first, so they win over a stale archived copy with the same key
+        documents = list(merge_sorted(hot, archive.read_segment(month), key=archive.key))
+        segment = archive.write_segment(month, documents)
+
+        ids = [archive.key(document)[1] for document in hot]
+        deleted = 0
+        for first in range(0, len(ids), self.delete_batch_size):
+            deleted += handler.adapter.delete_many(
+                handler.collection, {archive.id_field: {"$in": ids[first:first + self.delete_batch_size]}})
+        ARCHIVED.labels(collection=handler.collection).inc(deleted)
+        logger.info(f"Archived {deleted} documents of {handler.collection} from {month} "
+                    f"({segment['count']} in the segment)")
+        return ArchivedMonth(handler.collection, month, deleted, segment["count"])
+
+    def run(self, now: Optional[float] = None) -> list[ArchivedMonth]:
+        """
+        Archives every whole month older than `max_age_days`, oldest first.
+        """
+        cutoff = self.cutoff(now)
+        results = []
+        for handler in self.handlers:
+            while (oldest := self._oldest_time(handler, handler.archive, cutoff)) is not None:
+                result = self.archive_month(handler, month_of(oldest))
+                results.append(result)
+                if not result.archived:
+                    logger.error(f"Could not delete the archived documents of {handler.collection} from "
+                                 f"{result.month}, stopping")
+                    break
+        logger.info(f"Retention moved {sum(result.archived for result in results)} documents older than "
+                    f"{datetime.fromtimestamp(cutoff, timezone.utc):%Y-%m-%d} to the archive")
+        return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move alerts older than the retention age from MongoDB "
+                                                 "to compressed monthly segment files (run it e.g. daily from cron)")
+    parser.add_argument("--max-age-days", type=int, help="Overrides retention.max_age_days")
+    args = parser.parse_args()
+
+    for result in RetentionJob(max_age_days=args.max_age_days).run():
+        print(f"{result.collection} {result.month}: archived {result.archived}, segment has {result.segment_count}")
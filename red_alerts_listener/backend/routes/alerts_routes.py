@@ -0,0 +1,54 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from red_alerts_listener.backend.database_collection_handlers import RawAlertsLocationHandler
+from red_alerts_listener.backend.services.alerts_service import DEFAULT_PAGE_SIZE, NDJSON_CONTENT_TYPE, QueryError, \
+    encode_cursor, ndjson_chunks, parse_filters, parse_limit
+
+alerts_blueprint = Blueprint('alerts_blueprint', __name__)
+
+
+def get_alerts_handler() -> RawAlertsLocationHandler:
+    """
+    Returns the raw notifications handler used by the API, stored in `app.config["RAW_ALERTS_HANDLER"]`.
+    It is built from config.yaml on first use unless the application set one.
+    """
+    handler = current_app.config.get("RAW_ALERTS_HANDLER")
+    if handler is None:
+        handler = RawAlertsLocationHandler()
+        handler.ensure_query_indexes()
+        current_app.config["RAW_ALERTS_HANDLER"] = handler
+    return handler
+
+
+def _wants_ndjson() -> bool:
+    return request.args.get("format") == "ndjson" or request.accept_mimetypes.best == NDJSON_CONTENT_TYPE
+
+
+@alerts_blueprint.route('/api/alerts')
+def query_alerts():
+    """
+    Queries stored alerts ordered by time.
+
+    Query parameters: from, to (unix seconds or ISO 8601), city, threat (number or name), limit and cursor.
+
+    By default it returns a page: `{"alerts": [...], "next_cursor": "..."}`; pass `next_cursor` as `cursor`
+    to get the next page. With `format=ndjson` (or `Accept: application/x-ndjson`) every matching alert is
+    streamed as one JSON object per line while the database cursor yields them, so exports of any size use
+    constant memory. `limit` and `cursor` also apply to streams, e.g. to resume an interrupted export.
+    """
+    try:
+        filters = parse_filters(request.args)
+        ndjson = _wants_ndjson()
+        limit = parse_limit(request.args.get("limit"), default=0 if ndjson else DEFAULT_PAGE_SIZE)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    handler = get_alerts_handler()
+    if ndjson:
+        notifications = handler.iter_notifications(**filters, limit=limit)
+        return Response(stream_with_context(ndjson_chunks(notifications)), content_type=NDJSON_CONTENT_TYPE,
+                        headers={"X-Accel-Buffering": "no"})  # tell reverse proxies not to buffer the stream
+
+    page = list(handler.iter_notifications(**filters, limit=limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return jsonify({"alerts": page[:limit], "next_cursor": next_cursor})
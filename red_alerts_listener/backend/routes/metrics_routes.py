@@ -0,0 +1,26 @@
+import time
+
+from flask import Blueprint, Response, g, request
+
+from red_alerts_listener.backend import metrics
+
+metrics_blueprint = Blueprint('metrics_blueprint', __name__)
+
+
+@metrics_blueprint.before_app_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+@metrics_blueprint.after_app_request
+def observe_request_duration(response):
+    start_time = g.pop("request_start_time", None)
+    if start_time is not None:
+        metrics.API_REQUEST_LATENCY.labels(endpoint=request.endpoint or "unknown").observe(
+            time.perf_counter() - start_time)
+    return response
+
+
+@metrics_blueprint.route('/metrics')
+def show_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
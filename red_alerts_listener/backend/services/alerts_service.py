@@ -0,0 +1,91 @@
+"""
+The framework-independent part of the alerts query API, shared by the Flask and the ASGI app.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Optional
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+
+class QueryError(ValueError):
+    """An invalid query parameter, answered with 400."""
+
+
+def parse_time(value: str) -> int:
+    """Parses unix seconds or an ISO 8601 date/datetime (UTC unless it has an offset) into unix seconds."""
+    if value.lstrip("-").isdigit():
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid time {value!r}, expected unix seconds or an ISO 8601 date")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def parse_threat(value: str) -> int:
+    """Parses a threat given by number or by name (e.g. 0 or ROCKET)."""
+    if value.lstrip("-").isdigit():
+        return int(value)
+    from red_alerts_listener.backend.schemas import KnownThreats
+
+    try:
+        return KnownThreats[value.upper()].value
+    except KeyError:
+        raise QueryError(f"Unknown threat {value!r}, expected one of {[threat.name for threat in KnownThreats]}")
+
+
+def encode_cursor(notification: dict[str, Any]) -> str:
+    key = json.dumps([notification["time"], notification["notificationId"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, str]:
+    try:
+        time, notification_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise QueryError("Invalid cursor")
+    return time, notification_id
+
+
+def parse_limit(value: Optional[str], default: int) -> int:
+    if value is None:
+        return default
+    if not value.isdigit() or not 0 < int(value) <= MAX_PAGE_SIZE:
+        raise QueryError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return int(value)
+
+
+def parse_filters(args) -> dict[str, Any]:
+    return {
+        "start": parse_time(args["from"]) if args.get("from") else None,
+        "end": parse_time(args["to"]) if args.get("to") else None,
+        "city": args.get("city") or None,
+        "threat": parse_threat(args["threat"]) if args.get("threat") else None,
+        "after": decode_cursor(args["cursor"]) if args.get("cursor") else None,
+    }
+
+
+def ndjson_chunks(notifications: Iterable[dict[str, Any]]) -> Iterator[str]:
+    notifications = iter(notifications)
+    # The first line goes out on its own so the client gets bytes right away; the rest is sent in chunks
+    for notification in notifications:
+        yield json.dumps(notification, ensure_ascii=False) + "\n"
+        break
+    chunk, size = [], 0
+    for notification in notifications:
+        line = json.dumps(notification, ensure_ascii=False) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
@@ -1,3 +1,11 @@
+def get_map_points():
+    # Replace with your dynamic data from the database
+    return [
+        {'lat': 31.7683, 'lon': 35.2137, 'name': 'Jerusalem'},
+        {'lat': 32.0853, 'lon': 34.7818, 'name': 'Tel Aviv'}
+    ]
+
+
 def get_detected_points():
     # Mock function for retrieving detected points
     points = [
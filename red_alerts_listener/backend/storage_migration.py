@@ -0,0 +1,126 @@
+import argparse
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.database_collection_handlers import RawAlertsLocationHandler, \
+    STANDARD_STORAGE, TIME_SERIES_META_FIELD, TIME_SERIES_STORAGE, from_time_series_document, \
+    to_time_series_document
+from red_alerts_listener.backend.logger import logger
+
+
+@dataclass
+class MigrationResult:
+    collection: str
+    storage: str
+    copied: int
+    backup_collection: Optional[str]
+    seconds: float
+
+
+class RawNotificationsStorageMigration:
+    """
+    Converts the raw notifications collection between the standard and the time-series storage, keeping its name.
+
+    * standard -> timeseries: the collection is renamed to `<collection>_standard_backup`, a time-series collection
+      is created under the original name, and the notifications are copied into it in time order (so buckets
+      fill up sequentially). The backup is kept unless `drop_backup` is set.
+    * timeseries -> standard: time-series collections cannot be renamed, so the notifications are copied into
+      `<collection>_standard_migrating`, the time-series collection is dropped once the copy is complete, and the
+      copy is renamed to the original name.
+
+    Stop the listener while migrating (and set `mongodb.raw_notifications_storage` before restarting it): alerts
+    written meanwhile would go to the wrong layout.
+
+    Attributes:
+        batch_size (int): Number of notifications per bulk insert.
+    """
+
+    def __init__(self, raw_alerts_collection_handler: Optional[RawAlertsLocationHandler] = None,
+                 batch_size: int = 1000):
+        # The handler is only used for its connection and collection name, so its own storage setting is irrelevant
+        handler = raw_alerts_collection_handler or RawAlertsLocationHandler(storage=STANDARD_STORAGE)
+        self.adapter = handler.adapter
+        self.collection = handler.collection
+        self.batch_size = batch_size
+
+    def current_storage(self) -> str:
+        return TIME_SERIES_STORAGE if self.adapter.is_time_series(self.collection) else STANDARD_STORAGE
+
+    def _copy(self, source: str, target: str, convert: Callable[[dict[str, Any]], dict[str, Any]]) -> int:
+        copied, batch = 0, []
+        for document in self.adapter.find_iter(source, sort=[("time", 1)], projection={"_id": 0},
+                                               batch_size=self.batch_size):
+            batch.append(convert(document))
+            if len(batch) >= self.batch_size:
+                copied += len(self.adapter.insert_many(target, batch))
+                batch = []
+        copied += len(self.adapter.insert_many(target, batch))
+        return copied
+
+    def _verify(self, source: str, target: str) -> None:
+        expected, actual = self.adapter.count_documents(source), self.adapter.count_documents(target)
+        if expected != actual:
+            raise RuntimeError(f"Copied {actual} of {expected} notifications from {source} to {target}, "
+                               f"{source} is left as is")
+
+    def to_time_series(self, drop_backup: bool = False) -> MigrationResult:
+        backup = f"{self.collection}_standard_backup"
+        if self.adapter.collection_exists(backup):
+            raise RuntimeError(f"{backup} already exists, drop or rename it first")
+        start = time.perf_counter()
+        self.adapter.rename_collection(self.collection, backup)
+        self.adapter.create_time_series_collection(self.collection, "time", TIME_SERIES_META_FIELD,
+                                                   config.mongodb.timeseries_granularity)
+        copied = self._copy(backup, self.collection, to_time_series_document)
+        self._verify(backup, self.collection)
+        if drop_backup:
+            self.adapter.drop_collection(backup)
+        return MigrationResult(self.collection, TIME_SERIES_STORAGE, copied, None if drop_backup else backup,
+                               time.perf_counter() - start)
+
+    def to_standard(self) -> MigrationResult:
+        staging = f"{self.collection}_standard_migrating"
+        start = time.perf_counter()
+        self.adapter.drop_collection(staging)  # the leftover of an interrupted run, the source is still complete
+        copied = self._copy(self.collection, staging, from_time_series_document)
+        self._verify(self.collection, staging)
+        self.adapter.drop_collection(self.collection)
+        self.adapter.rename_collection(staging, self.collection)
+        return MigrationResult(self.collection, STANDARD_STORAGE, copied, None, time.perf_counter() - start)
+
+    def migrate(self, storage: str, drop_backup: bool = False) -> Optional[MigrationResult]:
+        """
+        Converts the collection to `storage` ("standard" or "timeseries").
+
+        Returns:
+            The result, or None if the collection already uses that storage
+        """
+        if not self.adapter.collection_exists(self.collection):
+            logger.info(f"{self.collection} does not exist yet, the listener creates it with the configured storage")
+            return None
+        if storage == self.current_storage():
+            logger.info(f"{self.collection} already uses the {storage} storage")
+            return None
+        result = self.to_time_series(drop_backup) if storage == TIME_SERIES_STORAGE else self.to_standard()
+        logger.info(f"Migrated {result.copied} notifications of {self.collection} to the {storage} storage "
+                    f"in {result.seconds:.1f}s")
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the raw notifications collection between the standard "
+                                                 "and the time-series storage. Stop the listener first.")
+    parser.add_argument("--to", required=True, choices=(STANDARD_STORAGE, TIME_SERIES_STORAGE))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--drop-backup", action="store_true",
+                        help="Drop the standard collection after converting it to a time-series one")
+    args = parser.parse_args()
+
+    migration_result = RawNotificationsStorageMigration(batch_size=args.batch_size).migrate(args.to, args.drop_backup)
+    if migration_result:
+        print(f"Copied {migration_result.copied} notifications in {migration_result.seconds:.1f}s"
+              + (f", the previous collection is kept as {migration_result.backup_collection}"
+                 if migration_result.backup_collection else ""))
+        print(f"Set mongodb.raw_notifications_storage to {args.to} in config.yaml before restarting the listener")
@@ -0,0 +1,436 @@
+import argparse
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Type
+from urllib.parse import urlparse
+
+from red_alerts_listener.backend import gazetteer, metrics, resilience
+from red_alerts_listener.backend.config_reader import DependencyPolicy, config
+from red_alerts_listener.backend.fast_parser import AnyRedAlertNotification
+from red_alerts_listener.backend.logger import logger
+from red_alerts_listener.backend.mongo_adapter import MongoDBAdapter
+
+if TYPE_CHECKING:
+    from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler
+
+SUBSCRIPTION_MATCHES = metrics.Counter("red_alerts_subscription_matches_total",
+                                       "Alerts matched to a subscription and queued for its webhook")
+WEBHOOK_ALERTS = metrics.Counter("red_alerts_webhook_alerts_total", "Alerts handed to webhook targets, by outcome",
+                                 labelnames=("outcome",))
+WEBHOOK_PENDING = metrics.Gauge("red_alerts_webhook_pending_alerts", "Alerts waiting for webhook delivery")
+WEBHOOK_DELIVERY_LATENCY = metrics.Histogram("red_alerts_webhook_delivery_seconds",
+                                             "Time from queueing an alert until its webhook acknowledged it")
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+Coordinates = tuple[float, float]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+@dataclass
+class Subscription:
+    url: str  # the webhook alerts are POSTed to
+    cities: list[str] = field(default_factory=list)  # a city also matches its areas
+    lat: Optional[float] = None  # the center of a radius subscription
+    lon: Optional[float] = None
+    radius_km: Optional[float] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    @property
+    def is_geo(self) -> bool:
+        return self.radius_km is not None and self.lat is not None and self.lon is not None
+
+    def to_document(self) -> dict[str, Any]:
+        return {"_id": self.id, "url": self.url, "cities": self.cities, "lat": self.lat, "lon": self.lon,
+                "radius_km": self.radius_km}
+
+    @classmethod
+    def from_document(cls, document: dict[str, Any]) -> "Subscription":
+        return cls(url=document["url"], cities=document.get("cities") or [], lat=document.get("lat"),
+                   lon=document.get("lon"), radius_km=document.get("radius_km"), id=str(document["_id"]))
+
+
+class SubscriptionIndex:
+    """
+    Finds the subscriptions an alert matches without scanning them.
+
+    City subscriptions are kept in an inverted index from the normalized city (see `gazetteer.normalize`) to the
+    subscriptions; an alert city is looked up as is and without its area, so a subscription to "אשקלון" matches
+    "אשקלון - דרום". Radius subscriptions are registered in every cell of a `cell_deg` grid their circle
+    overlaps, so an alert city is only checked against the subscriptions of its own cell.
+
+    The index is immutable: AlertFanout builds a new one on refresh and swaps it in.
+    """
+
+    def __init__(self, subscriptions: Iterable[Subscription], cell_deg: float = 0.1):
+        self.subscriptions = list(subscriptions)
+        self.cell_deg = cell_deg
+        by_city: dict[str, set[int]] = {}
+        cells: dict[tuple[int, int], list[int]] = {}
+        for number, subscription in enumerate(self.subscriptions):
+            for city in subscription.cities:
+                by_city.setdefault(gazetteer.normalize(city), set()).add(number)
+            if subscription.is_geo:
+                for cell in self._covered_cells(subscription):
+                    cells.setdefault(cell, []).append(number)
+        self._by_city = {city: tuple(sorted(numbers)) for city, numbers in by_city.items()}
+        self._cells = {cell: tuple(numbers) for cell, numbers in cells.items()}
+
+    def __len__(self) -> int:
+        return len(self.subscriptions)
+
+    @property
+    def has_geo(self) -> bool:
+        return bool(self._cells)
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _covered_cells(self, subscription: Subscription) -> Iterable[tuple[int, int]]:
+        lat_span = subscription.radius_km / KM_PER_DEGREE
+        lon_span = subscription.radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(subscription.lat)), 0.01))
+        min_lat, min_lon = self._cell(subscription.lat - lat_span, subscription.lon - lon_span)
+        max_lat, max_lon = self._cell(subscription.lat + lat_span, subscription.lon + lon_span)
+        return ((lat, lon) for lat in range(min_lat, max_lat + 1) for lon in range(min_lon, max_lon + 1))
+
+    def match(self, cities: Iterable[str],
+              coordinates: Optional[Callable[[str], Optional[Coordinates]]] = None) -> dict[int, list[str]]:
+        """
+        Args:
+            cities: The cities of an alert
+            coordinates: Resolves a city to (lat, lon) for the radius subscriptions, which are skipped without it
+
+        Returns:
+            The matched subscriptions, by their position in `subscriptions`, with the cities each one matched
+        """
+        matches: dict[int, list[str]] = {}
+
+        def add(number: int, city: str) -> None:
+            matched = matches.setdefault(number, [])
+            if not matched or matched[-1] != city:
+                matched.append(city)
+
+        for city in cities:
+            form = gazetteer.normalize(city)
+            base = gazetteer.normalize(gazetteer.strip_area(city))
+            for number in self._by_city.get(form, ()):
+                add(number, city)
+            if base != form:
+                for number in self._by_city.get(base, ()):
+                    add(number, city)
+            if self._cells and coordinates and (point := coordinates(city)):
+                for number in self._cells.get(self._cell(*point), ()):
+                    subscription = self.subscriptions[number]
+                    if haversine_km(subscription.lat, subscription.lon, *point) <= subscription.radius_km:
+                        add(number, city)
+        return matches
+
+
+class SubscriptionRegistry:
+    """The subscriptions, stored in the configured subscriptions collection."""
+    BASE_URI = 'mongodb'
+
+    def __init__(self, adapter: Type[MongoDBAdapter] = MongoDBAdapter,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 collection: Optional[str] = None,
+                 db_name: Optional[str] = None) -> None:
+        self._uri = adapter.build_connection_uri(
+            self.BASE_URI, host or config.mongodb.host, port or config.mongodb.port,
+            server_selection_timeout_ms=config.mongodb.server_selection_timeout_ms)
+        self._db_name = db_name or config.mongodb.db_name
+        self.adapter = adapter(self._uri, self._db_name)
+        self.collection = collection or config.subscriptions.collection
+
+    def add(self, subscription: Subscription) -> str:
+        self.adapter.insert_one(self.collection, subscription.to_document())
+        return subscription.id
+
+    def remove(self, subscription_id: str) -> bool:
+        return self.adapter.delete_one(self.collection, {"_id": subscription_id}) > 0
+
+    def all(self) -> list[Subscription]:
+        return [Subscription.from_document(document) for document in self.adapter.find_all(self.collection)]
+
+
+class WebhookServerError(Exception):
+    """A 5xx answer from a webhook, retried like a connection error."""
+
+
+class WebhookRejectedError(Exception):
+    """A 4xx answer from a webhook, which retrying would not fix."""
+
+
+class WebhookDispatcher:
+    """
+    Delivers alerts to webhook targets in batches, off the ingest path.
+
+    `submit` only appends to the target's queue. A flusher thread sends a target's batch once it holds
+    `batch_max_size` alerts or its oldest alert waited `batch_max_wait_ms`, as `POST {"alerts": [...]}` from a pool
+    of `workers` threads. A target has at most one request in flight, so it receives its alerts in order, and
+    alerts queued meanwhile go out together in its next batch.
+
+    Requests share one session with `pool_maxsize` keep-alive connections per host, and go through a retrying
+    Dependency (the `webhooks` policy of the resilience section) per host, so a dead host fails fast without
+    slowing the other targets. Batches that still fail, alerts beyond `max_pending_per_target` and alerts pending
+    when the dispatcher stops are dropped and counted in `red_alerts_webhook_alerts_total`.
+    """
+
+    def __init__(self,
+                 batch_max_size: Optional[int] = None,
+                 batch_max_wait_ms: Optional[int] = None,
+                 workers: Optional[int] = None,
+                 pool_maxsize: Optional[int] = None,
+                 request_timeout_sec: Optional[float] = None,
+                 max_pending_per_target: Optional[int] = None,
+                 policy: Optional[DependencyPolicy] = None):
+        self.batch_max_size = batch_max_size or config.subscriptions.batch_max_size
+        self.batch_max_wait_sec = (batch_max_wait_ms or config.subscriptions.batch_max_wait_ms) / 1000
+        self.workers = workers or config.subscriptions.delivery_workers
+        self.pool_maxsize = pool_maxsize or config.subscriptions.pool_maxsize
+        self.request_timeout_sec = request_timeout_sec or config.subscriptions.request_timeout_sec
+        self.max_pending_per_target = max_pending_per_target or config.subscriptions.max_pending_per_target
+        self.policy = policy or config.resilience.webhooks
+        self._pending: dict[str, deque[tuple[float, dict]]] = {}
+        self._pending_count = 0
+        self._in_flight: set[str] = set()
+        self._condition = threading.Condition()
+        self._dependencies: dict[str, resilience.Dependency] = {}
+        self._stopping = False
+        self._transient_errors: tuple[type[BaseException], ...] = (WebhookServerError,)
+        self._session = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "WebhookDispatcher":
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        # max_retries=0: retries are the Dependency's, with backoff and a breaker
+        http_adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.pool_maxsize, max_retries=0)
+        self._session.mount("http://", http_adapter)
+        self._session.mount("https://", http_adapter)
+        self._transient_errors = (requests.RequestException, WebhookServerError)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="webhook")
+        self._thread = threading.Thread(target=self._run, name="webhook-flusher", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, url: str, alert: dict[str, Any]) -> None:
+        with self._condition:
+            pending = self._pending.get(url)
+            if pending is None:
+                pending = self._pending[url] = deque()
+            if len(pending) >= self.max_pending_per_target:
+                pending.popleft()
+                self._pending_count -= 1
+                WEBHOOK_ALERTS.labels(outcome="dropped").inc()
+            pending.append((time.perf_counter(), alert))
+            self._pending_count += 1
+            if len(pending) >= self.batch_max_size and url not in self._in_flight:
+                self._condition.notify_all()
+
+    def _dependency(self, url: str) -> resilience.Dependency:
+        host = urlparse(url).netloc
+        dependency = self._dependencies.get(host)
+        if dependency is None:
+            with self._condition:
+                dependency = self._dependencies.setdefault(host, resilience.Dependency(
+                    f"webhook:{host}", self.policy, transient_errors=self._transient_errors))
+        return dependency
+
+    def _take_ready_batches(self, now: float) -> tuple[list[tuple[str, list[tuple[float, dict]]]], float]:
+        """Takes the batches that are due; also returns how long until the next one is (under the lock)."""
+        batches, wait_sec = [], self.batch_max_wait_sec
+        for url, pending in self._pending.items():
+            if url in self._in_flight:
+                continue
+            due_in = pending[0][0] + self.batch_max_wait_sec - now
+            if len(pending) >= self.batch_max_size or due_in <= 0 or self._stopping:
+                batch = [pending.popleft() for _ in range(min(len(pending), self.batch_max_size))]
+                self._pending_count -= len(batch)
+                self._in_flight.add(url)
+                batches.append((url, batch))
+            else:
+                wait_sec = min(wait_sec, due_in)
+        for url, _ in batches:
+            if not self._pending[url]:
+                del self._pending[url]
+        WEBHOOK_PENDING.set(self._pending_count)
+        return batches, wait_sec
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if self._stopping and not self._pending and not self._in_flight:
+                    return
+                batches, wait_sec = self._take_ready_batches(time.perf_counter())
+                if not batches:
+                    self._condition.wait(wait_sec if self._pending else None)
+                    continue
+            for url, batch in batches:
+                self._executor.submit(self._deliver, url, batch)
+
+    def _post(self, url: str, alerts: list[dict]) -> None:
+        response = self._session.post(url, json={"alerts": alerts}, timeout=self.request_timeout_sec)
+        if response.status_code >= 500:
+            raise WebhookServerError(f"{url} answered {response.status_code}")
+        if response.status_code >= 400:
+            raise WebhookRejectedError(f"{url} answered {response.status_code}")
+
+    def _deliver(self, url: str, batch: list[tuple[float, dict]]) -> None:
+        try:
+            self._dependency(url).call(self._post, url, [alert for _, alert in batch])
+            WEBHOOK_ALERTS.labels(outcome="delivered").inc(len(batch))
+            delivered_at = time.perf_counter()
+            for queued_at, _ in batch:
+                WEBHOOK_DELIVERY_LATENCY.observe(delivered_at - queued_at)
+        except resilience.CircuitOpenError:
+            WEBHOOK_ALERTS.labels(outcome="circuit_open").inc(len(batch))
+        except Exception as e:
+            WEBHOOK_ALERTS.labels(outcome="failed").inc(len(batch))
+            logger.warning(f"Could not deliver {len(batch)} alerts to {url}. {e}")
+        finally:
+            with self._condition:
+                self._in_flight.discard(url)
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every queued alert was handed to its webhook; False if the timeout expired first."""
+        with self._condition:
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Sends what is pending without waiting for batches to fill, then releases the workers and connections."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._condition:
+            if self._pending_count:
+                WEBHOOK_ALERTS.labels(outcome="dropped").inc(self._pending_count)
+                logger.warning(f"Dropped {self._pending_count} undelivered webhook alerts")
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._session:
+            self._session.close()
+
+
+class AlertFanout:
+    """
+    Fans new alerts out to their subscribers: matches each alert against a SubscriptionIndex and queues it on the
+    WebhookDispatcher, as `{"subscription_id", "matched_cities", "alert"}` per matched subscription.
+
+    The index is rebuilt from the registry every `refresh_interval_sec` on a background thread, so `publish`
+    never waits on MongoDB, except to resolve the coordinates of cities the gazetteer does not know when there
+    are radius subscriptions (from the locations collection, then cached).
+    """
+
+    def __init__(self,
+                 registry: Optional[SubscriptionRegistry] = None,
+                 dispatcher: Optional[WebhookDispatcher] = None,
+                 locations_collection_handler: Optional["LocationsCollectionHandler"] = None,
+                 refresh_interval_sec: Optional[float] = None,
+                 geo_cell_deg: Optional[float] = None):
+        self.registry = registry or SubscriptionRegistry()
+        self.dispatcher = dispatcher or WebhookDispatcher()
+        self.locations_collection_handler = locations_collection_handler
+        self.refresh_interval_sec = refresh_interval_sec or config.subscriptions.refresh_interval_sec
+        self.geo_cell_deg = geo_cell_deg or config.subscriptions.geo_cell_deg
+        self.index = SubscriptionIndex([], self.geo_cell_deg)
+        self._coordinates: dict[str, Coordinates] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> SubscriptionIndex:
+        self.index = SubscriptionIndex(self.registry.all(), self.geo_cell_deg)
+        return self.index
+
+    def _refresh_periodically(self) -> None:
+        while not self._stop_event.wait(self.refresh_interval_sec):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Could not reload the subscriptions, keeping the previous {len(self.index)}. {e}")
+
+    def start(self) -> "AlertFanout":
+        self.refresh()
+        logger.info(f"Loaded {len(self.index)} subscriptions")
+        self.dispatcher.start()
+        self._thread = threading.Thread(target=self._refresh_periodically, name="subscriptions", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        self.dispatcher.stop(timeout)
+
+    def city_coordinates(self, city: str) -> Optional[Coordinates]:
+        point = self._coordinates.get(city)
+        if point is None:
+            match = gazetteer.lookup_city(city)
+            if match:
+                point = (match.lat, match.lon)
+            elif self.locations_collection_handler:
+                location = self.locations_collection_handler.find_location_by_city(city)
+                if location and location.get("lat") and location.get("lon"):
+                    point = (location["lat"], location["lon"])
+            if point:
+                self._coordinates[city] = point
+        return point
+
+    def publish(self, notification: AnyRedAlertNotification) -> int:
+        """Queues a new alert for its subscribers; returns the number of subscriptions it matched."""
+        index = self.index
+        with metrics.STAGE_LATENCY.time(stage="subscription_match"):
+            matches = index.match(notification.cities, self.city_coordinates if index.has_geo else None)
+        if not matches:
+            return 0
+        alert = notification.dict()
+        for number, cities in matches.items():
+            subscription = index.subscriptions[number]
+            self.dispatcher.submit(subscription.url,
+                                   {"subscription_id": subscription.id, "matched_cities": cities, "alert": alert})
+        SUBSCRIPTION_MATCHES.inc(len(matches))
+        return len(matches)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the webhook subscriptions to alerts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="Subscribe a webhook to cities and/or a radius around a point")
+    add_parser.add_argument("url")
+    add_parser.add_argument("--city", action="append", default=[], help="Repeat for several cities")
+    add_parser.add_argument("--lat", type=float)
+    add_parser.add_argument("--lon", type=float)
+    add_parser.add_argument("--radius-km", type=float)
+    remove_parser = commands.add_parser("remove")
+    remove_parser.add_argument("subscription_id")
+    commands.add_parser("list")
+    args = parser.parse_args()
+
+    subscription_registry = SubscriptionRegistry()
+    if args.command == "add":
+        new_subscription = Subscription(args.url, args.city, args.lat, args.lon, args.radius_km)
+        if not new_subscription.cities and not new_subscription.is_geo:
+            parser.error("give at least one --city, or --lat, --lon and --radius-km")
+        print(subscription_registry.add(new_subscription))
+    elif args.command == "remove":
+        print("removed" if subscription_registry.remove(args.subscription_id) else "no such subscription")
+    else:
+        for existing in subscription_registry.all():
+            print(existing)
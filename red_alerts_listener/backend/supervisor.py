@@ -0,0 +1,393 @@
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from red_alerts_listener.backend import metrics, resilience
+from red_alerts_listener.backend.config_reader import config
+from red_alerts_listener.backend.ingest_queue import IngestQueue, RecentIds, build_ingest_queue_from_config
+from red_alerts_listener.backend.logger import logger
+
+if TYPE_CHECKING:
+    from red_alerts_listener.backend.coordination import ListenerCoordinator
+
+FETCH_STAGE = "fetch"
+PERSIST_STAGE = "persist"
+GEOCODE_STAGE = "geocode"
+MATERIALIZE_STAGE = "materialize"
+STAGES = (FETCH_STAGE, PERSIST_STAGE, GEOCODE_STAGE, MATERIALIZE_STAGE)
+
+# Records of the workers waiting to be written by the supervisor; workers drop records beyond it
+LOG_QUEUE_SIZE = 10000
+
+# A worker that stayed up this long is considered healthy again, and its restart backoff is reset
+STABLE_UPTIME_SEC = 30
+
+WORKER_RESTARTS = metrics.Counter("red_alerts_worker_restarts_total", "Number of pipeline worker restarts",
+                                  labelnames=("stage",))
+WORKERS_ALIVE = metrics.Gauge("red_alerts_workers_alive", "Number of live pipeline workers", labelnames=("stage",))
+
+
+def _run_worker(target: Callable, log_queue, *args) -> None:
+    # The supervisor owns shutdown: workers ignore Ctrl-C, and the SIGTERM that systemd or `docker stop` send to
+    # the whole process group, and stop (draining their input) when their stage's stop event is set
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Records go to the supervisor, which is the only process writing the log file
+    logger.forward_to(log_queue)
+    target(*args)
+
+
+@dataclass(frozen=True)
+class WorkerOptions:
+    """
+    Overrides of config.yaml for the workers of one pipeline, e.g. to replay recorded alerts into a database of
+    their own next to a running listener.
+    """
+    db_name: Optional[str] = None  # the database to write to (default: mongodb.db_name)
+    url: Optional[str] = None  # the alerts API to poll (default: urls.tzevaadom_api)
+    interval_in_sec: Optional[float] = None  # the poll interval (default: polling.interval_in_sec)
+    metrics_port: Optional[int] = None  # worker n serves metrics on metrics_port + n; 0 picks free ports
+
+    @property
+    def queue_suffix(self) -> str:
+        # Keeps the spill files of pipelines writing to different databases apart
+        return f".{self.db_name}" if self.db_name else ""
+
+
+def _init_worker(stage: str, worker_number: int, options: WorkerOptions) -> None:
+    base_port = config.metrics.listener_port if options.metrics_port is None else options.metrics_port
+    server = metrics.start_metrics_server(base_port + worker_number if base_port else 0, config.metrics.host)
+    logger.info(f"Started {stage} worker #{worker_number}, metrics on port {server.server_address[1]}")
+
+
+def _put(output_queue: multiprocessing.Queue, item: Any, downstream_stop_event) -> bool:
+    """Puts an item on a queue, giving up only once the consuming stage has been told to stop."""
+    while True:
+        try:
+            output_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            if downstream_stop_event.is_set():
+                return False
+            logger.warning("Downstream queue is full, waiting for the next stage to catch up")
+
+
+def fetch_worker(worker_number: int, options: WorkerOptions, stop_event, output_queue, downstream_stop_event,
+                 backfill_on_startup: bool = False, backfill_after_outage: bool = False) -> None:
+    """
+    Polls the alerts API and forwards alerts that were not forwarded recently. Optionally backfills the gap since
+    the newest stored alert when it starts, and the time its polls failed once they succeed again.
+    """
+    from red_alerts_listener.backend.coordination import ListenerCoordinator
+
+    _init_worker(FETCH_STAGE, worker_number, options)
+    coordinator = ListenerCoordinator(db_name=options.db_name).start() if config.coordination.enabled else None
+    try:
+        _fetch_until_stopped(worker_number, options, stop_event, output_queue, downstream_stop_event,
+                             backfill_on_startup, backfill_after_outage, coordinator)
+    finally:
+        # Frees this instance's slot for the other listeners right away, instead of once the lease expires
+        if coordinator:
+            coordinator.stop()
+
+
+def _fetch_until_stopped(worker_number: int, options: WorkerOptions, stop_event, output_queue, downstream_stop_event,
+                         backfill_on_startup: bool, backfill_after_outage: bool,
+                         coordinator: Optional["ListenerCoordinator"]) -> None:
+    from red_alerts_listener.backend.backfill import GapBackfill, HistoryBackfiller
+    from red_alerts_listener.backend.listening_handlers import RedAlertNotificationsListener
+
+    listener = RedAlertNotificationsListener.from_config(coordinator=coordinator,
+                                                         unique_indexes=config.coordination.enabled,
+                                                         db_name=options.db_name, url=options.url,
+                                                         interval_in_sec=options.interval_in_sec)
+    gap_backfill = None
+    if backfill_on_startup or backfill_after_outage:
+        gap_backfill = GapBackfill(HistoryBackfiller(listener.raw_alerts_collection_handler,
+                                                     listener.parsed_alerts_collection_handler,
+                                                     listener.locations_collection_handler))
+        # Anchored before the first poll, so freshly polled alerts cannot hide the gap
+        gap_backfill.start(backfill_on_startup and (coordinator is None or coordinator.is_leader))
+    # Polling only feeds a local queue with an explicit backpressure policy; a forwarder thread
+    # absorbs the blocking on the inter-process queue, so the poll cadence survives persistence stalls
+    ingest_queue = build_ingest_queue_from_config(f"fetch-{worker_number}",
+                                                  suffix=f"{options.queue_suffix}.{worker_number}")
+    forwarder_stop_event = threading.Event()
+    forwarder = threading.Thread(target=_forward_batches, name="forwarder", daemon=True,
+                                 args=(ingest_queue, output_queue, forwarder_stop_event, downstream_stop_event))
+    forwarder.start()
+    recent_ids = RecentIds()
+    try:
+        while not stop_event.is_set():
+            try:
+                listener.enqueue_once(ingest_queue, recent_ids)
+            except resilience.CircuitOpenError as e:
+                metrics.POLL_ERRORS.labels(kind="circuit_open").inc()
+                logger.warning(f"Error: {e}")
+            except Exception as e:
+                metrics.POLL_ERRORS.labels(kind="other").inc()
+                logger.error(f"Encountered an error during polling alerts. {e}")
+            if gap_backfill and listener.last_successful_poll:
+                gap_backfill.poll_succeeded(listener.last_successful_poll, backfill=backfill_after_outage and (
+                    coordinator is None or coordinator.is_leader))
+            stop_event.wait(listener._seconds_until_next_poll())
+    finally:
+        forwarder_stop_event.set()
+        forwarder.join(timeout=config.pipeline.shutdown_timeout_sec)
+
+
+def _forward_batches(ingest_queue: IngestQueue, output_queue, stop_event: threading.Event,
+                     downstream_stop_event) -> None:
+    while not stop_event.is_set() or len(ingest_queue):
+        try:
+            alerts = ingest_queue.get_batch(config.ingest_queue.persist_batch_size, timeout=0.5)
+            if alerts and not _put(output_queue, alerts, downstream_stop_event):
+                logger.warning(f"Dropped {len(alerts)} alerts while shutting down")
+        except Exception as e:
+            # The fetch worker keeps polling into the ingest queue, so this thread must outlive any error
+            logger.error(f"Encountered an error while forwarding alerts. {e}")
+            if stop_event.wait(0.5):
+                return
+
+
+def persist_worker(worker_number: int, options: WorkerOptions, stop_event, input_queue, output_queue,
+                   downstream_stop_event) -> None:
+    """Validates alerts, writes the raw and parsed documents and forwards cities of new alerts to geocoding."""
+    from red_alerts_listener.backend.fast_parser import parse_valid_notifications
+    from red_alerts_listener.backend.listening_handlers import RedAlertNotificationsListener
+
+    _init_worker(PERSIST_STAGE, worker_number, options)
+    fanout = None
+    if config.subscriptions.enabled:
+        from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler
+        from red_alerts_listener.backend.subscriptions import AlertFanout, SubscriptionRegistry
+
+        fanout = AlertFanout(registry=SubscriptionRegistry(db_name=options.db_name),
+                             locations_collection_handler=LocationsCollectionHandler(db_name=options.db_name)).start()
+    listener = RedAlertNotificationsListener.from_config(unique_indexes=config.coordination.enabled,
+                                                         db_name=options.db_name, fanout=fanout)
+    pending = []
+    try:
+        while not stop_event.is_set() or not input_queue.empty() or pending:
+            if not pending:
+                try:
+                    alerts = input_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            try:
+                if not pending:
+                    with metrics.STAGE_LATENCY.time(stage="validation"):
+                        pending = parse_valid_notifications(alerts)
+                while pending:
+                    raw_id, _ = listener._persist_notification(pending[0])
+                    if raw_id and pending[0].cities and not listener.raw_only:
+                        _put(output_queue, list(pending[0].cities), downstream_stop_event)
+                    pending.pop(0)
+            except Exception as e:
+                hold_sec = resilience.hold_time(e, resilience.MONGODB)
+                if hold_sec is None:
+                    # Retrying would fail the same way; only the failing alert is dropped, not the rest of the batch
+                    failed = pending[0] if pending else alerts
+                    logger.error(f"Encountered an error while persisting alert {failed}. {e}")
+                    pending = pending[1:]
+                elif stop_event.is_set():
+                    logger.error(f"Dropped {len(pending)} alerts while shutting down. {e}")
+                    return
+                else:
+                    # Hold the batch until MongoDB is back; meanwhile the inter-process queue fills up and the fetch
+                    # workers' ingest queues absorb the backlog
+                    logger.warning(f"Holding {len(pending)} alerts for {hold_sec:.1f}s. {e}")
+                    stop_event.wait(hold_sec)
+    finally:
+        if fanout:
+            fanout.stop(config.pipeline.shutdown_timeout_sec)
+
+
+def geocode_worker(worker_number: int, options: WorkerOptions, stop_event, input_queue) -> None:
+    """Adds a location document for every city that is not stored yet."""
+    from red_alerts_listener.backend.listening_handlers import RedAlertNotificationsListener
+
+    _init_worker(GEOCODE_STAGE, worker_number, options)
+    listener = RedAlertNotificationsListener.from_config(unique_indexes=config.coordination.enabled,
+                                                         db_name=options.db_name)
+    locations_handler = listener.locations_collection_handler
+    known_cities = RecentIds()  # cities with a stored location
+    while not stop_event.is_set() or not input_queue.empty():
+        try:
+            cities = input_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        for city in cities:
+            if city in known_cities:
+                continue
+            try:
+                _, stored = locations_handler.store_city_location(city)
+            except Exception as e:
+                logger.error(f"Encountered an error while adding the location of {city}. {e}")
+                continue
+            # A city whose geocode failed is not recorded, so it is looked up again the next time it appears
+            if stored:
+                known_cities.add(city)
+
+
+def materialize_worker(worker_number: int, options: WorkerOptions, stop_event) -> None:
+    """Derives parsed notifications, locations and rollups from the raw notifications change stream."""
+    from red_alerts_listener.backend.database_collection_handlers import LocationsCollectionHandler, \
+        ParsedAlertsCollectionHandler, RawAlertsLocationHandler
+    from red_alerts_listener.backend.materializer import NotificationMaterializer
+
+    _init_worker(MATERIALIZE_STAGE, worker_number, options)
+    NotificationMaterializer(RawAlertsLocationHandler(db_name=options.db_name),
+                             ParsedAlertsCollectionHandler(db_name=options.db_name),
+                             LocationsCollectionHandler(db_name=options.db_name)).run(stop_event)
+
+
+@dataclass
+class _WorkerSlot:
+    stage: str
+    number: int
+    target: Callable
+    args: tuple
+    process: Optional[multiprocessing.Process] = None
+    started_at: float = 0.0
+    failures: int = 0
+    restart_at: Optional[float] = None
+
+
+class PipelineSupervisor:
+    """
+    Runs the ingest pipeline as supervised worker processes connected by bounded queues.
+
+    fetch -> [alerts queue] -> persist -> [cities queue] -> geocode
+
+    With the materializer enabled, persist only inserts raw documents and a single materialize worker
+    derives the rest from the raw notifications change stream, replacing the geocode stage.
+
+    Crashed workers are restarted with exponential backoff. SIGINT/SIGTERM trigger a graceful shutdown:
+    stages are stopped in pipeline order, and the persist and geocode workers drain their input queue
+    (up to `shutdown_timeout_sec`) before exiting.
+
+    `options` points every worker at another database or alerts API than config.yaml's (see `WorkerOptions`).
+    """
+
+    def __init__(self,
+                 fetch_workers: Optional[int] = None,
+                 persist_workers: Optional[int] = None,
+                 geocode_workers: Optional[int] = None,
+                 queue_size: Optional[int] = None,
+                 restart_backoff_initial_sec: Optional[float] = None,
+                 restart_backoff_max_sec: Optional[float] = None,
+                 shutdown_timeout_sec: Optional[float] = None,
+                 backfill_on_startup: Optional[bool] = None,
+                 backfill_after_outage: Optional[bool] = None,
+                 options: Optional[WorkerOptions] = None):
+        pipeline = config.pipeline
+        fetch_workers = pipeline.fetch_workers if fetch_workers is None else fetch_workers
+        persist_workers = pipeline.persist_workers if persist_workers is None else persist_workers
+        if geocode_workers is None:
+            # The materializer geocodes new cities itself
+            geocode_workers = 0 if config.materializer.enabled else pipeline.geocode_workers
+        queue_size = queue_size or pipeline.queue_size
+        self._context = multiprocessing.get_context("spawn")
+        self.alerts_queue = self._context.Queue(maxsize=queue_size)
+        self.cities_queue = self._context.Queue(maxsize=queue_size)
+        self.log_queue = self._context.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.stop_events = {stage: self._context.Event() for stage in STAGES}
+        self.restart_backoff_initial_sec = restart_backoff_initial_sec or pipeline.restart_backoff_initial_sec
+        self.restart_backoff_max_sec = restart_backoff_max_sec or pipeline.restart_backoff_max_sec
+        self.shutdown_timeout_sec = shutdown_timeout_sec or pipeline.shutdown_timeout_sec
+        self.options = options or WorkerOptions()
+        self._stopping = threading.Event()
+
+        stage_specs = (
+            (FETCH_STAGE, fetch_workers, fetch_worker,
+             (self.options, self.stop_events[FETCH_STAGE], self.alerts_queue, self.stop_events[PERSIST_STAGE])),
+            (PERSIST_STAGE, persist_workers, persist_worker,
+             (self.options, self.stop_events[PERSIST_STAGE], self.alerts_queue, self.cities_queue,
+              self.stop_events[GEOCODE_STAGE])),
+            (GEOCODE_STAGE, geocode_workers, geocode_worker,
+             (self.options, self.stop_events[GEOCODE_STAGE], self.cities_queue)),
+            (MATERIALIZE_STAGE, 1 if config.materializer.enabled else 0, materialize_worker,
+             (self.options, self.stop_events[MATERIALIZE_STAGE])),
+        )
+        self.slots: list[_WorkerSlot] = []
+        for stage, count, target, args in stage_specs:
+            for _ in range(count):
+                self.slots.append(_WorkerSlot(stage, len(self.slots) + 1, target, args))
+        self.backfill_on_startup = config.backfill.on_startup if backfill_on_startup is None else backfill_on_startup
+        self.backfill_after_outage = (config.backfill.after_outage if backfill_after_outage is None
+                                      else backfill_after_outage)
+
+    def _start_worker(self, slot: _WorkerSlot) -> None:
+        args = (slot.number, *slot.args)
+        if slot.stage == FETCH_STAGE:
+            # The first fetch worker backfills the gap since the last stored alert whenever it (re)starts, and the
+            # time its polls failed
+            is_first = slot is self.slots[0]
+            args += (self.backfill_on_startup and is_first, self.backfill_after_outage and is_first)
+        slot.process = self._context.Process(target=_run_worker, args=(slot.target, self.log_queue, *args),
+                                              name=f"{slot.stage}-{slot.number}", daemon=True)
+        slot.process.start()
+        slot.started_at = time.monotonic()
+        slot.restart_at = None
+
+    def _check_worker(self, slot: _WorkerSlot) -> None:
+        now = time.monotonic()
+        if slot.process is not None and slot.process.is_alive():
+            if slot.failures and now - slot.started_at > STABLE_UPTIME_SEC:
+                slot.failures = 0
+            return
+        if slot.restart_at is None:
+            slot.failures += 1
+            delay = min(self.restart_backoff_max_sec, self.restart_backoff_initial_sec * 2 ** (slot.failures - 1))
+            slot.restart_at = now + delay
+            logger.error(f"{slot.process.name} exited with code {slot.process.exitcode}, restarting in {delay:.1f}s")
+        elif now >= slot.restart_at:
+            WORKER_RESTARTS.labels(stage=slot.stage).inc()
+            self._start_worker(slot)
+
+    def _update_alive_gauge(self) -> None:
+        for stage in STAGES:
+            WORKERS_ALIVE.labels(stage=stage).set(
+                sum(1 for slot in self.slots if slot.stage == stage and slot.process and slot.process.is_alive()))
+
+    def request_stop(self, signum: Optional[int] = None, frame: Any = None) -> None:
+        if not self._stopping.is_set():
+            logger.info(f"Stopping the pipeline (signal {signum})")
+        self._stopping.set()
+
+    def _shutdown(self) -> None:
+        deadline = time.monotonic() + self.shutdown_timeout_sec
+        for stage in STAGES:
+            self.stop_events[stage].set()
+            for slot in self.slots:
+                if slot.stage == stage and slot.process is not None:
+                    slot.process.join(timeout=max(0.0, deadline - time.monotonic()))
+                    if slot.process.is_alive():
+                        logger.warning(f"{slot.process.name} did not stop in time, killing it")
+                        slot.process.kill()  # workers ignore SIGTERM
+                        slot.process.join()
+        self._update_alive_gauge()
+        logger.info("Pipeline stopped")
+
+    def run(self, install_signal_handlers: bool = True) -> None:
+        if install_signal_handlers:
+            signal.signal(signal.SIGINT, self.request_stop)
+            signal.signal(signal.SIGTERM, self.request_stop)
+        log_listener = logger.start_forwarded_listener(self.log_queue)
+        for slot in self.slots:
+            self._start_worker(slot)
+        logger.info("Pipeline started: " + ", ".join(
+            f"{stage} x{sum(1 for slot in self.slots if slot.stage == stage)}" for stage in STAGES))
+        try:
+            while not self._stopping.wait(0.5):
+                for slot in self.slots:
+                    self._check_worker(slot)
+                self._update_alive_gauge()
+        finally:
+            self._shutdown()
+            log_listener.stop()
@@ -1,18 +1,15 @@
-import socket
 import os
-import platform
-import getpass
-import uuid
 from datetime import datetime
-import pytz
-from geopy import Photon
 from typing import Optional
-import functools
-import time
-import random
 
 
 def get_machine_info():
+    # Only needed once per process, so these are not imported with the module
+    import getpass
+    import platform
+    import socket
+    import uuid
+
     # Get the machine's hostname
     hostname = socket.gethostname()
 
@@ -62,6 +59,8 @@ def convert_unix_to_datetime(unix_time: int,
     Returns:
         str: The formatted datetime string in the specified timezone.
     """
+    import pytz
+
     # Create a timezone object
     target_timezone = pytz.timezone(timezone_str)
 
@@ -76,52 +75,11 @@ def convert_unix_to_datetime(unix_time: int,
 
 
 def geolocate_place(place_name: str) -> Optional[dict[str, float]]:
+    from geopy import Photon
+
     geolocator = Photon(user_agent="geoapiExercises")  # You can use any app name
     location = geolocator.geocode(place_name)
     if location:
         return {"lat": location.latitude, "lon": location.longitude}
     else:
         return None
-
-
-def exponential_backoff(max_retries=5, base_delay=1, max_delay=32, jitter=True):
-    """
-    Exponential backoff decorator for retrying a caller function.
-
-    Args:
-        max_retries (int): Maximum number of retries.
-        base_delay (int): Initial delay between retries in seconds.
-        max_delay (int): Maximum delay between retries in seconds.
-        jitter (bool): Whether to add randomness to the delay.
-
-    Returns:
-        function: The decorated function with exponential backoff.
-    """
-
-    def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            retries = 0
-            delay = base_delay
-
-            while retries < max_retries:
-                try:
-                    # Attempt the caller function
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    retries += 1
-                    if retries >= max_retries:
-                        raise e  # Max retries exceeded, raise the exception
-                    else:
-                        # Apply exponential backoff and jitter if needed
-                        if jitter:
-                            delay = min(max_delay, delay * 2) + random.uniform(0, 1)
-                        else:
-                            delay = min(max_delay, delay * 2)
-
-                        print(f"Retry {retries}/{max_retries} failed: {e}. Retrying in {delay:.2f} seconds...")
-                        time.sleep(delay)
-
-        return wrapper
-
-    return decorator
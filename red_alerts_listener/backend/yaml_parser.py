@@ -1,6 +1,5 @@
-import yaml
 from typing import Any, Dict, Optional, Type, TypeVar
-from pathlib import Path
+import os
 
 T = TypeVar('T')
 
@@ -13,7 +12,7 @@ class YamlFileReader:
     the logic for reading from a YAML file and parsing its contents.
 
     Attributes:
-        file_path (Path): The path to the YAML file to be read.
+        file_path (str): The path to the YAML file to be read.
     """
 
     def __init__(self, file_path: str):
@@ -23,7 +22,7 @@ class YamlFileReader:
         Args:
             file_path (str): The path to the YAML file to be read.
         """
-        self.file_path = Path(file_path)
+        self.file_path = os.fspath(file_path)
 
     def read(self) -> str:
         """
@@ -39,7 +38,7 @@ class YamlFileReader:
             FileNotFoundError: If the YAML file does not exist.
             IOError: If there is an error reading the file.
         """
-        if not self.file_path.exists():
+        if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"File {self.file_path} not found.")
 
         try:
@@ -81,6 +80,8 @@ class YamlParser:
         Raises:
             yaml.YAMLError: If there is an error while parsing the YAML content.
         """
+        import yaml  # Imported on first use, as it is only needed once config.yaml is read
+
         try:
             return yaml.safe_load(self.raw_yaml)
         except yaml.YAMLError as e: